@@ -1,5 +1,9 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
@@ -18,6 +22,14 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 8  # 8 horas
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer(auto_error=False)
 
+# Tokens ya verificados: sha256 del token -> (TokenData, expiración en epoch).
+# Cada vista hace decenas de llamadas con el mismo token; sólo la primera paga
+# la verificación HMAC y la validación del modelo. Una entrada nunca vive más
+# allá del `exp` del token y el LRU se limita a AUTH_CACHE_TOKENS entradas.
+_tokens_verificados: "OrderedDict[bytes, Tuple[TokenData, float]]" = OrderedDict()
+_tokens_lock = threading.Lock()
+_tokens_estadisticas = {"aciertos": 0, "verificaciones": 0, "rechazos": 0}
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica una contraseña contra su hash"""
@@ -44,8 +56,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def decode_token(token: str) -> Optional[TokenData]:
-    """Decodifica y valida un token JWT"""
+def _verificar_token(token: str) -> Optional[Tuple[TokenData, float]]:
+    """Verifica firma y expiración del token y arma el TokenData"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
@@ -56,12 +68,54 @@ def decode_token(token: str) -> Optional[TokenData]:
         
         if user_id is None:
             return None
+        
+        # Sin `exp` el token no vence: revalidarlo cada AUTH_CACHE_TTL segundos
+        expira = payload.get("exp") or time.time() + settings.auth_cache_ttl
             
-        return TokenData(user_id=user_id, email=email, es_admin=es_admin, rol=rol, tiene_puesto=tiene_puesto)
+        return TokenData(user_id=user_id, email=email, es_admin=es_admin, rol=rol, tiene_puesto=tiene_puesto), float(expira)
     except JWTError:
         return None
 
 
+def decode_token(token: str) -> Optional[TokenData]:
+    """Decodifica y valida un token JWT (con caché de tokens ya verificados)"""
+    if settings.auth_cache_tokens <= 0:
+        verificado = _verificar_token(token)
+        return verificado[0] if verificado else None
+    
+    clave = hashlib.sha256(token.encode()).digest()
+    ahora = time.time()
+    
+    with _tokens_lock:
+        entrada = _tokens_verificados.get(clave)
+        if entrada is not None:
+            if entrada[1] > ahora:
+                _tokens_verificados.move_to_end(clave)
+                _tokens_estadisticas["aciertos"] += 1
+                return entrada[0]
+            del _tokens_verificados[clave]
+    
+    verificado = _verificar_token(token)
+    
+    with _tokens_lock:
+        _tokens_estadisticas["verificaciones"] += 1
+        if verificado is None:
+            _tokens_estadisticas["rechazos"] += 1
+            return None
+        _tokens_verificados[clave] = verificado
+        _tokens_verificados.move_to_end(clave)
+        while len(_tokens_verificados) > settings.auth_cache_tokens:
+            _tokens_verificados.popitem(last=False)
+    
+    return verificado[0]
+
+
+def estadisticas_tokens() -> dict:
+    """Aciertos de la caché de tokens verificados"""
+    with _tokens_lock:
+        return {**_tokens_estadisticas, "en_cache": len(_tokens_verificados), "max": settings.auth_cache_tokens}
+
+
 async def get_current_user(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
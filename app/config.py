@@ -11,12 +11,20 @@ class Settings(BaseSettings):
     app_env: str = "development"
     debug: bool = True
     secret_key: str = "cambiar-en-produccion"
+    auth_cache_tokens: int = 4096  # Tokens JWT ya verificados que se recuerdan (0 = verificar siempre)
+    auth_cache_ttl: int = 300  # Segundos máximos en caché para tokens sin `exp`
+    login_rafaga: int = 20  # Intentos de login seguidos permitidos por IP
+    login_por_minuto: int = 30  # Intentos sostenidos por IP y minuto (0 = sin límite)
+    login_cache_negativa: int = 60  # Segundos que se recuerda un correo sin empleado activo
     app_url: str = "http://localhost:8000"
     
     # Supabase
     supabase_url: str
     supabase_key: str
     supabase_service_key: Optional[str] = None
+    supabase_max_conexiones: int = 20  # Tamaño del pool HTTP/2 del cliente asíncrono
+    supabase_timeout: float = 30.0
+    supabase_pool_sync: int = 10  # Conexiones máximas por cliente síncrono (anon / service)
     
     # Resend (Nueva variable agregada)
     resend_api_key: Optional[str] = None
@@ -29,11 +37,61 @@ class Settings(BaseSettings):
     smtp_use_ssl: bool = True
     email_from: str = "contacto@cytecs.mx"
     email_from_name: str = "Intranet IDS"
+    smtp_pool_size: int = 4  # Conexiones SMTP autenticadas que se reutilizan
+    smtp_keepalive: int = 60  # Segundos de inactividad antes de verificar con NOOP
+    smtp_max_mensajes: int = 100  # Mensajes por conexión antes de reciclarla
+    correos_cola_db: str = "data/cola_correos.db"  # SQLite de la cola de correos salientes
+    correos_workers: int = 4  # Envíos simultáneos desde la cola
+    correos_max_intentos: int = 6  # Intentos antes de marcar un correo como muerto
+    correos_backoff_base: float = 30.0  # Segundos del primer reintento (se duplica en cada intento)
+    correos_backoff_max: float = 3600.0
+    correos_intervalo: float = 5.0  # Segundos entre revisiones de la cola sin trabajo
+    correos_lease: float = 600.0  # Segundos tras los que un correo "enviando" se da por abandonado (mayor que cualquier envío SMTP)
+    recordatorios_simultaneos: int = 0  # Envíos paralelos del recordatorio semanal (0 o más que SMTP_POOL_SIZE = SMTP_POOL_SIZE)
+    recordatorios_timeout: float = 600.0  # Segundos máximos para enviar el recordatorio semanal
+    
+    # Cachés en memoria
+    catalogos_cache_ttl: int = 600  # Segundos que un catálogo se sirve desde memoria (0 = sin caché)
+    anuncios_cache_ttl: int = 600  # Segundos que los anuncios activos se sirven desde memoria (0 = sin caché)
+    cache_invalidacion: str = "archivo"  # archivo | postgres | local (cómo se avisan los workers)
+    cache_invalidacion_db: str = "data/invalidaciones.db"  # Bitácora del modo archivo
+    cache_invalidacion_intervalo: float = 1.0  # Segundos entre revisiones de la bitácora
+    cache_invalidacion_dsn: Optional[str] = None  # postgresql://... para LISTEN/NOTIFY (modo postgres)
+    directorio_empleados_ttl: int = 3600  # Segundos antes de recargar completo el directorio de empleados
+    
+    # Analítica
+    analitica_pagina: int = 1000  # Renglones por página al recorrer actividades (no mayor que max-rows de PostgREST)
+    flujo_pagina: int = 1000  # Renglones por consulta de los listados con ?formato=ndjson (no mayor que max-rows)
+    
+    # Tareas programadas
+    scheduler_coordinacion: str = "archivo"  # archivo | postgres | ninguna (quién ejecuta con varios workers)
+    scheduler_lease_segundos: int = 60  # Vigencia del liderazgo en modo postgres
+    scheduler_lock_archivo: str = "data/scheduler.lock"
     
     # Empresa
     company_name: str = "Informática y Desarrollo en Sistemas S.A. de C.V."
     company_logo_url: str = "/static/img/logo.png"
     
+    # Reportes PDF
+    pdf_workers: int = 0  # Procesos del pool de renders PDF (0 = número de CPUs)
+    pdf_cola: int = 20  # Renders en espera antes de responder 503
+    pdf_timeout: float = 60.0  # Segundos máximos por render
+    firmas_cache_mb: int = 32  # Presupuesto en memoria para firmas digitales
+    firmas_cache_ttl: int = 300  # Segundos antes de revalidar una firma con ETag
+    firmas_cache_dir: Optional[str] = None  # Almacén en disco de firmas (None = sólo memoria)
+    reportes_cache_backend: str = "memoria"  # memoria | disco | ninguno
+    reportes_cache_mb: int = 128  # Tamaño máximo de la caché de PDFs generados
+    reportes_cache_dir: str = "/tmp/intranet_reportes"
+    
+    # Recibos de nómina
+    recibos_subidas_simultaneas: int = 8  # Subidas paralelas a Storage en la carga masiva
+    recibos_jobs_db: str = "data/recibos_jobs.db"  # Estado de las cargas masivas por jobs
+    recibos_jobs_dir: str = "data/recibos_jobs"  # Archivos recibidos pendientes de procesar
+    recibos_jobs_workers: int = 4  # Archivos procesados en paralelo
+    recibos_jobs_lease: float = 900.0  # Segundos tras los que un archivo "procesando" se da por abandonado
+    almacenamiento_bloque_kb: int = 256  # Tamaño de bloque al subir archivos en streaming
+    almacenamiento_local_dir: Optional[str] = None  # Guardar archivos en disco en lugar de Supabase Storage (desarrollo / pruebas)
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,20 +1,213 @@
-from supabase import create_client, Client
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+from supabase import create_client, Client, ClientOptions, acreate_client, AsyncClient, AsyncClientOptions
 from app.config import get_settings
 
 settings = get_settings()
 
+
+# ===========================================
+# REGISTRO DE CLIENTES SÍNCRONOS
+# ===========================================
+# Un cliente por rol ("anon", "service"), creado la primera vez que se pide y
+# reutilizado durante toda la vida del proceso. Cada uno tiene su propio pool
+# HTTP acotado, así que no se repite la sesión ni el handshake TLS por petición.
+# "auth" usa la llave anon sólo para sign_in_with_password: no guarda la sesión
+# del usuario, así que los inicios de sesión no cambian el token con el que el
+# cliente "anon" consulta la base y pueden correr en paralelo.
+
+_clientes: Dict[str, Client] = {}
+_pools: Dict[str, httpx.Client] = {}
+_metricas: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def _nuevo_pool_http() -> httpx.Client:
+    """Crea un pool HTTP/2 acotado para un cliente síncrono"""
+    return httpx.Client(
+        http2=True,
+        follow_redirects=True,
+        timeout=httpx.Timeout(settings.supabase_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.supabase_pool_sync,
+            max_keepalive_connections=settings.supabase_pool_sync
+        )
+    )
+
+
+def get_client(nombre: str = "anon") -> Client:
+    """Obtiene (o crea una sola vez) el cliente registrado con ese nombre"""
+    cliente = _clientes.get(nombre)
+
+    if cliente is None:
+        with _lock:
+            cliente = _clientes.get(nombre)
+            if cliente is None:
+                opciones = {}
+                if nombre == "service":
+                    key = settings.supabase_service_key
+                elif nombre == "anon":
+                    key = settings.supabase_key
+                elif nombre == "auth":
+                    key = settings.supabase_key
+                    opciones = {"persist_session": False, "auto_refresh_token": False}
+                else:
+                    raise ValueError(f"Cliente desconocido: {nombre}")
+
+                inicio = time.perf_counter()
+                pool = _nuevo_pool_http()
+                cliente = create_client(
+                    settings.supabase_url,
+                    key,
+                    options=ClientOptions(httpx_client=pool, **opciones)
+                )
+                _pools[nombre] = pool
+                _clientes[nombre] = cliente
+                _metricas[nombre] = {
+                    "creado": datetime.now().isoformat(),
+                    "creacion_ms": round((time.perf_counter() - inicio) * 1000, 2),
+                    "solicitudes": 0,
+                    "ultima_verificacion": None,
+                }
+
+    _metricas[nombre]["solicitudes"] += 1
+    return cliente
+
+
 # Cliente público (respeta RLS)
-supabase: Client = create_client(
-    settings.supabase_url,
-    settings.supabase_key
-)
+supabase: Client = get_client("anon")
 
 # Cliente con permisos de servicio (bypass RLS) - usar con cuidado
 def get_admin_client() -> Client:
     """Cliente con permisos de administrador para operaciones del sistema"""
     if settings.supabase_service_key:
-        return create_client(
-            settings.supabase_url,
-            settings.supabase_service_key
-        )
+        return get_client("service")
     return supabase
+
+
+def cerrar_clientes():
+    """Cierra los pools HTTP de los clientes síncronos registrados"""
+    with _lock:
+        for nombre, pool in _pools.items():
+            try:
+                pool.close()
+            except Exception as e:
+                print(f"[DB] Error cerrando pool '{nombre}': {e}")
+        _pools.clear()
+        _clientes.clear()
+
+
+def metricas_clientes() -> dict:
+    """Métricas de uso de los clientes y el tamaño de sus pools de conexiones"""
+    resultado = {}
+    for nombre in list(_clientes):
+        resultado[nombre] = {
+            **_metricas.get(nombre, {}),
+            "max_conexiones": settings.supabase_pool_sync,
+        }
+
+    if _async_client is not None:
+        resultado["async"] = {"max_conexiones": settings.supabase_max_conexiones}
+
+    return resultado
+
+
+def _verificar_cliente(nombre: str) -> dict:
+    """Consulta mínima contra PostgREST para comprobar que el cliente responde"""
+    inicio = time.perf_counter()
+    try:
+        _clientes[nombre].table("puestos").select("id").limit(1).execute()
+        estado = {"ok": True}
+    except Exception as e:
+        estado = {"ok": False, "error": str(e)}
+
+    estado["latencia_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+    _metricas[nombre]["ultima_verificacion"] = {**estado, "fecha": datetime.now().isoformat()}
+    return estado
+
+
+async def verificar_clientes() -> dict:
+    """Health check de todos los clientes registrados"""
+    resultado = {}
+    for nombre in list(_clientes):
+        resultado[nombre] = await run_in_threadpool(_verificar_cliente, nombre)
+
+    if _async_client is not None:
+        inicio = time.perf_counter()
+        try:
+            await _async_client.table("puestos").select("id").limit(1).execute()
+            resultado["async"] = {"ok": True}
+        except Exception as e:
+            resultado["async"] = {"ok": False, "error": str(e)}
+        resultado["async"]["latencia_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+
+    return resultado
+
+
+# ===========================================
+# CLIENTE ASÍNCRONO
+# ===========================================
+# Se crea una sola vez en el lifespan de la app (ver app/main.py) y comparte
+# un pool de conexiones HTTP/2 entre todas las peticiones del worker.
+
+_async_client: Optional[AsyncClient] = None
+_async_http: Optional[httpx.AsyncClient] = None
+
+
+async def iniciar_cliente_async() -> AsyncClient:
+    """Crea el cliente asíncrono de Supabase con su pool HTTP/2 compartido"""
+    global _async_client, _async_http
+
+    if _async_client is not None:
+        return _async_client
+
+    _async_http = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        timeout=httpx.Timeout(settings.supabase_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.supabase_max_conexiones,
+            max_keepalive_connections=settings.supabase_max_conexiones
+        )
+    )
+    _async_client = await acreate_client(
+        settings.supabase_url,
+        settings.supabase_key,
+        options=AsyncClientOptions(httpx_client=_async_http)
+    )
+    print(f"[DB] Cliente asíncrono iniciado (máx. {settings.supabase_max_conexiones} conexiones)")
+    return _async_client
+
+
+async def cerrar_cliente_async():
+    """Cierra el pool de conexiones del cliente asíncrono"""
+    global _async_client, _async_http
+
+    if _async_http is not None:
+        await _async_http.aclose()
+
+    _async_client = None
+    _async_http = None
+
+
+def get_async_client() -> AsyncClient:
+    """Cliente asíncrono público (respeta RLS). Requiere que la app haya arrancado."""
+    if _async_client is None:
+        raise RuntimeError("El cliente asíncrono no está iniciado (ver lifespan en app/main.py)")
+    return _async_client
+
+
+async def ejecutar(query):
+    """
+    Ejecuta una consulta del cliente síncrono en el threadpool.
+
+    Ruta de migración para los routers que aún usan `supabase` o
+    `get_admin_client()`: cambiar `query.execute()` por `await ejecutar(query)`
+    evita bloquear el event loop mientras se migra al cliente asíncrono.
+    """
+    return await run_in_threadpool(query.execute)
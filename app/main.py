@@ -1,15 +1,36 @@
-from fastapi import FastAPI, Request
+import os
+from fastapi import Depends, FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 
 from app.config import get_settings
+from app.respuestas import RutaJSON
+from app.auth import estadisticas_tokens, get_current_admin
+from app.models import TokenData
+from app.database import (
+    iniciar_cliente_async, cerrar_cliente_async, cerrar_clientes,
+    verificar_clientes, metricas_clientes
+)
 from app.scheduler import iniciar_scheduler, detener_scheduler
+from app.services.coordinacion import estado_coordinacion
+from app.services.catalogos_cache import estadisticas_catalogos
+from app.services.login import estadisticas_login
+from app.services.directorio_empleados import estadisticas_directorio
+from app.services.invalidaciones import iniciar_invalidaciones, detener_invalidaciones, estado_invalidaciones
+from app.services.email_service import cerrar_pool_smtp
+from app.services.cola_correos import iniciar_cola_correos, detener_cola_correos
+from app.services.almacenamiento import cerrar_almacenamiento
+from app.services.recibos_jobs import iniciar_recibos_jobs, detener_recibos_jobs
+from app.services.pdf_executor import (
+    iniciar_pdf_executor, detener_pdf_executor, estadisticas_pdf, PdfSaturado, PdfTiempoAgotado
+)
 
 # Importar routers
-from app.routers import auth, empleados, vacaciones, actividades, catalogos, reportes, pages, inventario, anuncios, recibos, correos
+from app.routers import auth, empleados, vacaciones, actividades, catalogos, reportes, pages, inventario, anuncios, recibos, correos, analitica, almacenamiento
 
 settings = get_settings()
 
@@ -19,11 +40,24 @@ async def lifespan(app: FastAPI):
     """Maneja el ciclo de vida de la aplicación"""
     # Startup
     print(f"🚀 Iniciando {settings.app_name}...")
+    await iniciar_cliente_async()
+    await iniciar_invalidaciones()
+    iniciar_pdf_executor()
+    iniciar_cola_correos()
+    iniciar_recibos_jobs()
     iniciar_scheduler()
     yield
     # Shutdown
     print("👋 Cerrando aplicación...")
     detener_scheduler()
+    detener_pdf_executor()
+    await detener_recibos_jobs()
+    await detener_cola_correos()
+    await detener_invalidaciones()
+    await cerrar_cliente_async()
+    cerrar_clientes()
+    cerrar_pool_smtp()
+    cerrar_almacenamiento()
 
 
 # Crear aplicación
@@ -33,6 +67,7 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan
 )
+app.router.route_class = RutaJSON  # Respuestas con orjson (app/respuestas.py)
 
 
 # Handler para errores de validación (422)
@@ -47,6 +82,24 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": exc.errors()}
     )
 
+# Handlers para el pool de renders PDF (cola llena / render demasiado largo)
+@app.exception_handler(PdfSaturado)
+async def pdf_saturado_handler(request: Request, exc: PdfSaturado):
+    print(f"[PDF] Cola llena, rechazando {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "5"}
+    )
+
+
+@app.exception_handler(PdfTiempoAgotado)
+async def pdf_tiempo_agotado_handler(request: Request, exc: PdfTiempoAgotado):
+    return JSONResponse(
+        status_code=504,
+        content={"detail": str(exc)}
+    )
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -54,11 +107,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # Paginación (app/paginacion.py)
 )
 
 # Montar archivos estáticos
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
+# Archivos subidos cuando se usa almacenamiento local en lugar de Supabase Storage
+# (desarrollo / pruebas). Se sirven con sesión, no como estáticos públicos
+if settings.almacenamiento_local_dir:
+    os.makedirs(settings.almacenamiento_local_dir, exist_ok=True)
+    app.include_router(almacenamiento.router)
+
 # Registrar routers de API
 app.include_router(auth.router)
 app.include_router(empleados.router)
@@ -70,6 +130,7 @@ app.include_router(inventario.router)
 app.include_router(anuncios.router)
 app.include_router(recibos.router)
 app.include_router(correos.router)
+app.include_router(analitica.router)
 
 # Registrar router de páginas HTML
 app.include_router(pages.router)
@@ -85,6 +146,45 @@ async def health_check():
     }
 
 
+@app.get("/health/db")
+async def health_check_db(current_user: TokenData = Depends(get_current_admin)):
+    """Verifica los clientes de Supabase y reporta sus métricas (admin)"""
+    verificacion = await verificar_clientes()
+    return {
+        "status": "healthy" if all(v["ok"] for v in verificacion.values()) else "degraded",
+        "clientes": verificacion,
+        "metricas": metricas_clientes()
+    }
+
+
+@app.get("/health/pdf")
+async def health_check_pdf():
+    """Estado del pool de renders PDF"""
+    return estadisticas_pdf()
+
+
+@app.get("/health/catalogos")
+async def health_check_catalogos(current_user: TokenData = Depends(get_current_admin)):
+    """Cachés en memoria (catálogos, directorio de empleados) y estado del bus de invalidación (admin)"""
+    return {
+        **estadisticas_catalogos(),
+        "directorio_empleados": estadisticas_directorio(),
+        "invalidacion": estado_invalidaciones(),
+    }
+
+
+@app.get("/health/auth")
+async def health_check_auth(current_user: TokenData = Depends(get_current_admin)):
+    """Caché de tokens JWT ya verificados y límites del login (admin)"""
+    return {"tokens": estadisticas_tokens(), "login": estadisticas_login()}
+
+
+@app.get("/health/scheduler")
+async def health_check_scheduler(current_user: TokenData = Depends(get_current_admin)):
+    """Coordinación del scheduler: quién es el líder y últimas ejecuciones (admin)"""
+    return await run_in_threadpool(estado_coordinacion)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,401 @@
+import asyncio
+import base64
+import json
+import re
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Iterable, List, Optional, Tuple, Type
+
+from fastapi import Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from postgrest.exceptions import APIError
+from pydantic import BaseModel, create_model
+
+from app.config import get_settings
+from app.database import ejecutar
+from app.respuestas import a_json
+
+settings = get_settings()
+
+
+# ===========================================
+# PAGINACIÓN POR CURSOR Y PROYECCIÓN DE CAMPOS
+# ===========================================
+# Parámetros comunes de los listados:
+#
+#   ?limit=50        renglones por página (sin limit: todo, como antes)
+#   ?after=<cursor>  continuar después del último renglón de la página anterior
+#   ?fields=a,b,c    sólo esas columnas
+#   ?total=true      contar los renglones del listado completo (con filtros)
+#
+# La respuesta sigue siendo la lista de siempre; el cursor de la siguiente
+# página viaja en X-Next-Cursor (ausente en la última) y el total en
+# X-Total-Count. El cursor guarda los valores de las columnas del orden del
+# último renglón y la consulta continúa con un filtro sobre ellas, así que
+# cualquier página cuesta lo mismo que la primera (no hay OFFSET) y las altas
+# entre una página y otra no duplican ni saltan renglones. El orden de cada
+# listado termina en una columna única (id) para que no haya empates.
+#
+# Uso en un router:
+#
+#   @router.get("/", response_model=List[modelo_parcial(Modelo)], response_model_exclude_unset=True)
+#   async def listar(response: Response, pagina: Paginacion = Depends(paginacion(Modelo))):
+#       def consulta(columnas, **opciones):
+#           return cliente.table("tabla").select(columnas, **opciones).eq(...)
+#       filas = await paginar_consulta(response, pagina, consulta, [("created_at", True), ("id", True)])
+#       return pagina.proyectar(filas)
+
+LIMITE_MAXIMO = 500  # Se pide un renglón extra: debe quedar bajo max-rows de PostgREST (1000)
+ENCABEZADO_CURSOR = "X-Next-Cursor"
+ENCABEZADO_TOTAL = "X-Total-Count"
+
+_CAMPO_VALIDO = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+Orden = List[Tuple[str, bool]]  # [(columna, descendente), ...]
+
+
+class Paginacion:
+    """Parámetros de paginación y proyección ya validados"""
+
+    def __init__(
+        self,
+        limit: Optional[int],
+        after: Optional[str],
+        campos: Optional[List[str]],
+        total: bool,
+        defaults: Optional[dict] = None,
+        campos_modelo: Optional[List[str]] = None
+    ):
+        self.limit = limit
+        self.after = after
+        self.campos = campos
+        self.total = total
+        self.defaults = defaults or {}
+        self.campos_modelo = campos_modelo  # Campos del response_model (respuestas en flujo)
+
+    def proyectar(self, filas: List[dict]) -> List[dict]:
+        """
+        Deja en cada renglón sólo los campos pedidos en ?fields=. Los campos
+        del modelo con valor por omisión que la consulta no trajo se agregan
+        con ese valor, como lo hacía el response_model completo.
+        """
+        if not self.campos:
+            for fila in filas:
+                for campo, valor in self.defaults.items():
+                    fila.setdefault(campo, valor)
+            return filas
+        return [
+            {campo: fila.get(campo, self.defaults.get(campo)) for campo in self.campos if campo in fila or campo in self.defaults}
+            for fila in filas
+        ]
+
+
+def paginacion(modelo: Optional[Type[BaseModel]] = None, campos_extra: Iterable[str] = ()):
+    """
+    Dependencia de FastAPI con los parámetros de paginación. Con `modelo`,
+    ?fields= sólo acepta sus campos (más `campos_extra`).
+    """
+    permitidos = set(modelo.model_fields) | set(campos_extra) if modelo else None
+    defaults = {
+        nombre: info.default
+        for nombre, info in modelo.model_fields.items()
+        if not info.is_required() and info.default_factory is None
+    } if modelo else None
+
+    def dependencia(
+        limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO, description="Renglones por página"),
+        after: Optional[str] = Query(None, description="Cursor de X-Next-Cursor de la página anterior"),
+        fields: Optional[str] = Query(None, description="Campos a incluir, separados por coma"),
+        total: bool = Query(False, description="Incluir X-Total-Count"),
+    ) -> Paginacion:
+        campos = None
+        if fields:
+            campos = list(dict.fromkeys(c.strip() for c in fields.split(",") if c.strip()))
+            invalidos = [
+                c for c in campos
+                if not _CAMPO_VALIDO.match(c) or (permitidos is not None and c not in permitidos)
+            ]
+            if invalidos:
+                detalle = f"Campos no válidos en fields: {', '.join(invalidos)}"
+                if permitidos is not None:
+                    detalle += f". Disponibles: {', '.join(sorted(permitidos))}"
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detalle)
+        return Paginacion(limit, after, campos, total, defaults, list(modelo.model_fields) if modelo else None)
+
+    return dependencia
+
+
+@lru_cache(maxsize=None)
+def modelo_parcial(modelo: Type[BaseModel]) -> Type[BaseModel]:
+    """
+    Copia de `modelo` con todos los campos opcionales, para usar como
+    response_model (con response_model_exclude_unset=True) de listados con
+    ?fields=: los campos presentes se validan igual y los omitidos no aparecen.
+    """
+    campos = {
+        nombre: (Optional[info.annotation], None)
+        for nombre, info in modelo.model_fields.items()
+    }
+    return create_model(f"{modelo.__name__}Parcial", **campos)
+
+
+# ===========================================
+# CURSORES
+# ===========================================
+
+def codificar_cursor(valores: list) -> str:
+    texto = json.dumps(valores, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, columnas: int) -> list:
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        valores = None
+    if not isinstance(valores, list) or len(valores) != columnas:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    return valores
+
+
+def _literal(valor: Any) -> str:
+    """Valor entre comillas para un filtro de PostgREST (admite comas y paréntesis)"""
+    if isinstance(valor, bool):
+        valor = "true" if valor else "false"
+    texto = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{texto}"'
+
+
+def filtro_despues(orden: Orden, valores: list) -> str:
+    """
+    Condición de PostgREST (para `.or_()`) de los renglones que van después
+    de `valores` en `orden`. Respeta los NULL como los ordena Postgres:
+    al final en ascendente y al principio en descendente.
+    """
+    condiciones = []
+    for i, (columna, descendente) in enumerate(orden):
+        partes = [
+            f"{c}.is.null" if v is None else f"{c}.eq.{_literal(v)}"
+            for (c, _), v in zip(orden[:i], valores[:i])
+        ]
+        valor = valores[i]
+        if valor is None:
+            if not descendente:
+                continue  # Después de un NULL ascendente sólo hay más NULL
+            partes.append(f"{columna}.not.is.null")
+        elif descendente:
+            partes.append(f"{columna}.lt.{_literal(valor)}")
+        else:
+            partes.append(f"or({columna}.gt.{_literal(valor)},{columna}.is.null)")
+        condiciones.append(partes[0] if len(partes) == 1 else f"and({','.join(partes)})")
+    return ",".join(condiciones)
+
+
+# ===========================================
+# LISTADOS
+# ===========================================
+
+def _columnas(pagina: Paginacion, orden: Orden, derivados: dict) -> str:
+    if not pagina.campos:
+        return ", ".join(["*", *derivados.values()])
+    # Las columnas del orden siempre se piden: con ellas se arma el cursor
+    columnas = [c for c in pagina.campos if c not in derivados]
+    columnas += [c for c, _ in orden if c not in columnas]
+    embebidos = [derivados[c] for c in pagina.campos if c in derivados]
+    return ", ".join(columnas + list(dict.fromkeys(embebidos)))
+
+
+async def paginar_consulta(
+    response: Response,
+    pagina: Paginacion,
+    consulta: Callable[..., Any],
+    orden: Orden,
+    derivados: Optional[dict] = None
+) -> List[dict]:
+    """
+    Ejecuta `consulta(columnas, **opciones)` (un select de postgrest con sus
+    filtros, sin orden) paginando por `orden`. `derivados` relaciona campos
+    que el router calcula con el recurso embebido que necesitan, p. ej.
+    {"empleado_nombre": "empleados(nombre, apellidos)"}. Regresa los
+    renglones (con las columnas del orden aunque no se hayan pedido; pasar el
+    resultado final por `pagina.proyectar`).
+    """
+    derivados = derivados or {}
+    columnas = _columnas(pagina, orden, derivados)
+    contar_aqui = pagina.total and not pagina.after
+    despues = decodificar_cursor(pagina.after, len(orden)) if pagina.after else None
+
+    query = _armar_consulta(
+        consulta, columnas, orden, despues, pagina.limit + 1 if pagina.limit else None,
+        **({"count": "exact"} if contar_aqui else {})
+    )
+    result = await _ejecutar_pagina(pagina, query)
+
+    filas = result.data
+    if pagina.limit and len(filas) > pagina.limit:
+        filas = filas[:pagina.limit]
+        response.headers[ENCABEZADO_CURSOR] = codificar_cursor([filas[-1].get(c) for c, _ in orden])
+
+    if pagina.total:
+        total = result.count if contar_aqui else await _contar(consulta, orden)
+        response.headers[ENCABEZADO_TOTAL] = str(total)
+
+    return filas
+
+
+def _armar_consulta(
+    consulta: Callable[..., Any],
+    columnas: str,
+    orden: Orden,
+    despues: Optional[list],
+    limite: Optional[int],
+    **opciones
+):
+    query = consulta(columnas, **opciones)
+    if despues is not None:
+        query = query.or_(filtro_despues(orden, despues))
+    for columna, descendente in orden:
+        query = query.order(columna, desc=descendente)
+    if limite:
+        query = query.limit(limite)
+    return query
+
+
+async def _ejecutar_pagina(pagina: Paginacion, query):
+    try:
+        return await ejecutar(query)
+    except APIError as e:
+        # 42703: columna inexistente en ?fields=
+        if pagina.campos and e.code in ("42703", "PGRST100"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"fields no válido: {e.message}")
+        raise
+
+
+async def _contar(consulta: Callable[..., Any], orden: Orden) -> int:
+    conteo = await ejecutar(consulta(orden[-1][0], count="exact", head=True))
+    return conteo.count
+
+
+def paginar_lista(
+    response: Response,
+    pagina: Paginacion,
+    filas: List[dict],
+    clave: Callable[[dict], list]
+) -> List[dict]:
+    """Misma paginación para listas ya en memoria, ordenadas por `clave` (única)"""
+    total = len(filas)
+    if pagina.after and filas:
+        valores = decodificar_cursor(pagina.after, len(clave(filas[0])))
+        filas = [f for f in filas if clave(f) > valores]
+    if pagina.limit and len(filas) > pagina.limit:
+        filas = filas[:pagina.limit]
+        response.headers[ENCABEZADO_CURSOR] = codificar_cursor(clave(filas[-1]))
+    if pagina.total:
+        response.headers[ENCABEZADO_TOTAL] = str(total)
+    return pagina.proyectar(filas)
+
+
+# ===========================================
+# RESPUESTAS EN FLUJO
+# ===========================================
+# Con ?formato=ndjson (o Accept: application/x-ndjson) un listado completo se
+# transmite mientras se lee: se piden páginas de FLUJO_PAGINA renglones por
+# llave, cada una se serializa con orjson y se envía; la siguiente ya se está
+# pidiendo mientras tanto. La memoria no crece con el listado y el primer
+# byte sale con la primera página. Sin validación de pydantic por renglón:
+# los campos se recortan a los del modelo del endpoint (o a ?fields=).
+#
+#   ndjson   un objeto JSON por línea (application/x-ndjson)
+#   arreglo  el mismo arreglo JSON de siempre, enviado por partes
+#
+# ?after= se respeta y ?limit= no aplica: se transmite todo el resto.
+
+FORMATOS_FLUJO = ("ndjson", "arreglo")
+MEDIA_NDJSON = "application/x-ndjson"
+
+
+def formato_flujo(
+    formato: Optional[str] = Query(None, description="ndjson | arreglo: transmitir el listado completo en flujo"),
+    accept: Optional[str] = Header(None, include_in_schema=False),
+) -> Optional[str]:
+    """Dependencia: formato de flujo pedido, o None para la respuesta normal"""
+    if formato is None:
+        return "ndjson" if accept and MEDIA_NDJSON in accept else None
+    if formato not in FORMATOS_FLUJO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"formato debe ser uno de: {', '.join(FORMATOS_FLUJO)}"
+        )
+    return formato
+
+
+async def transmitir_consulta(
+    formato: str,
+    pagina: Paginacion,
+    consulta: Callable[..., Any],
+    orden: Orden,
+    derivados: Optional[dict] = None,
+    transformar: Optional[Callable[[dict], dict]] = None
+) -> StreamingResponse:
+    """
+    StreamingResponse con todos los renglones de `consulta` (mismos
+    argumentos que paginar_consulta). `transformar` se aplica a cada renglón
+    antes de recortar campos, p. ej. para armar empleado_nombre.
+    """
+    derivados = derivados or {}
+    columnas = _columnas(pagina, orden, derivados)
+    despues = decodificar_cursor(pagina.after, len(orden)) if pagina.after else None
+    campos = pagina.campos or pagina.campos_modelo
+    tam_pagina = settings.flujo_pagina
+
+    async def leer(valores: Optional[list]) -> List[dict]:
+        query = _armar_consulta(consulta, columnas, orden, valores, tam_pagina)
+        return (await _ejecutar_pagina(pagina, query)).data
+
+    # La primera página se pide antes de responder: un error (fields, cursor)
+    # todavía puede regresar su código HTTP en lugar de cortar el flujo
+    primera = await leer(despues)
+    encabezados = {}
+    if pagina.total:
+        encabezados[ENCABEZADO_TOTAL] = str(await _contar(consulta, orden))
+
+    def serializar(filas: List[dict]) -> List[bytes]:
+        salida = []
+        for fila in filas:
+            if transformar:
+                fila = transformar(fila)
+            if campos:
+                fila = {c: fila.get(c, pagina.defaults.get(c)) for c in campos if c in fila or c in pagina.defaults}
+            salida.append(a_json(fila))
+        return salida
+
+    async def generar() -> AsyncIterator[bytes]:
+        filas = primera
+        siguiente = None
+        enviados = 0
+        try:
+            if formato == "arreglo":
+                yield b"["
+            while filas:
+                # Se pide la siguiente página mientras se serializa y envía esta
+                # (se sigue hasta una página vacía: PostgREST puede recortar a su max-rows)
+                valores = [filas[-1].get(c) for c, _ in orden]
+                siguiente = asyncio.ensure_future(leer(valores))
+
+                objetos = serializar(filas)
+                if formato == "ndjson":
+                    yield b"\n".join(objetos) + b"\n"
+                else:
+                    yield (b"," if enviados else b"") + b",".join(objetos)
+                enviados += len(objetos)
+
+                filas = await siguiente
+                siguiente = None
+            if formato == "arreglo":
+                yield b"]"
+        finally:
+            # Cliente desconectado a media transmisión
+            if siguiente is not None:
+                siguiente.cancel()
+
+    media = MEDIA_NDJSON if formato == "ndjson" else "application/json"
+    return StreamingResponse(generar(), media_type=media, headers=encabezados)
@@ -0,0 +1,69 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.datastructures import DefaultPlaceholder, Default
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+
+# ===========================================
+# SERIALIZACIÓN JSON
+# ===========================================
+# Todas las respuestas JSON de la API se escriben con orjson en lugar de
+# json.dumps. orjson entiende date, datetime, time y UUID por sí mismo; lo que
+# no conoce (Decimal, modelos de pydantic, conjuntos) pasa por _por_defecto con
+# el mismo resultado que daba jsonable_encoder, así que la salida no cambia.
+#
+# - Rutas con response_model: FastAPI valida y serializa con pydantic; en
+#   versiones que escriben el JSON directo desde pydantic esa ruta rápida se
+#   conserva (RutaJSON sólo cambia la clase por omisión, no la fija).
+# - Rutas que regresan dicts: FastAPI los pasa por jsonable_encoder y
+#   RespuestaJSON los escribe. Los listados más grandes regresan
+#   RespuestaJSON(datos) directamente para saltarse jsonable_encoder.
+#
+# Comparación de costos: python benchmarks/serializacion.py
+
+_OPCIONES = orjson.OPT_NON_STR_KEYS
+
+
+def _por_defecto(valor: Any) -> Any:
+    """Tipos que orjson no serializa solo"""
+    if isinstance(valor, Decimal):
+        # Igual que jsonable_encoder: entero si no tiene parte decimal
+        if valor.as_tuple().exponent >= 0:
+            return int(valor)
+        return float(valor)
+    if isinstance(valor, BaseModel):
+        return valor.model_dump(mode="json")
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    return jsonable_encoder(valor)
+
+
+def a_json(contenido: Any) -> bytes:
+    """Serializa a JSON (bytes UTF-8)"""
+    return orjson.dumps(contenido, default=_por_defecto, option=_OPCIONES)
+
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse escrita con orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return a_json(content)
+
+
+class RutaJSON(APIRoute):
+    """
+    Ruta cuya clase de respuesta por omisión es RespuestaJSON. Se queda como
+    valor por omisión (no explícito) para que FastAPI siga serializando los
+    response_model directo con pydantic cuando puede.
+    """
+
+    def __init__(self, *args, **kwargs):
+        clase = kwargs.get("response_class")
+        if clase is None or (isinstance(clase, DefaultPlaceholder) and clase.value is JSONResponse):
+            kwargs["response_class"] = Default(RespuestaJSON)
+        super().__init__(*args, **kwargs)
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import date, timedelta
+from postgrest.exceptions import APIError
 
-from app.database import supabase
+from app.database import get_async_client
 from app.models import (
     Actividad,
     ActividadCreate,
@@ -14,8 +16,12 @@ from app.models import (
     TokenData
 )
 from app.auth import get_current_user, get_current_admin
+from app.services.reportes_cache import invalidar_reportes
+from app.services.invalidaciones import publicar_invalidacion
+from app.services.seguimiento_semanal import matriz_horas_semana, matriz_a_filas, empleados_incompletos
+from app.respuestas import RespuestaJSON, RutaJSON
 
-router = APIRouter(prefix="/api/actividades", tags=["Actividades"])
+router = APIRouter(prefix="/api/actividades", tags=["Actividades"], route_class=RutaJSON)
 
 
 def get_dia_semana(fecha: date) -> str:
@@ -29,12 +35,36 @@ def get_lunes_semana(fecha: date) -> date:
     return fecha - timedelta(days=fecha.weekday())
 
 
+async def _consultar_resumen(vista: str, vista_respaldo: str, filtros: dict) -> list:
+    """
+    Lee un resumen de horas de las tablas incrementales (sql/resumenes_horas.sql)
+    y, si la migración no se ha aplicado, de la vista original.
+    """
+    db = get_async_client()
+
+    def _consulta(nombre: str):
+        query = db.table(nombre).select("*")
+        for campo, valor in filtros.items():
+            query = query.eq(campo, valor)
+        return query
+
+    try:
+        result = await _consulta(vista).execute()
+    except APIError as e:
+        # PGRST205 / 42P01: la vista no existe
+        if e.code not in ("PGRST205", "42P01"):
+            raise
+        result = await _consulta(vista_respaldo).execute()
+    return result.data
+
+
 @router.get("/semana", response_model=List[Actividad])
 async def obtener_semana(
     fecha: Optional[date] = None,
     current_user: TokenData = Depends(get_current_user)
 ):
     """Obtener actividades de una semana (por defecto la actual)"""
+    db = get_async_client()
     
     if not fecha:
         fecha = date.today()
@@ -42,7 +72,7 @@ async def obtener_semana(
     lunes = get_lunes_semana(fecha)
     viernes = lunes + timedelta(days=4)
     
-    result = supabase.table("actividades").select("*").eq("empleado_id", current_user.user_id).gte("fecha", lunes.isoformat()).lte("fecha", viernes.isoformat()).order("fecha").execute()
+    result = await db.table("actividades").select("*").eq("empleado_id", current_user.user_id).gte("fecha", lunes.isoformat()).lte("fecha", viernes.isoformat()).order("fecha").execute()
     
     return result.data
 
@@ -53,6 +83,7 @@ async def guardar_semana(
     current_user: TokenData = Depends(get_current_user)
 ):
     """Guardar actividades de toda la semana"""
+    db = get_async_client()
     
     lunes = get_lunes_semana(datos.semana_inicio)
     
@@ -71,11 +102,16 @@ async def guardar_semana(
         actividades_data.append(act_dict)
     
     # Usar upsert para insertar o actualizar
-    result = supabase.table("actividades").upsert(
+    result = await db.table("actividades").upsert(
         actividades_data,
         on_conflict="empleado_id,fecha"
     ).execute()
     
+    # Los PDFs del mes y la semana afectados ya no corresponden a los datos
+    await run_in_threadpool(invalidar_reportes, current_user.user_id, [lunes] + [a.fecha for a in datos.actividades])
+    semanas = {get_lunes_semana(f).isoformat() for f in [lunes] + [a.fecha for a in datos.actividades]}
+    await publicar_invalidacion(*(f"matriz_semanal:{semana}" for semana in semanas))
+    
     return {"message": f"Se guardaron {len(result.data)} actividades"}
 
 
@@ -86,6 +122,7 @@ async def obtener_mes(
     current_user: TokenData = Depends(get_current_user)
 ):
     """Obtener actividades de un mes"""
+    db = get_async_client()
     
     fecha_inicio = date(anio, mes, 1)
     
@@ -95,7 +132,7 @@ async def obtener_mes(
     else:
         fecha_fin = date(anio, mes + 1, 1) - timedelta(days=1)
     
-    result = supabase.table("actividades").select("*").eq("empleado_id", current_user.user_id).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat()).order("fecha").execute()
+    result = await db.table("actividades").select("*").eq("empleado_id", current_user.user_id).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat()).order("fecha").execute()
     
     return result.data
 
@@ -107,6 +144,7 @@ async def actualizar_actividad(
     current_user: TokenData = Depends(get_current_user)
 ):
     """Actualizar una actividad específica"""
+    db = get_async_client()
     
     update_data = {k: v for k, v in actividad.model_dump().items() if v is not None}
     
@@ -115,7 +153,7 @@ async def actualizar_actividad(
     if "hora_salida" in update_data and update_data["hora_salida"]:
         update_data["hora_salida"] = update_data["hora_salida"].isoformat()
     
-    result = supabase.table("actividades").update(update_data).eq("id", actividad_id).eq("empleado_id", current_user.user_id).execute()
+    result = await db.table("actividades").update(update_data).eq("id", actividad_id).eq("empleado_id", current_user.user_id).execute()
     
     if not result.data:
         raise HTTPException(
@@ -123,6 +161,10 @@ async def actualizar_actividad(
             detail="Actividad no encontrada"
         )
     
+    fecha = date.fromisoformat(result.data[0]["fecha"])
+    await run_in_threadpool(invalidar_reportes, current_user.user_id, [fecha])
+    await publicar_invalidacion(f"matriz_semanal:{get_lunes_semana(fecha).isoformat()}")
+    
     return result.data[0]
 
 
@@ -135,8 +177,9 @@ async def empleados_sin_captura(
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Obtener empleados que no han capturado actividades esta semana"""
+    db = get_async_client()
     
-    result = supabase.table("v_empleados_sin_captura").select("*").execute()
+    result = await db.table("v_empleados_sin_captura").select("*").execute()
     
     return result.data
 
@@ -147,15 +190,14 @@ async def resumen_semanal_admin(
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Obtener resumen semanal de todos los empleados"""
-    
     if not fecha:
         fecha = date.today()
     
     lunes = get_lunes_semana(fecha)
     
-    result = supabase.table("v_resumen_semanal").select("*").eq("semana_inicio", lunes.isoformat()).execute()
-    
-    return result.data
+    return await _consultar_resumen(
+        "v_resumen_semanal_horas", "v_resumen_semanal", {"semana_inicio": lunes.isoformat()}
+    )
 
 
 @router.get("/admin/resumen-mensual", response_model=List[ResumenMensual])
@@ -165,84 +207,33 @@ async def resumen_mensual_admin(
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Obtener resumen mensual de todos los empleados"""
-    
-    result = supabase.table("v_resumen_mensual").select("*").eq("anio", anio).eq("mes", mes).execute()
-    
-    return result.data
+    return await _consultar_resumen(
+        "v_resumen_mensual_horas", "v_resumen_mensual", {"anio": anio, "mes": mes}
+    )
 
 
 @router.get("/admin/seguimiento-semanal")
 async def seguimiento_semanal_admin(
     fecha_inicio: Optional[date] = None,
+    formato: str = Query("filas", pattern="^(filas|columnas)$"),
     current_user: TokenData = Depends(get_current_admin)
 ):
-    """Obtener seguimiento semanal detallado de todos los empleados"""
-    
+    """
+    Horas por empleado activo y día de la semana. formato=columnas regresa la
+    matriz compacta (ids y un arreglo de 5 horas por empleado); formato=filas
+    conserva la respuesta anterior, una fila por empleado.
+    """
     if not fecha_inicio:
         fecha_inicio = get_lunes_semana(date.today())
     else:
         # Asegurar que sea lunes
         fecha_inicio = get_lunes_semana(fecha_inicio)
     
-    fecha_fin = fecha_inicio + timedelta(days=4)  # Viernes
-    
-    # Obtener todos los empleados activos
-    empleados_result = supabase.table("empleados").select(
-        "id, nombre, apellidos, puesto:puestos(nombre)"
-    ).eq("activo", True).execute()
-    
-    if not empleados_result.data:
-        return []
-    
-    # Obtener actividades de la semana
-    actividades_result = supabase.table("actividades").select(
-        "empleado_id, fecha, horas_trabajadas"
-    ).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat()).execute()
-    
-    # Crear diccionario de actividades por empleado y día
-    actividades_por_empleado = {}
-    for act in actividades_result.data:
-        emp_id = act["empleado_id"]
-        if emp_id not in actividades_por_empleado:
-            actividades_por_empleado[emp_id] = {}
-        
-        fecha_act = act["fecha"]
-        if isinstance(fecha_act, str):
-            fecha_obj = date.fromisoformat(fecha_act)
-        else:
-            fecha_obj = fecha_act
-        
-        # Determinar qué día de la semana es (0=lunes, 4=viernes)
-        dia_idx = (fecha_obj - fecha_inicio).days
-        if 0 <= dia_idx <= 4:
-            dias_nombre = ["lunes", "martes", "miercoles", "jueves", "viernes"]
-            actividades_por_empleado[emp_id][dias_nombre[dia_idx]] = float(act.get("horas_trabajadas", 0) or 0)
-    
-    # Construir respuesta
-    resultado = []
-    for emp in empleados_result.data:
-        emp_id = emp["id"]
-        puesto_nombre = ""
-        if emp.get("puesto") and isinstance(emp["puesto"], dict):
-            puesto_nombre = emp["puesto"].get("nombre", "")
-        
-        dias = actividades_por_empleado.get(emp_id, {})
-        
-        resultado.append({
-            "empleado_id": emp_id,
-            "nombre": emp["nombre"],
-            "apellidos": emp["apellidos"],
-            "puesto": puesto_nombre,
-            "dias": {
-                "lunes": dias.get("lunes", 0),
-                "martes": dias.get("martes", 0),
-                "miercoles": dias.get("miercoles", 0),
-                "jueves": dias.get("jueves", 0),
-                "viernes": dias.get("viernes", 0)
-            }
-        })
-    
-    return resultado
+    matriz = await matriz_horas_semana(fecha_inicio)
+    
+    if formato == "columnas":
+        return RespuestaJSON(matriz)
+    return RespuestaJSON(matriz_a_filas(matriz))
 
 
 @router.get("/admin/empleado/{empleado_id}/mes/{anio}/{mes}", response_model=List[Actividad])
@@ -253,6 +244,7 @@ async def actividades_empleado(
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Obtener actividades de un empleado específico (admin)"""
+    db = get_async_client()
     
     fecha_inicio = date(anio, mes, 1)
     
@@ -261,7 +253,7 @@ async def actividades_empleado(
     else:
         fecha_fin = date(anio, mes + 1, 1) - timedelta(days=1)
     
-    result = supabase.table("actividades").select(
+    result = await db.table("actividades").select(
         "*, ubicacion:ubicaciones(codigo, nombre)"
     ).eq("empleado_id", empleado_id).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat()).order("fecha").execute()
     
@@ -283,39 +275,19 @@ async def enviar_recordatorios(
     
     fecha_fin = fecha_inicio + timedelta(days=4)
     
-    # Obtener todos los empleados activos con su email
-    empleados_result = supabase.table("empleados").select(
-        "id, nombre, apellidos, email"
-    ).eq("activo", True).execute()
+    # Empleados activos con menos de 5 días capturados (matriz de la semana)
+    matriz = await matriz_horas_semana(fecha_inicio)
     
-    if not empleados_result.data:
+    if not matriz["empleado_ids"]:
         return {"message": "No hay empleados activos", "enviados": 0}
     
-    # Obtener actividades de la semana
-    actividades_result = supabase.table("actividades").select(
-        "empleado_id, fecha, horas_trabajadas"
-    ).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat()).execute()
-    
-    # Contar días capturados por empleado
-    dias_por_empleado = {}
-    for act in actividades_result.data:
-        emp_id = act["empleado_id"]
-        horas = float(act.get("horas_trabajadas", 0) or 0)
-        if horas > 0:
-            dias_por_empleado[emp_id] = dias_por_empleado.get(emp_id, 0) + 1
-    
-    # Filtrar empleados que no han completado (menos de 5 días)
-    empleados_pendientes = []
-    for emp in empleados_result.data:
-        dias = dias_por_empleado.get(emp["id"], 0)
-        if dias < 5:  # No ha completado la semana
-            empleados_pendientes.append(emp)
+    empleados_pendientes = empleados_incompletos(matriz)
     
     if not empleados_pendientes:
         return {
             "message": "Todos los empleados han completado sus actividades",
             "enviados": 0,
-            "total_empleados": len(empleados_result.data)
+            "total_empleados": len(matriz["empleado_ids"])
         }
     
     # Formatear semana para el mensaje
@@ -323,12 +295,13 @@ async def enviar_recordatorios(
     semana_str = f"{fecha_inicio.day}-{meses[fecha_inicio.month-1]} al {fecha_fin.day}-{meses[fecha_fin.month-1]}"
     
     # Enviar recordatorios
-    resultado = enviar_recordatorio_actividades(empleados_pendientes, semana_str)
+    resultado = await run_in_threadpool(enviar_recordatorio_actividades, empleados_pendientes, semana_str)
     
     return {
         "message": f"Recordatorios enviados a {resultado['enviados']} empleados",
         "enviados": resultado["enviados"],
         "fallidos": resultado["fallidos"],
+        "en_curso": resultado["en_curso"],
         "total_pendientes": len(empleados_pendientes),
         "detalles": resultado["detalles"]
     }
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import FileResponse
+
+from app.models import TokenData
+from app.auth import get_current_user
+from app.services.almacenamiento import ruta_local
+
+router = APIRouter(prefix="/almacenamiento", tags=["Almacenamiento local"], include_in_schema=False)
+
+
+# ===========================================
+# ARCHIVOS DEL ALMACENAMIENTO LOCAL
+# ===========================================
+# Sólo se registra con ALMACENAMIENTO_LOCAL_DIR (ver app/main.py). Las URLs
+# que arma url_publica apuntan aquí; el navegador manda la cookie de sesión,
+# así que los enlaces y <img> siguen funcionando sin exponer los archivos.
+
+@router.get("/{bucket}/{ruta:path}")
+async def servir_archivo(
+    bucket: str,
+    ruta: str,
+    current_user: TokenData = Depends(get_current_user)
+):
+    """Descargar un archivo del almacenamiento local (usuario con sesión)"""
+    # Sin "..": el primer segmento de la ruta tiene que ser el real
+    if ".." in ruta.split("/"):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    
+    # Los recibos se guardan en {empleado_id}/{anio}/...: sólo su dueño o un admin
+    es_admin = current_user.es_admin or current_user.rol == "admin"
+    if bucket == "recibos" and not es_admin and ruta.split("/", 1)[0] != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para ver este archivo"
+        )
+    
+    destino = ruta_local(bucket, ruta)
+    if destino is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    
+    return FileResponse(destino)
@@ -0,0 +1,109 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from datetime import date
+
+from app.models import TokenData
+from app.auth import get_current_admin
+from app.respuestas import RespuestaJSON, RutaJSON
+from app.services.analitica import (
+    PERIODOS,
+    DIMENSIONES,
+    cursor_actividad,
+    pagina_actividades,
+    horas_por_periodo,
+    exportar_csv,
+    exportar_parquet,
+    parquet_disponible,
+)
+
+router = APIRouter(prefix="/api/analitica", tags=["Analítica"], route_class=RutaJSON)
+
+
+def validar_rango(desde: date, hasta: date):
+    if desde > hasta:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'desde' debe ser anterior o igual a 'hasta'"
+        )
+
+
+@router.get("/horas")
+async def horas_agregadas(
+    desde: date,
+    hasta: date,
+    periodo: str = Query("semana", description="semana | mes"),
+    por: str = Query("empleado", description="empleado | proyecto | ubicacion"),
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """
+    Horas por periodo y por empleado, proyecto o ubicación en un rango de
+    varios años, en columnas (periodos, claves, nombres, horas, dias,
+    empleados). Los periodos se toman completos (admin)
+    """
+    validar_rango(desde, hasta)
+    if periodo not in PERIODOS:
+        raise HTTPException(status_code=400, detail="periodo debe ser 'semana' o 'mes'")
+    if por not in DIMENSIONES:
+        raise HTTPException(status_code=400, detail="por debe ser 'empleado', 'proyecto' o 'ubicacion'")
+
+    # Columnas de varios años: directo a orjson, sin jsonable_encoder
+    return RespuestaJSON(await horas_por_periodo(desde, hasta, periodo, por))
+
+
+@router.get("/actividades")
+async def actividades_por_rango(
+    desde: date,
+    hasta: date,
+    limit: int = Query(1000, ge=1, le=1000),
+    after: Optional[str] = None,
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """
+    Actividades del rango ordenadas por fecha, paginadas por cursor: pasar
+    `siguiente` como `after` hasta que regrese null (admin)
+    """
+    validar_rango(desde, hasta)
+    datos = await pagina_actividades(desde, hasta, after, limit)
+
+    return RespuestaJSON({
+        "datos": datos,
+        "siguiente": cursor_actividad(datos[-1]) if len(datos) == limit else None,
+    })
+
+
+@router.get("/actividades/exportar")
+async def exportar_actividades(
+    desde: date,
+    hasta: date,
+    formato: str = Query("csv", description="csv | parquet"),
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """Descarga todas las actividades del rango en CSV o Parquet, sin armarlas en memoria (admin)"""
+    validar_rango(desde, hasta)
+    nombre_archivo = f"Actividades_{desde.isoformat()}_{hasta.isoformat()}"
+
+    if formato == "csv":
+        return StreamingResponse(
+            exportar_csv(desde, hasta),
+            media_type="text/csv; charset=utf-8",
+            headers={
+                "Content-Disposition": f"attachment; filename={nombre_archivo}.csv"
+            }
+        )
+
+    if formato == "parquet":
+        if not parquet_disponible():
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="La exportación a Parquet requiere instalar pyarrow en el servidor"
+            )
+        return StreamingResponse(
+            exportar_parquet(desde, hasta),
+            media_type="application/vnd.apache.parquet",
+            headers={
+                "Content-Disposition": f"attachment; filename={nombre_archivo}.parquet"
+            }
+        )
+
+    raise HTTPException(status_code=400, detail="formato debe ser 'csv' o 'parquet'")
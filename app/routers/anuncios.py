@@ -1,14 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File, Form
 from typing import List, Optional
 from datetime import date
+import time
 import uuid
 import base64
 
-from app.database import supabase
+from app.config import get_settings
+from app.database import supabase, ejecutar
 from app.models import TokenData
 from app.auth import get_current_user, get_current_admin
+from app.paginacion import Paginacion, paginacion, paginar_consulta
+from app.services.invalidaciones import publicar_invalidacion, suscribir
+from app.respuestas import RutaJSON
 
-router = APIRouter(prefix="/api/anuncios", tags=["Anuncios"])
+router = APIRouter(prefix="/api/anuncios", tags=["Anuncios"], route_class=RutaJSON)
+settings = get_settings()
+
+# Anuncios activos del dashboard (se piden en cada carga de página). Se
+# invalidan al escribir, en todos los workers, y al cambiar el día.
+_activos_cache = {"fecha": None, "datos": None, "cargado": 0.0, "version": 0}
+
+
+def _descartar_activos(_clave: Optional[str] = None):
+    _activos_cache["datos"] = None
+    _activos_cache["version"] += 1
+
+
+suscribir("anuncios", _descartar_activos)
 
 
 @router.get("/activos")
@@ -17,8 +35,17 @@ async def obtener_anuncios_activos(current_user: TokenData = Depends(get_current
     
     today = date.today().isoformat()
     
+    if (
+        _activos_cache["datos"] is not None
+        and _activos_cache["fecha"] == today
+        and time.monotonic() - _activos_cache["cargado"] < settings.anuncios_cache_ttl
+    ):
+        return _activos_cache["datos"]
+    
+    version = _activos_cache["version"]
+    
     # Obtener anuncios activos dentro del rango de fechas
-    result = supabase.table("anuncios").select("*").eq("activo", True).lte("fecha_inicio", today).order("orden").order("prioridad", desc=True).execute()
+    result = await ejecutar(supabase.table("anuncios").select("*").eq("activo", True).lte("fecha_inicio", today).order("orden").order("prioridad", desc=True))
     
     # Filtrar los que ya expiraron
     anuncios = []
@@ -29,24 +56,34 @@ async def obtener_anuncios_activos(current_user: TokenData = Depends(get_current
         else:
             anuncios.append(anuncio)
     
+    # Si hubo una escritura durante la consulta no se guarda el resultado
+    if _activos_cache["version"] == version:
+        _activos_cache.update(fecha=today, datos=anuncios, cargado=time.monotonic())
+    
     return anuncios
 
 
 @router.get("/")
 async def listar_anuncios(
+    response: Response,
     activo: Optional[bool] = None,
+    pagina: Paginacion = Depends(paginacion()),
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Listar todos los anuncios (admin)"""
     
-    query = supabase.table("anuncios").select("*")
-    
-    if activo is not None:
-        query = query.eq("activo", activo)
+    def consulta(columnas: str, **opciones):
+        query = supabase.table("anuncios").select(columnas, **opciones)
+        if activo is not None:
+            query = query.eq("activo", activo)
+        return query
     
-    result = query.order("orden").order("created_at", desc=True).execute()
+    anuncios = await paginar_consulta(
+        response, pagina, consulta,
+        orden=[("orden", False), ("created_at", True), ("id", False)]
+    )
     
-    return result.data
+    return pagina.proyectar(anuncios)
 
 
 @router.get("/{anuncio_id}")
@@ -142,6 +179,8 @@ async def crear_anuncio(
             detail="Error al crear anuncio"
         )
     
+    await publicar_invalidacion("anuncios")
+    
     return result.data[0]
 
 
@@ -239,6 +278,8 @@ async def crear_anuncio_base64(
             detail="Error al crear anuncio"
         )
     
+    await publicar_invalidacion("anuncios")
+    
     return result.data[0]
 
 
@@ -268,6 +309,8 @@ async def actualizar_anuncio(
             detail="Anuncio no encontrado"
         )
     
+    await publicar_invalidacion("anuncios")
+    
     return result.data[0]
 
 
@@ -340,6 +383,8 @@ async def actualizar_imagen_anuncio(
     except:
         pass
     
+    await publicar_invalidacion("anuncios")
+    
     return result.data[0]
 
 
@@ -361,6 +406,7 @@ async def eliminar_anuncio(
     
     # Eliminar de la base de datos
     supabase.table("anuncios").delete().eq("id", anuncio_id).execute()
+    await publicar_invalidacion("anuncios")
     
     # Intentar eliminar imagen del storage
     try:
@@ -386,4 +432,6 @@ async def reordenar_anuncios(
     for index, anuncio_id in enumerate(orden_ids):
         supabase.table("anuncios").update({"orden": index}).eq("id", anuncio_id).execute()
     
+    await publicar_invalidacion("anuncios")
+    
     return {"message": "Orden actualizado"}
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException, status, Response, Request
 from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import timedelta
 from pydantic import BaseModel, EmailStr
+import asyncio
+import math
 
-from app.database import supabase
+from app.database import supabase, get_client, ejecutar
 from app.models import LoginRequest, Token
 from app.auth import (
     verify_password, 
@@ -12,8 +15,10 @@ from app.auth import (
     get_password_hash
 )
 from app.config import settings
+from app.services.login import consumir_intento, es_desconocido, recordar_desconocido
+from app.respuestas import RutaJSON
 
-router = APIRouter(prefix="/auth", tags=["Autenticación"])
+router = APIRouter(prefix="/auth", tags=["Autenticación"], route_class=RutaJSON)
 
 
 class RecuperarPasswordRequest(BaseModel):
@@ -25,32 +30,60 @@ class ActualizarPasswordRequest(BaseModel):
     access_token: str
 
 
+def _iniciar_sesion_supabase(email: str, password: str):
+    """Verifica la contraseña con Supabase Auth (cliente dedicado, sin sesión compartida)"""
+    return get_client("auth").auth.sign_in_with_password({
+        "email": email,
+        "password": password
+    })
+
+
 @router.post("/login", response_model=Token)
-async def login(response: Response, login_data: LoginRequest):
+async def login(request: Request, response: Response, login_data: LoginRequest):
     """Iniciar sesión y obtener token"""
     
-    # Buscar empleado por email
-    result = supabase.table("empleados").select("*").eq("email", login_data.email).eq("activo", True).execute()
+    credenciales_incorrectas = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Credenciales incorrectas"
+    )
     
-    if not result.data:
+    # Límite de intentos por IP
+    espera = consumir_intento(request.client.host if request.client else "desconocida")
+    if espera is not None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Credenciales incorrectas"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos de inicio de sesión, espera un momento",
+            headers={"Retry-After": str(math.ceil(espera))}
         )
     
-    empleado = result.data[0]
+    # Correo que hace poco no correspondía a ningún empleado activo
+    if es_desconocido(login_data.email):
+        raise credenciales_incorrectas
+    
+    # Buscar al empleado y verificar la contraseña al mismo tiempo
+    busqueda, autenticacion = await asyncio.gather(
+        ejecutar(
+            supabase.table("empleados").select("id, email, es_admin, rol, puesto_id")
+            .eq("email", login_data.email).eq("activo", True)
+        ),
+        run_in_threadpool(_iniciar_sesion_supabase, login_data.email, login_data.password),
+        return_exceptions=True
+    )
     
-    # Verificar con Supabase Auth
-    try:
-        auth_response = supabase.auth.sign_in_with_password({
-            "email": login_data.email,
-            "password": login_data.password
-        })
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Credenciales incorrectas"
-        )
+    if isinstance(busqueda, Exception):
+        raise busqueda
+    
+    if not busqueda.data:
+        # Sólo se recuerda si tampoco hubo sesión: un correo con cuenta válida
+        # no debe quedar bloqueado por intentos de otros
+        if isinstance(autenticacion, Exception):
+            recordar_desconocido(login_data.email)
+        raise credenciales_incorrectas
+    
+    if isinstance(autenticacion, Exception):
+        raise credenciales_incorrectas
+    
+    empleado = busqueda.data[0]
     
     # Crear token propio para la aplicación
     access_token = create_access_token(
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from pydantic import TypeAdapter
+from typing import Any, List
 
-from app.database import supabase, get_admin_client
+from app.database import supabase, get_admin_client, ejecutar
 from app.models import (
     Puesto, PuestoBase,
     Supervisor, SupervisorBase,
@@ -10,8 +11,33 @@ from app.models import (
     TokenData
 )
 from app.auth import get_current_user, get_current_admin
+from app.services.catalogos_cache import (
+    obtener_catalogo, invalidar_catalogo, etag_coincide, registrar_no_modificada
+)
+from app.respuestas import RutaJSON
+
+router = APIRouter(prefix="/api/catalogos", tags=["Catálogos"], route_class=RutaJSON)
+
+
+async def _listar_catalogo(request: Request, tabla: str, modelo: Any, cliente=None) -> Response:
+    """
+    Responde el catálogo activo desde la caché con su ETag; si el navegador ya
+    tiene esa versión (If-None-Match) responde 304 sin cuerpo.
+    """
+    adaptador = TypeAdapter(List[modelo])
 
-router = APIRouter(prefix="/api/catalogos", tags=["Catálogos"])
+    async def cargar() -> bytes:
+        result = await ejecutar((cliente or supabase).table(tabla).select("*").eq("activo", True).order("nombre"))
+        return adaptador.dump_json(adaptador.validate_python(result.data))
+
+    catalogo = await obtener_catalogo(tabla, cargar)
+    # no-cache: el navegador guarda la respuesta pero revalida siempre con el ETag
+    encabezados = {"ETag": catalogo["etag"], "Cache-Control": "private, no-cache"}
+
+    if etag_coincide(request.headers.get("if-none-match"), catalogo["etag"]):
+        registrar_no_modificada()
+        return Response(status_code=304, headers=encabezados)
+    return Response(content=catalogo["cuerpo"], media_type="application/json", headers=encabezados)
 
 
 # ===========================================
@@ -19,10 +45,9 @@ router = APIRouter(prefix="/api/catalogos", tags=["Catálogos"])
 # ===========================================
 
 @router.get("/puestos", response_model=List[Puesto])
-async def listar_puestos(current_user: TokenData = Depends(get_current_user)):
+async def listar_puestos(request: Request, current_user: TokenData = Depends(get_current_user)):
     """Listar todos los puestos activos"""
-    result = supabase.table("puestos").select("*").eq("activo", True).order("nombre").execute()
-    return result.data
+    return await _listar_catalogo(request, "puestos", Puesto)
 
 
 @router.post("/puestos", response_model=Puesto, status_code=status.HTTP_201_CREATED)
@@ -32,6 +57,7 @@ async def crear_puesto(
 ):
     """Crear un nuevo puesto (solo admin)"""
     result = supabase.table("puestos").insert(puesto.model_dump()).execute()
+    await invalidar_catalogo("puestos")
     return result.data[0]
 
 
@@ -45,6 +71,7 @@ async def actualizar_puesto(
     result = supabase.table("puestos").update(puesto.model_dump()).eq("id", puesto_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Puesto no encontrado")
+    await invalidar_catalogo("puestos")
     return result.data[0]
 
 
@@ -57,6 +84,7 @@ async def eliminar_puesto(
     result = supabase.table("puestos").update({"activo": False}).eq("id", puesto_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Puesto no encontrado")
+    await invalidar_catalogo("puestos")
     return {"message": "Puesto desactivado"}
 
 
@@ -65,10 +93,9 @@ async def eliminar_puesto(
 # ===========================================
 
 @router.get("/supervisores", response_model=List[Supervisor])
-async def listar_supervisores(current_user: TokenData = Depends(get_current_user)):
+async def listar_supervisores(request: Request, current_user: TokenData = Depends(get_current_user)):
     """Listar todos los supervisores activos"""
-    result = supabase.table("supervisores").select("*").eq("activo", True).order("nombre").execute()
-    return result.data
+    return await _listar_catalogo(request, "supervisores", Supervisor)
 
 
 @router.post("/supervisores", response_model=Supervisor, status_code=status.HTTP_201_CREATED)
@@ -78,6 +105,7 @@ async def crear_supervisor(
 ):
     """Crear un nuevo supervisor (solo admin)"""
     result = supabase.table("supervisores").insert(supervisor.model_dump()).execute()
+    await invalidar_catalogo("supervisores")
     return result.data[0]
 
 
@@ -91,6 +119,7 @@ async def actualizar_supervisor(
     result = supabase.table("supervisores").update(supervisor.model_dump()).eq("id", supervisor_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Supervisor no encontrado")
+    await invalidar_catalogo("supervisores")
     return result.data[0]
 
 
@@ -103,6 +132,7 @@ async def eliminar_supervisor(
     result = supabase.table("supervisores").update({"activo": False}).eq("id", supervisor_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Supervisor no encontrado")
+    await invalidar_catalogo("supervisores")
     return {"message": "Supervisor desactivado"}
 
 
@@ -111,10 +141,9 @@ async def eliminar_supervisor(
 # ===========================================
 
 @router.get("/ubicaciones", response_model=List[Ubicacion])
-async def listar_ubicaciones(current_user: TokenData = Depends(get_current_user)):
+async def listar_ubicaciones(request: Request, current_user: TokenData = Depends(get_current_user)):
     """Listar todas las ubicaciones activas"""
-    result = supabase.table("ubicaciones").select("*").eq("activo", True).order("nombre").execute()
-    return result.data
+    return await _listar_catalogo(request, "ubicaciones", Ubicacion)
 
 
 @router.post("/ubicaciones", response_model=Ubicacion, status_code=status.HTTP_201_CREATED)
@@ -124,6 +153,7 @@ async def crear_ubicacion(
 ):
     """Crear una nueva ubicación (solo admin)"""
     result = supabase.table("ubicaciones").insert(ubicacion.model_dump()).execute()
+    await invalidar_catalogo("ubicaciones")
     return result.data[0]
 
 
@@ -137,6 +167,7 @@ async def actualizar_ubicacion(
     result = supabase.table("ubicaciones").update(ubicacion.model_dump()).eq("id", ubicacion_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Ubicación no encontrada")
+    await invalidar_catalogo("ubicaciones")
     return result.data[0]
 
 
@@ -149,6 +180,7 @@ async def eliminar_ubicacion(
     result = supabase.table("ubicaciones").update({"activo": False}).eq("id", ubicacion_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Ubicación no encontrada")
+    await invalidar_catalogo("ubicaciones")
     return {"message": "Ubicación desactivada"}
 
 
@@ -157,10 +189,9 @@ async def eliminar_ubicacion(
 # ===========================================
 
 @router.get("/proyectos", response_model=List[Proyecto])
-async def listar_proyectos(current_user: TokenData = Depends(get_current_user)):
+async def listar_proyectos(request: Request, current_user: TokenData = Depends(get_current_user)):
     """Listar todos los proyectos activos"""
-    result = supabase.table("proyectos").select("*").eq("activo", True).order("nombre").execute()
-    return result.data
+    return await _listar_catalogo(request, "proyectos", Proyecto)
 
 
 @router.post("/proyectos", response_model=Proyecto, status_code=status.HTTP_201_CREATED)
@@ -170,6 +201,7 @@ async def crear_proyecto(
 ):
     """Crear un nuevo proyecto (solo admin)"""
     result = supabase.table("proyectos").insert(proyecto.model_dump()).execute()
+    await invalidar_catalogo("proyectos")
     return result.data[0]
 
 
@@ -183,6 +215,7 @@ async def actualizar_proyecto(
     result = supabase.table("proyectos").update(proyecto.model_dump()).eq("id", proyecto_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    await invalidar_catalogo("proyectos")
     return result.data[0]
 
 
@@ -195,6 +228,7 @@ async def eliminar_proyecto(
     result = supabase.table("proyectos").update({"activo": False}).eq("id", proyecto_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    await invalidar_catalogo("proyectos")
     return {"message": "Proyecto desactivado"}
 
 
@@ -203,11 +237,9 @@ async def eliminar_proyecto(
 # ===========================================
 
 @router.get("/marcas")
-async def listar_marcas(current_user: TokenData = Depends(get_current_user)):
+async def listar_marcas(request: Request, current_user: TokenData = Depends(get_current_user)):
     """Listar todas las marcas activas"""
-    admin_client = get_admin_client()
-    result = admin_client.table("marcas").select("*").eq("activo", True).order("nombre").execute()
-    return result.data
+    return await _listar_catalogo(request, "marcas", dict, get_admin_client())
 
 
 @router.post("/marcas", status_code=status.HTTP_201_CREATED)
@@ -218,6 +250,7 @@ async def crear_marca(
     """Crear una nueva marca (solo admin)"""
     admin_client = get_admin_client()
     result = admin_client.table("marcas").insert({"nombre": marca.get("nombre")}).execute()
+    await invalidar_catalogo("marcas")
     return result.data[0]
 
 
@@ -232,6 +265,7 @@ async def actualizar_marca(
     result = admin_client.table("marcas").update({"nombre": marca.get("nombre")}).eq("id", marca_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Marca no encontrada")
+    await invalidar_catalogo("marcas")
     return result.data[0]
 
 
@@ -245,4 +279,5 @@ async def eliminar_marca(
     result = admin_client.table("marcas").update({"activo": False}).eq("id", marca_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Marca no encontrada")
+    await invalidar_catalogo("marcas")
     return {"message": "Marca desactivada"}
@@ -1,11 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from pydantic import BaseModel, EmailStr
 from app.database import supabase, get_admin_client
 from app.auth import get_current_admin
 from app.config import get_settings
+from app.services.email_service import estadisticas_smtp
+from app.services.cola_correos import estadisticas_cola, listar_correos, reintentar_correo, purgar_enviados
+from app.respuestas import RutaJSON
 
-router = APIRouter(prefix="/api/correos", tags=["correos"])
+router = APIRouter(prefix="/api/correos", tags=["correos"], route_class=RutaJSON)
 admin_client = get_admin_client()
 settings = get_settings()
 
@@ -64,6 +68,43 @@ async def obtener_configuracion_smtp(current_user: dict = Depends(get_current_ad
     }
 
 
+@router.get("/estadisticas")
+async def obtener_estadisticas_smtp(current_user: dict = Depends(get_current_admin)):
+    """Uso del pool de conexiones SMTP y throughput por conexión"""
+    return estadisticas_smtp()
+
+
+# ========================================
+# ENDPOINTS - COLA DE ENVÍO
+# ========================================
+@router.get("/cola")
+async def obtener_cola_correos(
+    estado: str = "muerto",
+    limite: int = 100,
+    current_user: dict = Depends(get_current_admin)
+):
+    """Resumen de la cola de envío y los correos en un estado (por defecto los que ya no se reintentan)"""
+    # SQLite puede esperar el candado de otro proceso: fuera del event loop
+    return {
+        **await run_in_threadpool(estadisticas_cola),
+        "correos": await run_in_threadpool(listar_correos, estado=estado, limite=min(limite, 500))
+    }
+
+
+@router.post("/cola/{correo_id}/reintentar")
+async def reintentar_correo_cola(correo_id: int, current_user: dict = Depends(get_current_admin)):
+    """Regresa a la cola un correo descartado"""
+    if not await run_in_threadpool(reintentar_correo, correo_id):
+        raise HTTPException(status_code=404, detail="Correo no encontrado o no está descartado")
+    return {"message": "Correo regresado a la cola"}
+
+
+@router.delete("/cola/enviados")
+async def purgar_correos_enviados(dias: int = 7, current_user: dict = Depends(get_current_admin)):
+    """Elimina de la cola los correos enviados hace más de `dias` días"""
+    return {"eliminados": await run_in_threadpool(purgar_enviados, dias)}
+
+
 @router.post("/prueba")
 async def enviar_correo_prueba(
     datos: CorreoPrueba,
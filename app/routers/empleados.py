@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File
 from typing import List
+import hashlib
 import uuid
 
 from app.database import supabase, get_admin_client
@@ -11,40 +12,41 @@ from app.models import (
     TokenData
 )
 from app.auth import get_current_user, get_current_admin, get_password_hash, get_inventario_user
+from app.paginacion import Paginacion, paginacion, modelo_parcial, paginar_lista
+from app.services.invalidaciones import publicar_invalidacion
+from app.services import directorio_empleados
+from app.respuestas import RutaJSON
 
-router = APIRouter(prefix="/api/empleados", tags=["Empleados"])
+router = APIRouter(prefix="/api/empleados", tags=["Empleados"], route_class=RutaJSON)
 
 
 @router.get("/me", response_model=EmpleadoCompleto)
 async def get_mi_perfil(current_user: TokenData = Depends(get_current_user)):
     """Obtener perfil del usuario actual"""
     
-    result = supabase.table("v_empleados_completo").select("*").eq("id", current_user.user_id).execute()
+    empleado = await directorio_empleados.obtener_empleado(current_user.user_id)
     
-    if not result.data:
+    if not empleado:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Empleado no encontrado"
         )
     
-    return result.data[0]
+    return empleado
 
 
-@router.get("/", response_model=List[EmpleadoCompleto])
+@router.get("/", response_model=List[modelo_parcial(EmpleadoCompleto)], response_model_exclude_unset=True)
 async def listar_empleados(
+    response: Response,
     activo: bool = True,
+    pagina: Paginacion = Depends(paginacion(EmpleadoCompleto)),
     current_user: TokenData = Depends(get_inventario_user)
 ):
     """Listar todos los empleados (admin o inventario)"""
     
-    query = supabase.table("v_empleados_completo").select("*")
-    
-    if activo is not None:
-        query = query.eq("activo", activo)
+    empleados = await directorio_empleados.listar_empleados(activo=activo)
     
-    result = query.order("nombre_completo").execute()
-    
-    return result.data
+    return paginar_lista(response, pagina, empleados, directorio_empleados.clave_orden)
 
 
 @router.get("/{empleado_id}", response_model=EmpleadoCompleto)
@@ -54,15 +56,15 @@ async def obtener_empleado(
 ):
     """Obtener un empleado por ID (solo admin)"""
     
-    result = supabase.table("v_empleados_completo").select("*").eq("id", empleado_id).execute()
+    empleado = await directorio_empleados.obtener_empleado(empleado_id)
     
-    if not result.data:
+    if not empleado:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Empleado no encontrado"
         )
     
-    return result.data[0]
+    return empleado
 
 
 @router.post("/", response_model=Empleado, status_code=status.HTTP_201_CREATED)
@@ -147,6 +149,7 @@ async def crear_empleado(
                 detail="Error al crear empleado en la base de datos"
             )
         
+        await publicar_invalidacion(f"empleados:{result.data[0]['id']}")
         return result.data[0]
     except Exception as e:
         # Si falla la inserción en la tabla, no eliminamos el usuario de Auth
@@ -203,6 +206,8 @@ async def actualizar_empleado(
             detail="Empleado no encontrado"
         )
     
+    await publicar_invalidacion(f"empleados:{empleado_id}")
+    
     return result.data[0]
 
 
@@ -221,6 +226,8 @@ async def desactivar_empleado(
             detail="Empleado no encontrado"
         )
     
+    await publicar_invalidacion(f"empleados:{empleado_id}")
+    
     return {"message": "Empleado desactivado correctamente"}
 
 
@@ -335,14 +342,21 @@ async def subir_firma(
             {"content-type": firma.content_type, "upsert": "true"}
         )
         
-        # Obtener URL pública
-        firma_url = admin_client.storage.from_("firmas").get_public_url(filename)
+        # URL pública con la versión del contenido: la ruta en Storage es la
+        # misma en cada subida, así que sin ?v= las cachés de firmas de los
+        # procesos de render (y de otros workers) seguirían con la anterior
+        firma_url = admin_client.storage.from_("firmas").get_public_url(filename).rstrip("?")
+        separador = "&" if "?" in firma_url else "?"
+        firma_url = f"{firma_url}{separador}v={hashlib.sha256(contents).hexdigest()[:16]}"
         
         # Guardar URL en la tabla empleados
         supabase.table("empleados").update({
             "firma_url": firma_url
         }).eq("id", current_user.user_id).execute()
         
+        # También descarta sus reportes en caché (reportes_cache se suscribe a "empleados")
+        await publicar_invalidacion(f"empleados:{current_user.user_id}")
+        
         return {"message": "Firma subida correctamente", "firma_url": firma_url}
         
     except Exception as e:
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from typing import List, Optional
 from datetime import date
 from app.database import supabase, get_admin_client
 from app.auth import get_current_user, get_current_admin, get_inventario_user
+from app.paginacion import Paginacion, paginacion, paginar_consulta, formato_flujo, transmitir_consulta
 from app.models import (
     EquipoCreate, EquipoUpdate, Equipo, EquipoCompleto,
     AsignacionEquipo, EstadoEquipo, TipoEquipo
 )
+from app.services import directorio_empleados
+from app.respuestas import RutaJSON
 
-router = APIRouter(prefix="/api/inventario", tags=["inventario"])
+router = APIRouter(prefix="/api/inventario", tags=["inventario"], route_class=RutaJSON)
 
 # Cliente admin para operaciones de escritura (bypass RLS)
 admin_client = get_admin_client()
@@ -16,37 +19,46 @@ admin_client = get_admin_client()
 
 @router.get("/", response_model=List[dict])
 async def listar_equipos(
+    response: Response,
     tipo: Optional[TipoEquipo] = None,
     estado: Optional[EstadoEquipo] = None,
     empleado_id: Optional[str] = None,
+    pagina: Paginacion = Depends(paginacion()),
+    flujo: Optional[str] = Depends(formato_flujo),
     current_user: dict = Depends(get_inventario_user)
 ):
-    """Lista todos los equipos con filtros opcionales"""
-    query = admin_client.table("equipos").select(
-        "*, empleados(nombre, apellidos), marcas(nombre)"
-    ).order("created_at", desc=True)
+    """Lista todos los equipos con filtros opcionales. Con ?formato=ndjson se transmite en flujo"""
+    def consulta(columnas: str, **opciones):
+        query = admin_client.table("equipos").select(columnas, **opciones)
+        if tipo:
+            query = query.eq("tipo", tipo.value)
+        if estado:
+            query = query.eq("estado", estado.value)
+        if empleado_id:
+            query = query.eq("empleado_id", empleado_id)
+        return query
     
-    if tipo:
-        query = query.eq("tipo", tipo.value)
-    if estado:
-        query = query.eq("estado", estado.value)
-    if empleado_id:
-        query = query.eq("empleado_id", empleado_id)
+    orden = [("created_at", True), ("id", True)]
+    derivados = {"empleado_nombre": "empleados(nombre, apellidos)", "marca": "marcas(nombre)"}
+    if flujo:
+        return await transmitir_consulta(flujo, pagina, consulta, orden, derivados, transformar=_formatear_equipo)
     
-    response = query.execute()
+    filas = await paginar_consulta(response, pagina, consulta, orden, derivados)
     
-    print(f"[DEBUG] Equipos encontrados: {len(response.data)}")
+    print(f"[DEBUG] Equipos encontrados: {len(filas)}")
     
-    # Formatear respuesta con nombre del empleado y marca
-    equipos = []
-    for eq in response.data:
-        empleado = eq.pop("empleados", None)
-        marca_obj = eq.pop("marcas", None)
-        eq["empleado_nombre"] = f"{empleado['nombre']} {empleado['apellidos']}" if empleado else None
-        eq["marca"] = marca_obj["nombre"] if marca_obj else None
-        equipos.append(eq)
+    equipos = [_formatear_equipo(eq) for eq in filas]
     
-    return equipos
+    return pagina.proyectar(equipos)
+
+
+def _formatear_equipo(eq: dict) -> dict:
+    """Formatear respuesta con nombre del empleado y marca"""
+    empleado = eq.pop("empleados", None)
+    marca_obj = eq.pop("marcas", None)
+    eq["empleado_nombre"] = f"{empleado['nombre']} {empleado['apellidos']}" if empleado else None
+    eq["marca"] = marca_obj["nombre"] if marca_obj else None
+    return eq
 
 
 @router.get("/disponibles", response_model=List[dict])
@@ -308,20 +320,27 @@ async def desasignar_equipo(
 @router.get("/{equipo_id}/historial")
 async def obtener_historial_equipo(
     equipo_id: str,
+    response: Response,
+    pagina: Paginacion = Depends(paginacion()),
     current_user: dict = Depends(get_inventario_user)
 ):
     """Obtiene el historial de asignaciones de un equipo"""
-    response = admin_client.table("historial_equipos").select(
-        "*, empleados(nombre, apellidos)"
-    ).eq("equipo_id", equipo_id).order("fecha_asignacion", desc=True).execute()
+    def consulta(columnas: str, **opciones):
+        return admin_client.table("historial_equipos").select(columnas, **opciones).eq("equipo_id", equipo_id)
+    
+    filas = await paginar_consulta(
+        response, pagina, consulta,
+        orden=[("fecha_asignacion", True), ("id", True)],
+        derivados={"empleado_nombre": "empleados(nombre, apellidos)"}
+    )
     
     historial = []
-    for h in response.data:
+    for h in filas:
         empleado = h.pop("empleados", None)
         h["empleado_nombre"] = f"{empleado['nombre']} {empleado['apellidos']}" if empleado else None
         historial.append(h)
     
-    return historial
+    return pagina.proyectar(historial)
 
 
 @router.get("/empleado/{empleado_id}/equipos")
@@ -372,8 +391,9 @@ async def eliminar_equipo(
 # ========================================
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.services.pdf_generator import generar_responsiva_equipo
-from app.services.email_service import enviar_correo
+from io import BytesIO
+from app.services.pdf_executor import renderizar_pdf
+from app.services.cola_correos import encolar_correo_async
 
 
 class DatosResponsiva(BaseModel):
@@ -407,20 +427,20 @@ async def generar_responsiva(
         raise HTTPException(status_code=400, detail="El equipo no está asignado a ningún empleado")
     
     # Obtener datos del empleado
-    empleado_result = admin_client.table("v_empleados_completo").select("*").eq("id", equipo["empleado_id"]).execute()
+    empleado = await directorio_empleados.obtener_empleado(equipo["empleado_id"])
     
-    if not empleado_result.data:
+    if not empleado:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
     
-    empleado = empleado_result.data[0]
-    
-    # Generar PDF
-    pdf_buffer = generar_responsiva_equipo(
+    # Generar PDF en el pool de procesos
+    pdf_bytes = await renderizar_pdf(
+        "responsiva",
         empleado=empleado,
         equipo=equipo,
         datos_responsiva=datos.model_dump(),
         nombre_entrega=datos.nombre_entrega
     )
+    pdf_buffer = BytesIO(pdf_bytes)
     
     # Nombre del archivo
     nombre_archivo = f"Responsiva_{empleado['nombre']}_{empleado['apellidos']}_{date.today().year}.pdf"
@@ -453,20 +473,19 @@ async def enviar_responsiva_correo(
         raise HTTPException(status_code=400, detail="El equipo no está asignado a ningún empleado")
     
     # Obtener datos del empleado
-    empleado_result = admin_client.table("v_empleados_completo").select("*").eq("id", equipo["empleado_id"]).execute()
+    empleado = await directorio_empleados.obtener_empleado(equipo["empleado_id"])
     
-    if not empleado_result.data:
+    if not empleado:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
     
-    empleado = empleado_result.data[0]
-    
     # Obtener email del admin actual
     admin_result = admin_client.table("empleados").select("email, nombre, apellidos").eq("id", current_user.user_id).execute()
     admin_email = admin_result.data[0]["email"] if admin_result.data else None
     admin_nombre = f"{admin_result.data[0]['nombre']} {admin_result.data[0]['apellidos']}" if admin_result.data else "Administrador"
     
-    # Generar PDF
-    pdf_buffer = generar_responsiva_equipo(
+    # Generar PDF en el pool de procesos
+    pdf_bytes = await renderizar_pdf(
+        "responsiva",
         empleado=empleado,
         equipo=equipo,
         datos_responsiva=datos.model_dump(),
@@ -530,39 +549,32 @@ async def enviar_responsiva_correo(
     </html>
     """
     
-    # Enviar correos
+    # Encolar correos (se envían en segundo plano con el PDF adjunto)
+    nombre_archivo = f"Responsiva_{nombre_completo.replace(' ', '_')}_{date.today().year}.pdf"
     resultados = {"empleado": None, "admin": None}
     
     # Al empleado
     if empleado.get("email"):
-        resultado_emp = enviar_correo_con_adjunto(
+        resultados["empleado"] = await encolar_correo_async(
+            "correo_adjunto",
             destinatario=empleado["email"],
             asunto=asunto,
             contenido_html=contenido_html,
-            pdf_buffer=pdf_buffer,
-            nombre_archivo=f"Responsiva_{nombre_completo.replace(' ', '_')}_{date.today().year}.pdf"
+            adjunto=pdf_bytes,
+            nombre_archivo=nombre_archivo
         )
-        resultados["empleado"] = resultado_emp
-    
-    # Regenerar buffer para el admin
-    pdf_buffer_admin = generar_responsiva_equipo(
-        empleado=empleado,
-        equipo=equipo,
-        datos_responsiva=datos.model_dump(),
-        nombre_entrega=datos.nombre_entrega
-    )
     
     # Al admin
     if admin_email:
-        resultado_admin = enviar_correo_con_adjunto(
+        resultados["admin"] = await encolar_correo_async(
+            "correo_adjunto",
             destinatario=admin_email,
             asunto=f"[Copia] {asunto}",
             contenido_html=contenido_html.replace(f"Hola <strong>{empleado['nombre']}</strong>", 
                                                    f"Hola <strong>{admin_nombre}</strong> (copia de responsiva enviada a {nombre_completo})"),
-            pdf_buffer=pdf_buffer_admin,
-            nombre_archivo=f"Responsiva_{nombre_completo.replace(' ', '_')}_{date.today().year}.pdf"
+            adjunto=pdf_bytes,
+            nombre_archivo=nombre_archivo
         )
-        resultados["admin"] = resultado_admin
     
     return {
         "message": "Responsiva enviada correctamente",
@@ -570,50 +582,3 @@ async def enviar_responsiva_correo(
         "enviado_a_admin": admin_email,
         "resultados": resultados
     }
-
-
-def enviar_correo_con_adjunto(destinatario: str, asunto: str, contenido_html: str, pdf_buffer, nombre_archivo: str):
-    """Envía un correo con un PDF adjunto"""
-    import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.application import MIMEApplication
-    from app.config import get_settings
-    
-    settings = get_settings()
-    
-    if not settings.smtp_user or not settings.smtp_password:
-        return {"success": True, "simulated": True, "message": "Email simulado - sin credenciales SMTP"}
-    
-    try:
-        mensaje = MIMEMultipart()
-        mensaje["Subject"] = asunto
-        mensaje["From"] = f"{settings.email_from_name} <{settings.email_from}>"
-        mensaje["To"] = destinatario
-        
-        # Contenido HTML
-        parte_html = MIMEText(contenido_html, "html", "utf-8")
-        mensaje.attach(parte_html)
-        
-        # Adjuntar PDF
-        pdf_buffer.seek(0)
-        adjunto = MIMEApplication(pdf_buffer.read(), _subtype="pdf")
-        adjunto.add_header("Content-Disposition", "attachment", filename=nombre_archivo)
-        mensaje.attach(adjunto)
-        
-        # Enviar
-        if settings.smtp_use_ssl:
-            with smtplib.SMTP_SSL(settings.smtp_host, settings.smtp_port) as server:
-                server.login(settings.smtp_user, settings.smtp_password)
-                server.send_message(mensaje)
-        else:
-            with smtplib.SMTP(settings.smtp_host, settings.smtp_port) as server:
-                server.starttls()
-                server.login(settings.smtp_user, settings.smtp_password)
-                server.send_message(mensaje)
-        
-        return {"success": True, "message": "Email enviado correctamente"}
-        
-    except Exception as e:
-        print(f"[ERROR] Enviando email con adjunto: {str(e)}")
-        return {"success": False, "message": str(e)}
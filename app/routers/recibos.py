@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File, Form
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
 import uuid
 
-from app.database import supabase, get_admin_client
+from app.config import get_settings
+from app.database import supabase, get_admin_client, ejecutar
 from app.models import TokenData
 from app.auth import get_current_user, get_current_admin
-from app.services.email_service import enviar_notificacion_recibo_nomina
+from app.paginacion import Paginacion, paginacion, modelo_parcial, paginar_consulta, formato_flujo, transmitir_consulta
+from app.services.cola_correos import encolar_correo_async
+from app.services.almacenamiento import subir_archivo
+from app.services import directorio_empleados
+from app.services.recibos_jobs import (
+    empleados_por_numero, interpretar_nombre_recibo, recibos_existentes, mensaje_existente, subir_pdf_recibo,
+    crear_job, recibir_archivo, progreso_job, jobs_abiertos, avisar_workers
+)
+from app.respuestas import RutaJSON
 
-router = APIRouter(prefix="/api/recibos", tags=["Recibos de Nómina"])
+router = APIRouter(prefix="/api/recibos", tags=["Recibos de Nómina"], route_class=RutaJSON)
+settings = get_settings()
 
 
 class ReciboNomina(BaseModel):
@@ -27,6 +39,10 @@ class ReciboNomina(BaseModel):
     mes_nombre: Optional[str] = None
 
 
+class JobRecibosCreate(BaseModel):
+    archivos: List[str]
+
+
 class ReciboCreate(BaseModel):
     empleado_id: str
     periodo: str
@@ -55,27 +71,35 @@ async def obtener_mis_recibos(
     return result.data
 
 
-@router.get("/", response_model=List[ReciboNomina])
+@router.get("/", response_model=List[modelo_parcial(ReciboNomina)], response_model_exclude_unset=True)
 async def listar_recibos(
+    response: Response,
     empleado_id: Optional[str] = None,
     anio: Optional[int] = None,
     mes: Optional[int] = None,
+    pagina: Paginacion = Depends(paginacion(ReciboNomina)),
+    flujo: Optional[str] = Depends(formato_flujo),
     current_user: TokenData = Depends(get_current_admin)
 ):
-    """Listar todos los recibos (solo admin)"""
+    """Listar todos los recibos (solo admin). Con ?formato=ndjson se transmite en flujo"""
     
-    query = supabase.table("v_recibos_nomina").select("*")
+    def consulta(columnas: str, **opciones):
+        query = supabase.table("v_recibos_nomina").select(columnas, **opciones)
+        if empleado_id:
+            query = query.eq("empleado_id", empleado_id)
+        if anio:
+            query = query.eq("anio", anio)
+        if mes:
+            query = query.eq("mes", mes)
+        return query
     
-    if empleado_id:
-        query = query.eq("empleado_id", empleado_id)
-    if anio:
-        query = query.eq("anio", anio)
-    if mes:
-        query = query.eq("mes", mes)
+    orden = [("anio", True), ("mes", True), ("periodo", True), ("id", True)]
+    if flujo:
+        return await transmitir_consulta(flujo, pagina, consulta, orden)
     
-    result = query.order("anio", desc=True).order("mes", desc=True).order("periodo", desc=True).execute()
+    recibos = await paginar_consulta(response, pagina, consulta, orden)
     
-    return result.data
+    return pagina.proyectar(recibos)
 
 
 @router.post("/subir")
@@ -112,15 +136,13 @@ async def subir_recibo(
         )
     
     # Verificar que el empleado existe
-    emp_result = supabase.table("empleados").select("id, nombre, apellidos, email").eq("id", empleado_id).execute()
-    if not emp_result.data:
+    empleado = await directorio_empleados.obtener_empleado(empleado_id)
+    if not empleado:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Empleado no encontrado"
         )
     
-    empleado = emp_result.data[0]
-    
     # Verificar si ya existe un recibo para este período
     existing = supabase.table("recibos_nomina").select("id").eq(
         "empleado_id", empleado_id
@@ -133,26 +155,15 @@ async def subir_recibo(
         )
     
     try:
-        # Leer contenido del archivo
-        contenido = await archivo.read()
-        
         # Generar nombre único para el archivo
         periodo_limpio = periodo.replace(' ', '_').replace('ª', 'a')
         nombre_archivo = f"{empleado_id}/{anio}/{mes:02d}_{periodo_limpio}.pdf"
         
-        # Subir a Supabase Storage
-        admin_client = get_admin_client()
-        
-        # Intentar subir el archivo
-        storage_response = admin_client.storage.from_("recibos").upload(
-            nombre_archivo,
-            contenido,
-            {"content-type": "application/pdf"}
+        # Subir a Supabase Storage por bloques desde el archivo temporal
+        archivo_url = await run_in_threadpool(
+            subir_archivo, "recibos", nombre_archivo, archivo.file, "application/pdf"
         )
         
-        # Obtener URL pública (o firmada si el bucket es privado)
-        archivo_url = admin_client.storage.from_("recibos").get_public_url(nombre_archivo)
-        
         # Guardar registro en la base de datos
         recibo_data = {
             "empleado_id": empleado_id,
@@ -173,17 +184,18 @@ async def subir_recibo(
                 detail="Error al guardar el registro del recibo"
             )
         
-        # Enviar notificación por correo al empleado
+        # Encolar notificación por correo al empleado (se envía en segundo plano)
         try:
-            email_result = enviar_notificacion_recibo_nomina(
+            correo_id = await encolar_correo_async(
+                "recibo_nomina",
                 empleado=empleado,
                 periodo=periodo,
                 mes=mes,
                 anio=anio
             )
-            print(f"[EMAIL] Notificación de recibo: {email_result}")
+            print(f"[EMAIL] Notificación de recibo encolada: {correo_id}")
         except Exception as email_error:
-            print(f"[WARNING] No se pudo enviar notificación de recibo: {str(email_error)}")
+            print(f"[WARNING] No se pudo encolar notificación de recibo: {str(email_error)}")
         
         return {
             "message": "Recibo subido exitosamente",
@@ -315,6 +327,11 @@ async def subir_recibos_masivo(
     - 1: Número de quincena (1-24)
     - 356: Número de empleado
     - 753: Otros dígitos (ignorados)
+    
+    La carga se hace por etapas: se validan todos los nombres, se consultan
+    los recibos existentes de esos empleados y períodos, se suben los PDFs a Storage
+    en paralelo (RECIBOS_SUBIDAS_SIMULTANEAS), se insertan todos los
+    registros en un solo INSERT y las notificaciones se encolan.
     """
     
     resultados = {
@@ -323,154 +340,204 @@ async def subir_recibos_masivo(
         "total": len(archivos)
     }
     
+    admin_client = get_admin_client()
+    
     # Obtener todos los empleados con su numero_empleado
-    empleados_result = supabase.table("empleados").select("id, nombre, apellidos, email, numero_empleado").eq("activo", True).execute()
+    empleados_activos = await directorio_empleados.listar_empleados(activo=True)
     
     # Crear diccionario para búsqueda rápida por numero_empleado
-    empleados_por_numero = {}
-    for emp in empleados_result.data:
-        if emp.get('numero_empleado'):
-            empleados_por_numero[emp['numero_empleado'].strip()] = emp
+    empleados = empleados_por_numero(empleados_activos)
     
-    admin_client = get_admin_client()
+    # 1. Validar nombres de archivo (sin tocar la red)
+    pendientes = []
+    en_esta_carga = set()
     
     for archivo in archivos:
         nombre_archivo = archivo.filename
         
         try:
-            # Validar que sea PDF
-            if not nombre_archivo.lower().endswith('.pdf'):
-                resultados["errores"].append({
-                    "archivo": nombre_archivo,
-                    "error": "No es un archivo PDF"
-                })
-                continue
-            
-            # Parsear el nombre del archivo
-            # RE_3107_Quincenal_2026_1_356_753.pdf
-            nombre_sin_extension = nombre_archivo.rsplit('.', 1)[0]
-            partes = nombre_sin_extension.split('_')
-            
-            if len(partes) < 6:
-                resultados["errores"].append({
-                    "archivo": nombre_archivo,
-                    "error": "Formato de nombre inválido. Se esperan al menos 6 partes separadas por '_'"
-                })
-                continue
-            
-            # Extraer datos del nombre
-            anio = int(partes[3])  # Posición 4: año
-            numero_quincena = int(partes[4])  # Posición 5: número de quincena (1-24)
-            numero_empleado = partes[5]  # Posición 6: número de empleado
-            
-            # Calcular mes y período a partir del número de quincena
-            # Quincena 1 = 1ra de Enero, Quincena 2 = 2da de Enero
-            # Quincena 3 = 1ra de Febrero, etc.
-            mes = ((numero_quincena - 1) // 2) + 1
-            es_primera_quincena = (numero_quincena % 2) == 1
-            periodo = "1ra Quincena" if es_primera_quincena else "2da Quincena"
-            
-            # Validar mes
-            if mes < 1 or mes > 12:
-                resultados["errores"].append({
-                    "archivo": nombre_archivo,
-                    "error": f"Número de quincena inválido: {numero_quincena}. Debe estar entre 1 y 24"
-                })
-                continue
-            
-            # Buscar empleado por número
-            empleado = empleados_por_numero.get(numero_empleado)
-            
-            if not empleado:
-                resultados["errores"].append({
-                    "archivo": nombre_archivo,
-                    "error": f"No se encontró empleado con número: {numero_empleado}"
-                })
-                continue
-            
-            empleado_id = empleado['id']
-            
-            # Verificar si ya existe un recibo para este período
-            existing = admin_client.table("recibos_nomina").select("id").eq(
-                "empleado_id", empleado_id
-            ).eq("periodo", periodo).eq("mes", mes).eq("anio", anio).execute()
-            
-            if existing.data:
-                resultados["errores"].append({
-                    "archivo": nombre_archivo,
-                    "error": f"Ya existe recibo para {empleado['nombre']} {empleado['apellidos']} - {periodo} {mes}/{anio}"
-                })
-                continue
-            
-            # Leer contenido del archivo
-            contenido = await archivo.read()
-            
-            # Generar nombre único para Storage
-            periodo_limpio = periodo.replace(' ', '_').replace('ª', 'a')
-            storage_path = f"{empleado_id}/{anio}/{mes:02d}_{periodo_limpio}.pdf"
-            
-            # Subir a Supabase Storage (intentar eliminar si existe)
-            try:
-                admin_client.storage.from_("recibos").remove([storage_path])
-            except:
-                pass  # Si no existe, no pasa nada
-            
-            storage_response = admin_client.storage.from_("recibos").upload(
-                storage_path,
-                contenido,
-                {"content-type": "application/pdf"}
-            )
-            
-            # Obtener URL
-            archivo_url = admin_client.storage.from_("recibos").get_public_url(storage_path)
-            
-            # Guardar registro en la base de datos (usar admin_client para bypass RLS)
-            recibo_data = {
-                "empleado_id": empleado_id,
-                "periodo": periodo,
-                "mes": mes,
-                "anio": anio,
-                "archivo_url": archivo_url,
-                "archivo_nombre": nombre_archivo,
-                "subido_por": current_user.user_id,
-                "notas": f"Carga masiva - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            }
-            
-            result = admin_client.table("recibos_nomina").insert(recibo_data).execute()
-            
-            if result.data:
-                resultados["exitosos"].append({
-                    "archivo": nombre_archivo,
-                    "empleado": f"{empleado['nombre']} {empleado['apellidos']}",
-                    "numero_empleado": numero_empleado,
-                    "periodo": f"{periodo} - {mes}/{anio}"
-                })
-                
-                # Enviar notificación por correo (sin bloquear si falla)
-                try:
-                    enviar_notificacion_recibo_nomina(
-                        empleado=empleado,
-                        periodo=periodo,
-                        mes=mes,
-                        anio=anio
-                    )
-                except Exception as email_error:
-                    print(f"[WARNING] No se pudo enviar notificación a {empleado['email']}: {str(email_error)}")
-            else:
-                resultados["errores"].append({
-                    "archivo": nombre_archivo,
-                    "error": "Error al guardar en base de datos"
-                })
-                
+            pendiente = interpretar_nombre_recibo(nombre_archivo, empleados)
         except ValueError as ve:
             resultados["errores"].append({
                 "archivo": nombre_archivo,
-                "error": f"Error al parsear nombre: {str(ve)}"
+                "error": str(ve)
             })
-        except Exception as e:
+            continue
+        
+        if pendiente["llave"] in en_esta_carga:
+            empleado = pendiente["empleado"]
             resultados["errores"].append({
                 "archivo": nombre_archivo,
-                "error": str(e)
+                "error": f"Archivo repetido en la carga para {empleado['nombre']} {empleado['apellidos']} - {pendiente['periodo']} {pendiente['mes']}/{pendiente['anio']}"
+            })
+            continue
+        en_esta_carga.add(pendiente["llave"])
+        
+        pendiente["archivo"] = archivo
+        pendientes.append(pendiente)
+    
+    if not pendientes:
+        return resultados
+    
+    # 2. Recibos ya registrados de estos empleados en los períodos de la carga
+    existentes = await run_in_threadpool(recibos_existentes, admin_client, pendientes)
+    
+    por_subir = []
+    for pendiente in pendientes:
+        if pendiente["llave"] in existentes:
+            resultados["errores"].append({
+                "archivo": pendiente["archivo"].filename,
+                "error": mensaje_existente(pendiente)
             })
+        else:
+            por_subir.append(pendiente)
+    
+    # 3. Subir a Storage con concurrencia acotada (sin sobrescribir el PDF de un recibo registrado)
+    limite = asyncio.Semaphore(settings.recibos_subidas_simultaneas)
+    
+    async def subir(pendiente: dict) -> str:
+        # Se envía el archivo temporal por bloques, sin cargarlo completo en memoria
+        async with limite:
+            return await run_in_threadpool(subir_pdf_recibo, admin_client, pendiente, pendiente["archivo"].file)
+    
+    urls = await asyncio.gather(*(subir(p) for p in por_subir), return_exceptions=True)
+    
+    subidos = []
+    for pendiente, url in zip(por_subir, urls):
+        if isinstance(url, Exception):
+            print(f"[ERROR] Subiendo {pendiente['archivo'].filename} a Storage: {url}")
+            resultados["errores"].append({
+                "archivo": pendiente["archivo"].filename,
+                "error": str(url)
+            })
+            continue
+        pendiente["registro"] = {
+            "empleado_id": pendiente["empleado"]["id"],
+            "periodo": pendiente["periodo"],
+            "mes": pendiente["mes"],
+            "anio": pendiente["anio"],
+            "archivo_url": url,
+            "archivo_nombre": pendiente["archivo"].filename,
+            "subido_por": current_user.user_id,
+            "notas": f"Carga masiva - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        }
+        subidos.append(pendiente)
+    
+    # 4. Guardar todos los registros en un solo INSERT (admin_client para bypass RLS)
+    guardados = []
+    if subidos:
+        try:
+            result = await ejecutar(
+                admin_client.table("recibos_nomina").insert([p["registro"] for p in subidos])
+            )
+            insertados = {(r["empleado_id"], r["periodo"], r["mes"], r["anio"]) for r in result.data or []}
+            for pendiente in subidos:
+                if pendiente["llave"] in insertados:
+                    guardados.append(pendiente)
+                else:
+                    resultados["errores"].append({
+                        "archivo": pendiente["archivo"].filename,
+                        "error": "Error al guardar en base de datos"
+                    })
+        except Exception as e:
+            # Un recibo creado mientras tanto rechaza todo el lote: reintentar uno por uno
+            print(f"[WARNING] Insert en lote de recibos falló, insertando uno por uno: {str(e)}")
+            for pendiente in subidos:
+                try:
+                    result = await ejecutar(admin_client.table("recibos_nomina").insert(pendiente["registro"]))
+                    if not result.data:
+                        raise ValueError("Error al guardar en base de datos")
+                    guardados.append(pendiente)
+                except Exception as error_fila:
+                    resultados["errores"].append({
+                        "archivo": pendiente["archivo"].filename,
+                        "error": str(error_fila)
+                    })
+    
+    # 5. Encolar notificaciones por correo (se envían en segundo plano)
+    for pendiente in guardados:
+        empleado = pendiente["empleado"]
+        resultados["exitosos"].append({
+            "archivo": pendiente["archivo"].filename,
+            "empleado": f"{empleado['nombre']} {empleado['apellidos']}",
+            "numero_empleado": pendiente["numero_empleado"],
+            "periodo": f"{pendiente['periodo']} - {pendiente['mes']}/{pendiente['anio']}"
+        })
+        
+        try:
+            await encolar_correo_async(
+                "recibo_nomina",
+                empleado=empleado,
+                periodo=pendiente["periodo"],
+                mes=pendiente["mes"],
+                anio=pendiente["anio"]
+            )
+        except Exception as email_error:
+            print(f"[WARNING] No se pudo encolar notificación a {empleado['email']}: {str(email_error)}")
     
     return resultados
+
+
+# ========================================
+# CARGA MASIVA POR JOBS
+# ========================================
+@router.post("/jobs")
+async def crear_job_recibos(
+    datos: JobRecibosCreate,
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """
+    Registra una carga masiva. Regresa el job con el estado de cada archivo:
+    los que quedan en "esperando" se suben después con
+    PUT /jobs/{job_id}/archivos/{nombre}; los inválidos ya vienen en "error".
+    """
+    if not datos.archivos:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se indicaron archivos")
+    
+    empleados_activos = await directorio_empleados.listar_empleados(activo=True)
+    
+    job_id = await run_in_threadpool(
+        crear_job, datos.archivos, empleados_por_numero(empleados_activos),
+        get_admin_client(), current_user.user_id
+    )
+    return await run_in_threadpool(progreso_job, job_id)
+
+
+@router.get("/jobs")
+async def listar_jobs_abiertos(current_user: TokenData = Depends(get_current_admin)):
+    """Cargas masivas del usuario que no han terminado, para retomarlas tras recargar la página"""
+    return await run_in_threadpool(jobs_abiertos, current_user.user_id)
+
+
+@router.put("/jobs/{job_id}/archivos/{nombre_archivo}")
+async def subir_archivo_job(
+    job_id: str,
+    nombre_archivo: str,
+    archivo: UploadFile = File(...),
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """Sube un archivo de un job; se puede repetir si la subida o el procesamiento fallaron"""
+    resultado = await run_in_threadpool(recibir_archivo, job_id, nombre_archivo, archivo.file)
+    
+    if resultado is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Archivo no registrado en el job")
+    if resultado["estado"] != "recibido":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=resultado["error"] or f"El archivo ya está {resultado['estado']}"
+        )
+    
+    avisar_workers()
+    return {"archivo": nombre_archivo, "estado": "recibido"}
+
+
+@router.get("/jobs/{job_id}")
+async def obtener_job_recibos(
+    job_id: str,
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """Progreso de una carga masiva por archivo"""
+    progreso = await run_in_threadpool(progreso_job, job_id)
+    if progreso is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job no encontrado")
+    return progreso
@@ -1,14 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import date, timedelta
-from typing import Optional
+from io import BytesIO
+from typing import AsyncIterator, List, Optional
+import asyncio
+import zipfile
 
-from app.database import supabase
+from app.database import get_async_client
 from app.models import TokenData
 from app.auth import get_current_user, get_current_admin
-from app.services.pdf_generator import generar_reporte_mensual, generar_reporte_semanal
+from app.services.pdf_executor import renderizar_pdf, num_workers
+from app.services import directorio_empleados
+from app.services.reportes_cache import (
+    clave_reporte, obtener_reporte, guardar_reporte, periodo_mensual, periodo_semanal
+)
+from app.respuestas import RutaJSON
+from app.paginacion import filtro_despues
 
-router = APIRouter(prefix="/api/reportes", tags=["Reportes PDF"])
+router = APIRouter(prefix="/api/reportes", tags=["Reportes PDF"], route_class=RutaJSON)
+
+# Filas por página al leer actividades (límite por defecto de PostgREST)
+TAM_PAGINA = 1000
+EMPLEADOS_POR_CONSULTA = 100  # ids por consulta en los reportes en lote (largo de la URL)
+ORDEN_ACTIVIDADES = [("empleado_id", False), ("fecha", False), ("id", False)]
 
 
 def get_lunes_semana(fecha: date) -> date:
@@ -16,6 +31,38 @@ def get_lunes_semana(fecha: date) -> date:
     return fecha - timedelta(days=fecha.weekday())
 
 
+async def pdf_reporte_mensual(empleado: dict, actividades: List[dict], anio: int, mes: int, esperar: bool = False) -> bytes:
+    """PDF mensual desde la caché, o generado en el pool de procesos y guardado en ella"""
+    clave = clave_reporte("mensual", empleado, periodo_mensual(anio, mes), actividades)
+    pdf = obtener_reporte(clave)
+    if pdf is None:
+        pdf = await renderizar_pdf(
+            "mensual",
+            esperar=esperar,
+            empleado=empleado,
+            actividades=actividades,
+            anio=anio,
+            mes=mes
+        )
+        await run_in_threadpool(guardar_reporte, clave, pdf)
+    return pdf
+
+
+async def pdf_reporte_semanal(empleado: dict, actividades: List[dict], lunes: date) -> bytes:
+    """PDF semanal desde la caché, o generado en el pool de procesos y guardado en ella"""
+    clave = clave_reporte("semanal", empleado, periodo_semanal(lunes), actividades)
+    pdf = obtener_reporte(clave)
+    if pdf is None:
+        pdf = await renderizar_pdf(
+            "semanal",
+            empleado=empleado,
+            actividades=actividades,
+            semana_inicio=lunes
+        )
+        await run_in_threadpool(guardar_reporte, clave, pdf)
+    return pdf
+
+
 @router.get("/mi-reporte-mensual/{anio}/{mes}")
 async def mi_reporte_mensual(
     anio: int,
@@ -23,15 +70,14 @@ async def mi_reporte_mensual(
     current_user: TokenData = Depends(get_current_user)
 ):
     """Generar mi reporte mensual en PDF"""
+    db = get_async_client()
     
     # Obtener datos del empleado
-    empleado_result = supabase.table("v_empleados_completo").select("*").eq("id", current_user.user_id).execute()
+    empleado = await directorio_empleados.obtener_empleado(current_user.user_id)
     
-    if not empleado_result.data:
+    if not empleado:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
     
-    empleado = empleado_result.data[0]
-    
     # Obtener actividades del mes
     fecha_inicio = date(anio, mes, 1)
     if mes == 12:
@@ -39,17 +85,12 @@ async def mi_reporte_mensual(
     else:
         fecha_fin = date(anio, mes + 1, 1) - timedelta(days=1)
     
-    actividades_result = supabase.table("actividades").select(
+    actividades_result = await db.table("actividades").select(
         "*, ubicacion:ubicaciones(codigo, nombre)"
     ).eq("empleado_id", current_user.user_id).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat()).order("fecha").execute()
     
-    # Generar PDF
-    pdf_buffer = generar_reporte_mensual(
-        empleado=empleado,
-        actividades=actividades_result.data,
-        anio=anio,
-        mes=mes
-    )
+    # Generar PDF (o reutilizar el de la caché si los datos no cambiaron)
+    pdf_buffer = BytesIO(await pdf_reporte_mensual(empleado, actividades_result.data, anio, mes))
     
     # Nombre del archivo
     nombre_archivo = f"Reporte_{empleado['nombre']}_{empleado['apellidos']}_{anio}_{mes:02d}.pdf"
@@ -69,6 +110,7 @@ async def mi_reporte_semanal(
     current_user: TokenData = Depends(get_current_user)
 ):
     """Generar mi reporte semanal en PDF"""
+    db = get_async_client()
     
     if not fecha:
         fecha = date.today()
@@ -77,24 +119,18 @@ async def mi_reporte_semanal(
     viernes = lunes + timedelta(days=4)
     
     # Obtener datos del empleado
-    empleado_result = supabase.table("v_empleados_completo").select("*").eq("id", current_user.user_id).execute()
+    empleado = await directorio_empleados.obtener_empleado(current_user.user_id)
     
-    if not empleado_result.data:
+    if not empleado:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
     
-    empleado = empleado_result.data[0]
-    
     # Obtener actividades de la semana
-    actividades_result = supabase.table("actividades").select(
+    actividades_result = await db.table("actividades").select(
         "*, ubicacion:ubicaciones(codigo, nombre)"
     ).eq("empleado_id", current_user.user_id).gte("fecha", lunes.isoformat()).lte("fecha", viernes.isoformat()).order("fecha").execute()
     
-    # Generar PDF
-    pdf_buffer = generar_reporte_semanal(
-        empleado=empleado,
-        actividades=actividades_result.data,
-        semana_inicio=lunes
-    )
+    # Generar PDF (o reutilizar el de la caché si los datos no cambiaron)
+    pdf_buffer = BytesIO(await pdf_reporte_semanal(empleado, actividades_result.data, lunes))
     
     nombre_archivo = f"Reporte_Semanal_{empleado['nombre']}_{lunes.isoformat()}.pdf"
     
@@ -119,15 +155,14 @@ async def reporte_mensual_empleado(
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Generar reporte mensual de un empleado (admin)"""
+    db = get_async_client()
     
     # Obtener datos del empleado
-    empleado_result = supabase.table("v_empleados_completo").select("*").eq("id", empleado_id).execute()
+    empleado = await directorio_empleados.obtener_empleado(empleado_id)
     
-    if not empleado_result.data:
+    if not empleado:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
     
-    empleado = empleado_result.data[0]
-    
     # Obtener actividades del mes
     fecha_inicio = date(anio, mes, 1)
     if mes == 12:
@@ -135,17 +170,12 @@ async def reporte_mensual_empleado(
     else:
         fecha_fin = date(anio, mes + 1, 1) - timedelta(days=1)
     
-    actividades_result = supabase.table("actividades").select(
+    actividades_result = await db.table("actividades").select(
         "*, ubicacion:ubicaciones(codigo, nombre)"
     ).eq("empleado_id", empleado_id).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat()).order("fecha").execute()
     
-    # Generar PDF
-    pdf_buffer = generar_reporte_mensual(
-        empleado=empleado,
-        actividades=actividades_result.data,
-        anio=anio,
-        mes=mes
-    )
+    # Generar PDF (o reutilizar el de la caché si los datos no cambiaron)
+    pdf_buffer = BytesIO(await pdf_reporte_mensual(empleado, actividades_result.data, anio, mes))
     
     nombre_archivo = f"Reporte_{empleado['nombre']}_{empleado['apellidos']}_{anio}_{mes:02d}.pdf"
     
@@ -165,6 +195,7 @@ async def reporte_semanal_empleado(
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Generar reporte semanal de un empleado (admin)"""
+    db = get_async_client()
     
     if not fecha:
         fecha = date.today()
@@ -173,24 +204,18 @@ async def reporte_semanal_empleado(
     viernes = lunes + timedelta(days=4)
     
     # Obtener datos del empleado
-    empleado_result = supabase.table("v_empleados_completo").select("*").eq("id", empleado_id).execute()
+    empleado = await directorio_empleados.obtener_empleado(empleado_id)
     
-    if not empleado_result.data:
+    if not empleado:
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
     
-    empleado = empleado_result.data[0]
-    
     # Obtener actividades de la semana
-    actividades_result = supabase.table("actividades").select(
+    actividades_result = await db.table("actividades").select(
         "*, ubicacion:ubicaciones(codigo, nombre)"
     ).eq("empleado_id", empleado_id).gte("fecha", lunes.isoformat()).lte("fecha", viernes.isoformat()).order("fecha").execute()
     
-    # Generar PDF
-    pdf_buffer = generar_reporte_semanal(
-        empleado=empleado,
-        actividades=actividades_result.data,
-        semana_inicio=lunes
-    )
+    # Generar PDF (o reutilizar el de la caché si los datos no cambiaron)
+    pdf_buffer = BytesIO(await pdf_reporte_semanal(empleado, actividades_result.data, lunes))
     
     nombre_archivo = f"Reporte_Semanal_{empleado['nombre']}_{lunes.isoformat()}.pdf"
     
@@ -201,3 +226,176 @@ async def reporte_semanal_empleado(
             "Content-Disposition": f"attachment; filename={nombre_archivo}"
         }
     )
+
+
+# ===========================================
+# REPORTES EN LOTE
+# ===========================================
+
+async def obtener_actividades_por_empleado(db, empleado_ids: List[str], fecha_inicio: date, fecha_fin: date) -> dict:
+    """
+    Trae las actividades de un rango de fechas de los empleados indicados y
+    las agrupa por empleado_id. Se consulta por lotes de EMPLEADOS_POR_CONSULTA
+    ids y se pagina por llave (empleado_id, fecha, id), así que cada página
+    cuesta lo mismo que la primera
+    """
+    actividades_por_empleado = {}
+    
+    for i in range(0, len(empleado_ids), EMPLEADOS_POR_CONSULTA):
+        lote = empleado_ids[i:i + EMPLEADOS_POR_CONSULTA]
+        despues = None
+        
+        while True:
+            query = db.table("actividades").select(
+                "*, ubicacion:ubicaciones(codigo, nombre)"
+            ).in_("empleado_id", lote).gte("fecha", fecha_inicio.isoformat()).lte("fecha", fecha_fin.isoformat())
+            if despues is not None:
+                query = query.or_(filtro_despues(ORDEN_ACTIVIDADES, despues))
+            for columna, descendente in ORDEN_ACTIVIDADES:
+                query = query.order(columna, desc=descendente)
+            result = await query.limit(TAM_PAGINA).execute()
+            
+            for act in result.data:
+                actividades_por_empleado.setdefault(act["empleado_id"], []).append(act)
+            
+            if len(result.data) < TAM_PAGINA:
+                break
+            despues = [result.data[-1].get(columna) for columna, _ in ORDEN_ACTIVIDADES]
+    
+    return actividades_por_empleado
+
+
+def nombres_zip(empleados: List[dict], anio: int, mes: int) -> List[str]:
+    """
+    Nombre de cada reporte dentro del ZIP. Lleva el número de empleado (o el
+    id si no tiene) para que dos empleados con el mismo nombre no se pisen
+    """
+    nombres = []
+    usados = set()
+    for empleado in empleados:
+        identificador = str(empleado.get("numero_empleado") or "").strip() or empleado["id"]
+        nombre = f"Reporte_{identificador}_{empleado['nombre']}_{empleado['apellidos']}_{anio}_{mes:02d}.pdf"
+        if nombre in usados:
+            nombre = f"Reporte_{empleado['id']}_{empleado['nombre']}_{empleado['apellidos']}_{anio}_{mes:02d}.pdf"
+        usados.add(nombre)
+        nombres.append(nombre.replace(" ", "_"))
+    return nombres
+
+
+class _SalidaZip:
+    """
+    Destino de zipfile sin seek: acumula lo escrito hasta que el generador lo
+    envía. zipfile detecta que no puede regresar y escribe los tamaños de
+    cada archivo después de sus datos
+    """
+    
+    def __init__(self):
+        self.partes = []
+    
+    def write(self, datos) -> int:
+        self.partes.append(bytes(datos))
+        return len(datos)
+    
+    def flush(self):
+        pass
+    
+    def vaciar(self) -> bytes:
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+async def generar_zip_reportes_mensuales(empleados: List[dict], actividades_por_empleado: dict, anio: int, mes: int) -> AsyncIterator[bytes]:
+    """
+    Genera los reportes mensuales en el pool de renders (reutilizando los que
+    estén en caché) y envía el ZIP por partes: cada reporte se agrega y se
+    transmite en cuanto termina su render
+    """
+    # Como máximo un render del lote por proceso, para dejar lugar en la cola a
+    # las descargas individuales; esperar=True hace fila en vez de recibir 503.
+    # Los renders se lanzan conforme se envían los anteriores, así que en
+    # memoria sólo hay unos cuantos PDFs aunque el cliente descargue lento
+    limite = num_workers()
+    nombres = nombres_zip(empleados, anio, mes)
+    pendientes = iter(zip(empleados, nombres))
+    en_curso = {}
+    salida = _SalidaZip()
+    zf = zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED)
+    
+    def lanzar():
+        for empleado, nombre in pendientes:
+            tarea = asyncio.ensure_future(pdf_reporte_mensual(
+                empleado, actividades_por_empleado.get(empleado["id"], []), anio, mes, esperar=True
+            ))
+            en_curso[tarea] = nombre
+            if len(en_curso) >= limite:
+                return
+    
+    try:
+        lanzar()
+        while en_curso:
+            listas, _ = await asyncio.wait(en_curso, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in listas:
+                nombre = en_curso.pop(tarea)
+                await run_in_threadpool(zf.writestr, nombre, tarea.result())
+            lanzar()
+            yield salida.vaciar()
+        
+        zf.close()  # Directorio central al final
+        yield salida.vaciar()
+    except Exception as e:
+        # Ya se enviaron los encabezados: sólo queda cortar la descarga
+        print(f"[REPORTES] Error generando el ZIP {anio}-{mes:02d}: {e}")
+        raise
+    finally:
+        # Cliente desconectado o error: no seguir renderizando
+        for tarea in en_curso:
+            tarea.cancel()
+
+
+@router.get("/admin/reportes-mensuales/{anio}/{mes}")
+async def reportes_mensuales_lote(
+    anio: int,
+    mes: int,
+    proyecto_id: Optional[int] = None,
+    supervisor_id: Optional[int] = None,
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """Generar los reportes mensuales de todos los empleados activos en un ZIP (admin)"""
+    db = get_async_client()
+    
+    if mes < 1 or mes > 12:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El mes debe estar entre 1 y 12"
+        )
+    
+    # Empleados a incluir
+    empleados = await directorio_empleados.listar_empleados(
+        activo=True, proyecto_id=proyecto_id, supervisor_id=supervisor_id
+    )
+    
+    if not empleados:
+        raise HTTPException(status_code=404, detail="No hay empleados para los filtros indicados")
+    
+    # Actividades del mes de todos los empleados
+    fecha_inicio = date(anio, mes, 1)
+    if mes == 12:
+        fecha_fin = date(anio + 1, 1, 1) - timedelta(days=1)
+    else:
+        fecha_fin = date(anio, mes + 1, 1) - timedelta(days=1)
+    
+    actividades_por_empleado = await obtener_actividades_por_empleado(
+        db, [emp["id"] for emp in empleados], fecha_inicio, fecha_fin
+    )
+    
+    # Los PDFs se generan fuera del event loop y el ZIP se envía mientras tanto
+    nombre_archivo = f"Reportes_{anio}_{mes:02d}.zip"
+    
+    return StreamingResponse(
+        generar_zip_reportes_mensuales(empleados, actividades_por_empleado, anio, mes),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={nombre_archivo}"
+        }
+    )
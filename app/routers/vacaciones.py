@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
+from datetime import date
 from io import BytesIO
 
 from app.database import supabase
@@ -12,10 +14,15 @@ from app.models import (
     TokenData
 )
 from app.auth import get_current_user, get_current_admin
-from app.services.pdf_generator import generar_formato_vacaciones
-from app.services.email_service import enviar_notificacion_vacaciones
+from app.paginacion import Paginacion, paginacion, paginar_consulta
+from app.services.pdf_executor import renderizar_pdf
+from app.services.cola_correos import encolar_correo_async
+from app.services.reset_vacaciones import reset_vacaciones_anuales, historial_resets
+from app.services.invalidaciones import publicar_invalidacion
+from app.services import directorio_empleados
+from app.respuestas import RutaJSON
 
-router = APIRouter(prefix="/api/vacaciones", tags=["Vacaciones"])
+router = APIRouter(prefix="/api/vacaciones", tags=["Vacaciones"], route_class=RutaJSON)
 
 
 @router.get("/mis-solicitudes", response_model=List[Vacaciones])
@@ -99,22 +106,59 @@ async def listar_pendientes(
 
 @router.get("/todas", response_model=List[dict])
 async def listar_todas(
+    response: Response,
     estatus: Optional[EstatusVacaciones] = None,
+    pagina: Paginacion = Depends(paginacion()),
     current_user: TokenData = Depends(get_current_admin)
 ):
     """Listar todas las solicitudes (solo admin)"""
     
-    # Especificar la relación explícita para evitar ambigüedad
-    query = supabase.table("vacaciones").select(
-        "*, empleado:empleados!vacaciones_empleado_id_fkey(nombre, apellidos)"
+    def consulta(columnas: str, **opciones):
+        query = supabase.table("vacaciones").select(columnas, **opciones)
+        if estatus:
+            query = query.eq("estatus", estatus.value)
+        return query
+    
+    solicitudes = await paginar_consulta(
+        response, pagina, consulta,
+        orden=[("created_at", True), ("id", True)],
+        # Especificar la relación explícita para evitar ambigüedad
+        derivados={"empleado": "empleado:empleados!vacaciones_empleado_id_fkey(nombre, apellidos)"}
     )
     
-    if estatus:
-        query = query.eq("estatus", estatus.value)
-    
-    result = query.order("created_at", desc=True).execute()
-    
-    return result.data
+    return pagina.proyectar(solicitudes)
+
+
+@router.post("/admin/reset-anual")
+async def ejecutar_reset_anual(
+    anio: Optional[int] = None,
+    dry_run: bool = True,
+    forzar: bool = False,
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """
+    Reset anual de días de vacaciones (solo admin). Por defecto es una vista
+    previa (dry_run=true) que no modifica nada; con dry_run=false se aplica,
+    una sola vez por año salvo que se indique forzar=true.
+    """
+    resultado = await run_in_threadpool(
+        reset_vacaciones_anuales,
+        anio or date.today().year,
+        dry_run,
+        forzar,
+        f"admin:{current_user.user_id}"
+    )
+    if not dry_run and resultado.get("empleados_actualizados"):
+        await publicar_invalidacion("empleados")
+    return resultado
+
+
+@router.get("/admin/reset-anual/historial")
+async def historial_reset_anual(
+    current_user: TokenData = Depends(get_current_admin)
+):
+    """Bitácora de resets anuales (solo admin)"""
+    return await run_in_threadpool(historial_resets)
 
 
 @router.patch("/{vacacion_id}/aprobar", response_model=Vacaciones)
@@ -143,17 +187,18 @@ async def aprobar_vacaciones(
     
     vacacion = result.data[0]
     
-    # Enviar notificación por correo al empleado
+    # Encolar notificación por correo al empleado (se envía en segundo plano)
     try:
-        empleado = supabase.table("v_empleados_completo").select("*").eq("id", vacacion["empleado_id"]).execute()
-        if empleado.data:
-            enviar_notificacion_vacaciones(
-                empleado=empleado.data[0],
+        empleado = await directorio_empleados.obtener_empleado(vacacion["empleado_id"])
+        if empleado:
+            await encolar_correo_async(
+                "vacaciones",
+                empleado=empleado,
                 vacacion=vacacion,
                 aprobada=True
             )
     except Exception as e:
-        print(f"[WARNING] No se pudo enviar notificación de vacaciones: {str(e)}")
+        print(f"[WARNING] No se pudo encolar notificación de vacaciones: {str(e)}")
     
     return vacacion
 
@@ -180,17 +225,18 @@ async def rechazar_vacaciones(
     
     vacacion = result.data[0]
     
-    # Enviar notificación por correo al empleado
+    # Encolar notificación por correo al empleado (se envía en segundo plano)
     try:
-        empleado = supabase.table("v_empleados_completo").select("*").eq("id", vacacion["empleado_id"]).execute()
-        if empleado.data:
-            enviar_notificacion_vacaciones(
-                empleado=empleado.data[0],
+        empleado = await directorio_empleados.obtener_empleado(vacacion["empleado_id"])
+        if empleado:
+            await encolar_correo_async(
+                "vacaciones",
+                empleado=empleado,
                 vacacion=vacacion,
                 aprobada=False
             )
     except Exception as e:
-        print(f"[WARNING] No se pudo enviar notificación de vacaciones: {str(e)}")
+        print(f"[WARNING] No se pudo encolar notificación de vacaciones: {str(e)}")
     
     return vacacion
 
@@ -239,18 +285,16 @@ async def descargar_pdf_vacaciones(
         )
     
     # Obtener datos del empleado
-    empleado_result = supabase.table("v_empleados_completo").select("*").eq("id", vacacion.get('empleado_id')).execute()
+    empleado = await directorio_empleados.obtener_empleado(vacacion.get('empleado_id'))
     
-    if not empleado_result.data:
+    if not empleado:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Empleado no encontrado"
         )
     
-    empleado = empleado_result.data[0]
-    
-    # Generar PDF
-    pdf_buffer = generar_formato_vacaciones(empleado, vacacion)
+    # Generar PDF en el pool de procesos
+    pdf_buffer = BytesIO(await renderizar_pdf("vacaciones", empleado=empleado, vacacion=vacacion))
     
     # Nombre del archivo
     nombre_empleado = empleado.get('nombre_completo', 'empleado').replace(' ', '_')
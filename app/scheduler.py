@@ -1,10 +1,20 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import date, timedelta
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import date, datetime, timedelta, timezone
+from starlette.concurrency import run_in_threadpool
+import time
 
-from app.database import supabase, get_admin_client
+from app.config import get_settings
+from app.database import supabase, get_admin_client, ejecutar
 from app.services.email_service import enviar_recordatorio_actividades
+from app.services.reset_vacaciones import reset_vacaciones_anuales
+from app.services.invalidaciones import publicar_invalidacion
+from app.services.coordinacion import (
+    renovar_liderazgo, es_lider, reclamar_ejecucion, terminar_ejecucion, liberar_liderazgo
+)
 
+settings = get_settings()
 scheduler = AsyncIOScheduler()
 
 
@@ -14,10 +24,13 @@ async def tarea_recordatorio_semanal():
     Se ejecuta los viernes a las 10:00 AM
     """
     print("[SCHEDULER] Ejecutando tarea de recordatorio semanal...")
+    tiempos = {}
+    inicio = time.perf_counter()
     
     try:
         # Obtener empleados sin captura
-        result = supabase.table("v_empleados_sin_captura").select("*").execute()
+        result = await ejecutar(supabase.table("v_empleados_sin_captura").select("*"))
+        tiempos["consulta"] = time.perf_counter() - inicio
         
         if not result.data:
             print("[SCHEDULER] Todos los empleados han capturado sus actividades")
@@ -29,27 +42,46 @@ async def tarea_recordatorio_semanal():
         viernes = lunes + timedelta(days=4)
         semana = f"{lunes.strftime('%d/%m')} al {viernes.strftime('%d/%m/%Y')}"
         
-        # Enviar recordatorios
-        enviados = await enviar_recordatorio_actividades(
+        # Enviar recordatorios en paralelo (SMTP es bloqueante: en el threadpool)
+        etapa = time.perf_counter()
+        resultado = await run_in_threadpool(
+            enviar_recordatorio_actividades,
             empleados=result.data,
-            semana=semana
+            semana=semana,
+            tiempo_limite=settings.recordatorios_timeout
         )
+        tiempos["envio"] = time.perf_counter() - etapa
         
-        print(f"[SCHEDULER] Se enviaron {enviados} recordatorios")
-        
-        # Registrar notificaciones en la base de datos
-        admin_client = get_admin_client()
-        
-        for empleado in result.data:
-            admin_client.table("notificaciones").insert({
+        # Registrar todas las notificaciones en un solo INSERT. Los que seguían
+        # enviándose al cumplirse el límite no se registran: no se sabe si
+        # llegaron y marcarlos como no enviados sería falso
+        etapa = time.perf_counter()
+        enviados_a = {d["email"] for d in resultado["detalles"] if d["status"] == "enviado"}
+        sin_confirmar = {d["email"] for d in resultado["detalles"] if d["status"] == "en_curso"}
+        notificaciones = [
+            {
                 "empleado_id": empleado["id"],
                 "tipo": "recordatorio_actividad",
                 "mensaje": f"Recordatorio enviado para semana {semana}",
-                "enviado": True
-            }).execute()
+                "enviado": empleado.get("email") in enviados_a
+            }
+            for empleado in result.data
+            if empleado.get("email") not in sin_confirmar
+        ]
+        if notificaciones:
+            await ejecutar(get_admin_client().table("notificaciones").insert(notificaciones))
+        tiempos["notificaciones"] = time.perf_counter() - etapa
+        tiempos["total"] = time.perf_counter() - inicio
+        
+        print(
+            f"[SCHEDULER] Recordatorios: {resultado['enviados']} enviados, {resultado['fallidos']} fallidos, "
+            f"{resultado['en_curso']} sin confirmar de {resultado['total']} | "
+            + ", ".join(f"{nombre} {segundos:.2f}s" for nombre, segundos in tiempos.items())
+        )
             
     except Exception as e:
         print(f"[SCHEDULER] Error en tarea de recordatorio: {e}")
+        raise
 
 
 async def tarea_reset_vacaciones_anuales():
@@ -60,36 +92,75 @@ async def tarea_reset_vacaciones_anuales():
     print("[SCHEDULER] Ejecutando reset anual de vacaciones...")
     
     try:
-        admin_client = get_admin_client()
+        # Un solo UPDATE en el servidor (ver sql/reset_vacaciones_anuales.sql)
+        resultado = await run_in_threadpool(reset_vacaciones_anuales, date.today().year)
         
-        # Obtener todos los empleados activos con su puesto
-        result = admin_client.table("empleados").select(
-            "id, puesto_id, puestos(dias_vacaciones_anuales)"
-        ).eq("activo", True).execute()
-        
-        for empleado in result.data:
-            dias_anuales = 12  # Default
-            
-            if empleado.get("puestos"):
-                dias_anuales = empleado["puestos"].get("dias_vacaciones_anuales", 12)
-            
-            admin_client.table("empleados").update({
-                "dias_vacaciones": dias_anuales
-            }).eq("id", empleado["id"]).execute()
+        if resultado.get("ya_aplicado"):
+            print(f"[SCHEDULER] El reset de {resultado['anio']} ya se había aplicado")
+            return
         
-        print(f"[SCHEDULER] Se actualizaron vacaciones de {len(result.data)} empleados")
+        print(
+            f"[SCHEDULER] Se actualizaron vacaciones de {resultado['empleados_actualizados']} "
+            f"de {resultado['empleados_activos']} empleados en {resultado['duracion_ms']} ms"
+        )
+        if resultado.get("empleados_actualizados"):
+            await publicar_invalidacion("empleados")
         
     except Exception as e:
         print(f"[SCHEDULER] Error en reset de vacaciones: {e}")
+        raise
+
+
+async def ejecutar_tarea(nombre: str, tarea):
+    """
+    Ejecuta una tarea programada sólo en el worker líder y una sola vez por
+    horario, registrando duración y resultado en la bitácora.
+    """
+    if not es_lider():
+        return
+    
+    # Todos los workers calculan el mismo horario para el mismo disparo
+    programada = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    ejecucion_id = await run_in_threadpool(reclamar_ejecucion, nombre, programada)
+    if ejecucion_id is None:
+        print(f"[SCHEDULER] '{nombre}' de {programada.isoformat()} ya fue ejecutada por otro worker")
+        return
+    
+    inicio = time.perf_counter()
+    error = None
+    try:
+        await tarea()
+    except Exception as e:
+        error = str(e)
+    duracion_ms = round((time.perf_counter() - inicio) * 1000)
+    await run_in_threadpool(terminar_ejecucion, ejecucion_id, duracion_ms, error)
+
+
+async def tarea_renovar_liderazgo():
+    await run_in_threadpool(renovar_liderazgo)
 
 
 def iniciar_scheduler():
-    """Configura e inicia las tareas programadas"""
+    """
+    Configura e inicia las tareas programadas. Corre en todos los workers,
+    pero sólo el líder ejecuta las tareas (ver app/services/coordinacion.py).
+    """
+    
+    # Elección / renovación del líder
+    scheduler.add_job(
+        tarea_renovar_liderazgo,
+        IntervalTrigger(seconds=max(1, settings.scheduler_lease_segundos // 3)),
+        id='renovar_liderazgo',
+        name='Renovación del líder del scheduler',
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
     
     # Recordatorio semanal: Viernes a las 10:00 AM
     scheduler.add_job(
-        tarea_recordatorio_semanal,
+        ejecutar_tarea,
         CronTrigger(day_of_week='fri', hour=10, minute=0),
+        args=['recordatorio_semanal', tarea_recordatorio_semanal],
         id='recordatorio_semanal',
         name='Recordatorio de captura de actividades',
         replace_existing=True
@@ -97,8 +168,9 @@ def iniciar_scheduler():
     
     # Reset anual de vacaciones: 1 de Enero a las 00:01
     scheduler.add_job(
-        tarea_reset_vacaciones_anuales,
+        ejecutar_tarea,
         CronTrigger(month=1, day=1, hour=0, minute=1),
+        args=['reset_vacaciones', tarea_reset_vacaciones_anuales],
         id='reset_vacaciones',
         name='Reset anual de días de vacaciones',
         replace_existing=True
@@ -109,6 +181,7 @@ def iniciar_scheduler():
 
 
 def detener_scheduler():
-    """Detiene las tareas programadas"""
+    """Detiene las tareas programadas y cede el liderazgo"""
     scheduler.shutdown()
+    liberar_liderazgo()
     print("[SCHEDULER] Tareas programadas detenidas")
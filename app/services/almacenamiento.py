@@ -0,0 +1,148 @@
+import os
+import shutil
+import threading
+from typing import BinaryIO, Iterator, Optional
+from urllib.parse import quote
+
+import httpx
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# ===========================================
+# SUBIDA DE ARCHIVOS EN STREAMING
+# ===========================================
+# FastAPI ya guardó cada UploadFile en un archivo temporal (SpooledTemporaryFile).
+# En lugar de `await archivo.read()` (todo el PDF en memoria), aquí se envía el
+# archivo a Storage en bloques de ALMACENAMIENTO_BLOQUE_KB, así que la memoria
+# usada por subida es constante sin importar el tamaño del archivo o del lote.
+#
+# Con ALMACENAMIENTO_LOCAL_DIR los archivos se copian a disco en lugar de ir a
+# Supabase Storage (desarrollo / pruebas); app/routers/almacenamiento.py los sirve
+# en /almacenamiento sólo a usuarios con sesión (los recibos, sólo a su dueño o a
+# un admin).
+
+
+class ErrorAlmacenamiento(Exception):
+    """Storage rechazó la subida"""
+
+
+class ArchivoExistente(ErrorAlmacenamiento):
+    """Ya hay un objeto en esa ruta y la subida no era upsert"""
+
+
+_cliente: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+
+def _tamano_bloque() -> int:
+    return settings.almacenamiento_bloque_kb * 1024
+
+
+def _cliente_http() -> httpx.Client:
+    """Cliente HTTP de subidas, creado una sola vez por proceso"""
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                key = settings.supabase_service_key or settings.supabase_key
+                _cliente = httpx.Client(
+                    base_url=f"{settings.supabase_url}/storage/v1",
+                    headers={"Authorization": f"Bearer {key}", "apikey": key},
+                    timeout=httpx.Timeout(settings.supabase_timeout, write=None),
+                    limits=httpx.Limits(
+                        max_connections=settings.recibos_subidas_simultaneas,
+                        max_keepalive_connections=settings.recibos_subidas_simultaneas
+                    )
+                )
+    return _cliente
+
+
+def _bloques(archivo: BinaryIO) -> Iterator[bytes]:
+    while True:
+        bloque = archivo.read(_tamano_bloque())
+        if not bloque:
+            return
+        yield bloque
+
+
+def _tamano(archivo: BinaryIO) -> int:
+    archivo.seek(0, os.SEEK_END)
+    tamano = archivo.tell()
+    archivo.seek(0)
+    return tamano
+
+
+def url_publica(bucket: str, ruta: str) -> str:
+    """URL pública de un objeto (mismo formato que storage.get_public_url)"""
+    if settings.almacenamiento_local_dir:
+        return f"{settings.app_url}/almacenamiento/{bucket}/{quote(ruta)}"
+    return f"{settings.supabase_url}/storage/v1/object/public/{bucket}/{quote(ruta)}"
+
+
+def ruta_local(bucket: str, ruta: str) -> Optional[str]:
+    """
+    Ruta en disco de un objeto del almacenamiento local, o None si no existe
+    o sale de la carpeta del bucket (p. ej. con "..")
+    """
+    if not settings.almacenamiento_local_dir or bucket in ("", ".", "..") or "/" in bucket:
+        return None
+    base = os.path.realpath(os.path.join(settings.almacenamiento_local_dir, bucket))
+    destino = os.path.realpath(os.path.join(base, ruta))
+    if os.path.commonpath([base, destino]) != base or not os.path.isfile(destino):
+        return None
+    return destino
+
+
+def subir_archivo(
+    bucket: str,
+    ruta: str,
+    archivo: BinaryIO,
+    content_type: str = "application/octet-stream",
+    upsert: bool = False
+) -> str:
+    """
+    Sube un archivo abierto (p. ej. `UploadFile.file`) leyéndolo por bloques y
+    regresa su URL pública. Es bloqueante: llamar con run_in_threadpool.
+    """
+    if settings.almacenamiento_local_dir:
+        destino = os.path.join(settings.almacenamiento_local_dir, bucket, ruta)
+        if os.path.exists(destino) and not upsert:
+            raise ArchivoExistente(f"El archivo ya existe: {bucket}/{ruta}")
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+        archivo.seek(0)
+        with open(temporal, "wb") as f:
+            shutil.copyfileobj(archivo, f, _tamano_bloque())
+        os.replace(temporal, destino)
+        return url_publica(bucket, ruta)
+
+    # Content-Length explícito: Storage recibe el cuerpo en streaming sin chunked encoding
+    tamano = _tamano(archivo)
+    response = _cliente_http().post(
+        f"/object/{bucket}/{quote(ruta)}",
+        content=_bloques(archivo),
+        headers={
+            "Content-Type": content_type,
+            "Content-Length": str(tamano),
+            "x-upsert": "true" if upsert else "false",
+        }
+    )
+    # Storage responde 409, o 400 con statusCode "409" en versiones anteriores
+    if response.status_code == 409 or (response.status_code == 400 and '"409"' in response.text):
+        raise ArchivoExistente(f"El archivo ya existe: {bucket}/{ruta}")
+    if response.status_code >= 400:
+        raise ErrorAlmacenamiento(f"Storage respondió {response.status_code}: {response.text[:200]}")
+
+    return url_publica(bucket, ruta)
+
+
+def cerrar_almacenamiento():
+    """Cierra el cliente HTTP de subidas"""
+    global _cliente
+    with _lock:
+        if _cliente is not None:
+            _cliente.close()
+            _cliente = None
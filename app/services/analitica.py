@@ -0,0 +1,269 @@
+import csv
+import importlib.util
+import io
+import tempfile
+from datetime import date, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+from starlette.concurrency import run_in_threadpool
+
+from app.config import get_settings
+from app.database import get_admin_client, get_async_client, ejecutar
+from app.paginacion import codificar_cursor, decodificar_cursor, filtro_despues
+from app.services import directorio_empleados
+
+settings = get_settings()
+
+
+# ===========================================
+# ANALÍTICA DE ACTIVIDADES
+# ===========================================
+# - Agregados: analitica_horas (sql/analitica_horas.sql) suma en la base por
+#   semana o mes y por empleado, proyecto o ubicación, y regresa columnas
+#   listas para pandas (`pd.DataFrame(resultado)` sin transformar nada). Si la
+#   migración falta, el mismo resultado se arma recorriendo actividades.
+# - Detalle: actividades se recorre por llave (fecha, id), nunca con OFFSET,
+#   así que la página 1000 cuesta lo mismo que la primera (cursores de
+#   app/paginacion.py).
+# - Exportación: CSV en streaming (una página en memoria a la vez) o Parquet
+#   si está instalado pyarrow (opcional).
+
+PERIODOS = ("semana", "mes")
+DIMENSIONES = ("empleado", "proyecto", "ubicacion")
+
+CAMPOS_ACTIVIDAD = "id, empleado_id, fecha, hora_entrada, hora_salida, horas_trabajadas, ubicacion_id"
+COLUMNAS_EXPORTACION = [
+    "fecha", "empleado_id", "numero_empleado", "empleado", "proyecto",
+    "ubicacion", "hora_entrada", "hora_salida", "horas_trabajadas",
+]
+BLOQUE_ARCHIVO = 1024 * 1024  # Bytes por fragmento al enviar el Parquet
+
+
+ORDEN_ACTIVIDADES = [("fecha", False), ("id", False)]
+
+
+def cursor_actividad(actividad: dict) -> str:
+    return codificar_cursor([actividad[c] for c, _ in ORDEN_ACTIVIDADES])
+
+
+def limites_periodo(desde: date, hasta: date, periodo: str) -> Tuple[date, date]:
+    """Extiende el rango a semanas (lunes a domingo) o meses completos"""
+    if periodo == "semana":
+        inicio = desde - timedelta(days=desde.weekday())
+        fin = hasta + timedelta(days=6 - hasta.weekday())
+    else:
+        inicio = desde.replace(day=1)
+        siguiente = (hasta.replace(day=1) + timedelta(days=32)).replace(day=1)
+        fin = siguiente - timedelta(days=1)
+    return inicio, fin
+
+
+def inicio_periodo(fecha: date, periodo: str) -> date:
+    if periodo == "semana":
+        return fecha - timedelta(days=fecha.weekday())
+    return fecha.replace(day=1)
+
+
+# ===========================================
+# RECORRIDO POR LLAVE
+# ===========================================
+
+async def pagina_actividades(
+    desde: date,
+    hasta: date,
+    despues: Optional[str] = None,
+    limite: Optional[int] = None
+) -> List[dict]:
+    """Actividades del rango ordenadas por (fecha, id), posteriores al cursor `despues`"""
+    db = get_async_client()
+    query = db.table("actividades").select(CAMPOS_ACTIVIDAD).gte(
+        "fecha", desde.isoformat()
+    ).lte("fecha", hasta.isoformat())
+
+    if despues:
+        query = query.or_(filtro_despues(ORDEN_ACTIVIDADES, decodificar_cursor(despues, len(ORDEN_ACTIVIDADES))))
+
+    result = await query.order("fecha").order("id").limit(limite or settings.analitica_pagina).execute()
+    return result.data
+
+
+async def recorrer_actividades(desde: date, hasta: date) -> AsyncIterator[List[dict]]:
+    """Todas las actividades del rango, una página a la vez"""
+    cursor = None
+    while True:
+        pagina = await pagina_actividades(desde, hasta, cursor)
+        # Se sigue hasta una página vacía: PostgREST puede recortar a su max-rows
+        if not pagina:
+            return
+        yield pagina
+        cursor = cursor_actividad(pagina[-1])
+
+
+# ===========================================
+# AGREGADOS
+# ===========================================
+
+async def horas_por_periodo(desde: date, hasta: date, periodo: str, dimension: str) -> dict:
+    """Horas por periodo y dimensión en formato columnar (ver sql/analitica_horas.sql)"""
+    try:
+        result = await ejecutar(get_admin_client().rpc("analitica_horas", {
+            "p_desde": desde.isoformat(),
+            "p_hasta": hasta.isoformat(),
+            "p_periodo": periodo,
+            "p_dimension": dimension,
+        }))
+        return result.data
+    except APIError as e:
+        # PGRST202: la función no existe (migración pendiente)
+        if e.code != "PGRST202":
+            raise
+    return await _horas_desde_actividades(desde, hasta, periodo, dimension)
+
+
+async def _ubicaciones() -> Dict[str, str]:
+    result = await get_async_client().table("ubicaciones").select("id, codigo, nombre").execute()
+    return {str(u["id"]): f"{u['codigo']} - {u['nombre']}" for u in result.data}
+
+
+async def _horas_desde_actividades(desde: date, hasta: date, periodo: str, dimension: str) -> dict:
+    """Respaldo: mismo agregado recorriendo actividades por llave"""
+    inicio, fin = limites_periodo(desde, hasta, periodo)
+    empleados = {e["id"]: e for e in await directorio_empleados.listar_empleados(activo=None)}
+
+    if dimension == "empleado":
+        nombres = {empleado_id: e.get("nombre_completo") for empleado_id, e in empleados.items()}
+    elif dimension == "proyecto":
+        nombres = {str(e["proyecto_id"]): e.get("proyecto") for e in empleados.values() if e.get("proyecto_id")}
+    else:
+        nombres = await _ubicaciones()
+
+    grupos: Dict[Tuple[date, Optional[str]], list] = {}
+    async for pagina in recorrer_actividades(inicio, fin):
+        for act in pagina:
+            if dimension == "empleado":
+                clave = act["empleado_id"]
+            elif dimension == "proyecto":
+                clave = (empleados.get(act["empleado_id"]) or {}).get("proyecto_id")
+            else:
+                clave = act.get("ubicacion_id")
+            clave = str(clave) if clave is not None else None
+
+            fecha = date.fromisoformat(str(act["fecha"])[:10])
+            grupo = grupos.setdefault((inicio_periodo(fecha, periodo), clave), [0.0, 0, set()])
+            horas = float(act.get("horas_trabajadas") or 0)
+            grupo[0] += horas
+            grupo[1] += 1 if horas > 0 else 0
+            grupo[2].add(act["empleado_id"])
+
+    filas = sorted(
+        grupos.items(),
+        key=lambda g: (g[0][0], nombres.get(g[0][1]) is None, nombres.get(g[0][1]) or "", g[0][1] or "")
+    )
+    return {
+        "periodo": periodo,
+        "dimension": dimension,
+        "desde": inicio.isoformat(),
+        "hasta": fin.isoformat(),
+        "periodos": [p.isoformat() for (p, _), _ in filas],
+        "claves": [clave for (_, clave), _ in filas],
+        "nombres": [nombres.get(clave) for (_, clave), _ in filas],
+        "horas": [round(g[0], 2) for _, g in filas],
+        "dias": [g[1] for _, g in filas],
+        "empleados": [len(g[2]) for _, g in filas],
+    }
+
+
+# ===========================================
+# EXPORTACIÓN
+# ===========================================
+
+async def _filas_exportacion(desde: date, hasta: date) -> AsyncIterator[List[list]]:
+    """Páginas de actividades con los datos del empleado y la ubicación ya resueltos"""
+    empleados = {e["id"]: e for e in await directorio_empleados.listar_empleados(activo=None)}
+    ubicaciones = await _ubicaciones()
+
+    async for pagina in recorrer_actividades(desde, hasta):
+        filas = []
+        for act in pagina:
+            empleado = empleados.get(act["empleado_id"]) or {}
+            filas.append([
+                str(act["fecha"])[:10],
+                act["empleado_id"],
+                empleado.get("numero_empleado"),
+                empleado.get("nombre_completo"),
+                empleado.get("proyecto"),
+                ubicaciones.get(str(act.get("ubicacion_id"))),
+                act.get("hora_entrada"),
+                act.get("hora_salida"),
+                float(act.get("horas_trabajadas") or 0),
+            ])
+        yield filas
+
+
+async def exportar_csv(desde: date, hasta: date) -> AsyncIterator[bytes]:
+    """CSV de las actividades del rango, generado página por página"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    # BOM para que Excel reconozca los acentos
+    escritor.writerow(COLUMNAS_EXPORTACION)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    async for filas in _filas_exportacion(desde, hasta):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(filas)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def parquet_disponible() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+async def exportar_parquet(desde: date, hasta: date) -> AsyncIterator[bytes]:
+    """
+    Parquet de las actividades del rango (requiere pyarrow). Cada página se
+    escribe como row group en un archivo temporal y al final se envía el
+    archivo: el pie del Parquet sólo se conoce al terminar.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([
+        ("fecha", pa.date32()),
+        ("empleado_id", pa.string()),
+        ("numero_empleado", pa.string()),
+        ("empleado", pa.string()),
+        ("proyecto", pa.string()),
+        ("ubicacion", pa.string()),
+        ("hora_entrada", pa.string()),
+        ("hora_salida", pa.string()),
+        ("horas_trabajadas", pa.float64()),
+    ])
+
+    def escribir(escritor, filas: List[list]):
+        columnas = list(zip(*filas))
+        datos = {nombre: list(valores) for nombre, valores in zip(COLUMNAS_EXPORTACION, columnas)}
+        datos["fecha"] = [date.fromisoformat(f) for f in datos["fecha"]]
+        datos["numero_empleado"] = [str(n) if n is not None else None for n in datos["numero_empleado"]]
+        escritor.write_table(pa.Table.from_pydict(datos, schema=esquema))
+
+    archivo = tempfile.TemporaryFile()
+    try:
+        escritor = pq.ParquetWriter(archivo, esquema, compression="zstd")
+        try:
+            async for filas in _filas_exportacion(desde, hasta):
+                if filas:
+                    await run_in_threadpool(escribir, escritor, filas)
+        finally:
+            escritor.close()
+
+        archivo.seek(0)
+        while True:
+            bloque = await run_in_threadpool(archivo.read, BLOQUE_ARCHIVO)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
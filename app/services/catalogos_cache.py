@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.config import get_settings
+from app.services.invalidaciones import publicar_invalidacion, suscribir
+
+settings = get_settings()
+
+
+# ===========================================
+# CACHÉ DE CATÁLOGOS
+# ===========================================
+# Puestos, supervisores, ubicaciones, proyectos y marcas cambian unas cuantas
+# veces al año pero los formularios los piden en cada carga de página. Cada
+# catálogo se guarda ya serializado (JSON) junto con su ETag durante
+# CATALOGOS_CACHE_TTL segundos; los endpoints de alta, edición y baja lo
+# invalidan en cuanto escriben, en todos los workers (ver
+# app/services/invalidaciones.py). Con varias peticiones simultáneas y la
+# caché vacía sólo una consulta a la base; las demás esperan su resultado.
+
+_entradas: Dict[str, dict] = {}
+_versiones: Dict[str, int] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+
+_estadisticas = {
+    "aciertos": 0,
+    "cargas": 0,
+    "no_modificadas": 0,
+    "invalidaciones": 0,
+}
+
+
+def _vigente(entrada: Optional[dict]) -> bool:
+    return entrada is not None and time.monotonic() - entrada["cargado"] < settings.catalogos_cache_ttl
+
+
+def calcular_etag(cuerpo: bytes) -> str:
+    return f'"{hashlib.sha256(cuerpo).hexdigest()[:32]}"'
+
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara el encabezado If-None-Match (uno o varios ETags, débiles o no) con el actual"""
+    if not if_none_match:
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def obtener_catalogo(nombre: str, cargar: Callable[[], Awaitable[bytes]]) -> dict:
+    """
+    Regresa {"cuerpo": bytes JSON, "etag": str} del catálogo, cargándolo con
+    `cargar()` sólo si no está en caché o ya venció.
+    """
+    entrada = _entradas.get(nombre)
+    if _vigente(entrada):
+        _estadisticas["aciertos"] += 1
+        return entrada
+
+    lock = _locks.setdefault(nombre, asyncio.Lock())
+    async with lock:
+        # Otra petición pudo haberlo cargado mientras esperábamos
+        entrada = _entradas.get(nombre)
+        if _vigente(entrada):
+            _estadisticas["aciertos"] += 1
+            return entrada
+
+        version = _versiones.get(nombre, 0)
+        cuerpo = await cargar()
+        entrada = {"cuerpo": cuerpo, "etag": calcular_etag(cuerpo), "cargado": time.monotonic()}
+        _estadisticas["cargas"] += 1
+
+        # Si hubo una escritura durante la consulta el resultado puede ser viejo:
+        # se responde con él pero no se guarda
+        if settings.catalogos_cache_ttl > 0 and _versiones.get(nombre, 0) == version:
+            _entradas[nombre] = entrada
+        return entrada
+
+
+def _descartar(nombre: Optional[str]):
+    """Olvida un catálogo (o todos con None); la siguiente lectura vuelve a la base"""
+    for catalogo in ([nombre] if nombre else set(_entradas) | set(_locks)):
+        _versiones[catalogo] = _versiones.get(catalogo, 0) + 1
+        _entradas.pop(catalogo, None)
+    _estadisticas["invalidaciones"] += 1
+
+
+suscribir("catalogos", _descartar)
+
+
+async def invalidar_catalogo(nombre: str):
+    """Descarta el catálogo en este y en los demás workers"""
+    await publicar_invalidacion(f"catalogos:{nombre}")
+
+
+def registrar_no_modificada():
+    _estadisticas["no_modificadas"] += 1
+
+
+def estadisticas_catalogos() -> dict:
+    """Aciertos, cargas y catálogos actualmente en caché"""
+    ahora = time.monotonic()
+    return {
+        **_estadisticas,
+        "ttl": settings.catalogos_cache_ttl,
+        "catalogos": {
+            nombre: {
+                "etag": entrada["etag"],
+                "bytes": len(entrada["cuerpo"]),
+                "edad_segundos": round(ahora - entrada["cargado"], 1),
+            }
+            for nombre, entrada in _entradas.items()
+        },
+    }
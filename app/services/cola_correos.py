@@ -0,0 +1,315 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# ===========================================
+# COLA DURABLE DE CORREOS SALIENTES
+# ===========================================
+# Los handlers encolan el correo (un INSERT en SQLite, microsegundos) y regresan
+# de inmediato; workers asyncio iniciados en el lifespan lo envían en segundo
+# plano. Si el envío falla se reintenta con backoff exponencial y, tras
+# CORREOS_MAX_INTENTOS, el correo pasa a "muerto" para revisarlo desde
+# /api/correos/cola. Un correo que lleva más de CORREOS_LEASE segundos en
+# "enviando" se da por abandonado (proceso caído a medio envío) y cualquier
+# worker lo vuelve a tomar: la entrega es al menos una vez. El plazo es mayor
+# que cualquier envío SMTP, así que un worker que arranca o se reinicia no le
+# quita a otro proceso vivo el correo que está enviando.
+#
+# Estados: pendiente -> enviando -> enviado | pendiente (reintento) | muerto
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS correos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    datos TEXT NOT NULL,
+    destinatario TEXT,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    intentos INTEGER NOT NULL DEFAULT 0,
+    siguiente_intento REAL NOT NULL,
+    ultimo_error TEXT,
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_correos_pendientes ON correos (estado, siguiente_intento);
+"""
+
+# Errores que no se arreglan reintentando
+ERRORES_PERMANENTES = ("no_email", "recipient_refused")
+
+
+def _tareas() -> dict:
+    """Tipos de correo que acepta la cola (tipo -> función de email_service)"""
+    from app.services import email_service
+    return {
+        "correo": email_service.enviar_correo,
+        "correo_adjunto": email_service.enviar_correo_con_adjunto,
+        "vacaciones": email_service.enviar_notificacion_vacaciones,
+        "recibo_nomina": email_service.enviar_notificacion_recibo_nomina,
+    }
+
+
+_conexion: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+_workers: List[asyncio.Task] = []
+_hay_trabajo: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_activa = False
+
+
+def _db() -> sqlite3.Connection:
+    global _conexion
+    if _conexion is None:
+        directorio = os.path.dirname(settings.correos_cola_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        _conexion = sqlite3.connect(settings.correos_cola_db, timeout=30, check_same_thread=False, isolation_level=None)
+        _conexion.row_factory = sqlite3.Row
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        _conexion.executescript(ESQUEMA)
+    return _conexion
+
+
+def _codificar(valor):
+    """Los adjuntos (bytes) se guardan en base64 dentro del JSON"""
+    if isinstance(valor, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(valor).decode("ascii")}
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+
+def _decodificar(valor: dict):
+    if "__bytes__" in valor:
+        return base64.b64decode(valor["__bytes__"])
+    return valor
+
+
+def encolar_correo(tipo: str, **kwargs) -> Optional[int]:
+    """
+    Guarda un correo en la cola y regresa su id (None si no hay destinatario).
+    Los argumentos son los de la función de email_service correspondiente y
+    deben ser serializables a JSON.
+    """
+    if tipo not in _tareas():
+        raise ValueError(f"Tipo de correo desconocido: {tipo}")
+
+    destinatario = kwargs.get("destinatario") or (kwargs.get("empleado") or {}).get("email")
+    if not destinatario:
+        print(f"[COLA CORREOS] Correo '{tipo}' sin destinatario, no se encola")
+        return None
+
+    ahora = time.time()
+    with _db_lock:
+        cursor = _db().execute(
+            "INSERT INTO correos (tipo, datos, destinatario, siguiente_intento, creado, actualizado) VALUES (?, ?, ?, ?, ?, ?)",
+            (tipo, json.dumps(kwargs, default=_codificar, ensure_ascii=False), destinatario, ahora, ahora, ahora)
+        )
+        correo_id = cursor.lastrowid
+
+    _avisar_workers()
+    return correo_id
+
+
+async def encolar_correo_async(tipo: str, **kwargs) -> Optional[int]:
+    """
+    encolar_correo para handlers async: el INSERT puede esperar el candado de
+    SQLite (hasta 30 s) mientras un worker de otro proceso reclama un correo,
+    así que se hace en un hilo y no en el event loop.
+    """
+    return await asyncio.to_thread(encolar_correo, tipo, **kwargs)
+
+
+def _avisar_workers():
+    if _loop is None or _hay_trabajo is None:
+        return
+    try:
+        if asyncio.get_running_loop() is _loop:
+            _hay_trabajo.set()
+            return
+    except RuntimeError:
+        pass
+    _loop.call_soon_threadsafe(_hay_trabajo.set)
+
+
+def _tomar_siguiente() -> Optional[sqlite3.Row]:
+    """
+    Reclama el siguiente correo listo, o uno "enviando" cuyo plazo venció
+    (seguro entre procesos con BEGIN IMMEDIATE)
+    """
+    ahora = time.time()
+    with _db_lock:
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            fila = db.execute(
+                "SELECT * FROM correos WHERE (estado = 'pendiente' AND siguiente_intento <= ?) "
+                "OR (estado = 'enviando' AND actualizado < ?) ORDER BY id LIMIT 1",
+                (ahora, ahora - settings.correos_lease)
+            ).fetchone()
+            if fila is not None:
+                if fila["estado"] == "enviando":
+                    print(f"[COLA CORREOS] Correo {fila['id']} abandonado a medio envío, se reintenta")
+                db.execute(
+                    "UPDATE correos SET estado = 'enviando', actualizado = ? WHERE id = ?",
+                    (ahora, fila["id"])
+                )
+            db.execute("COMMIT")
+            return fila
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+
+def _registrar_resultado(fila: sqlite3.Row, resultado: dict):
+    ahora = time.time()
+    intentos = fila["intentos"] + 1
+
+    if resultado.get("success"):
+        estado, siguiente, error = "enviado", ahora, None
+    else:
+        error = resultado.get("message") or resultado.get("error") or "Error desconocido"
+        if resultado.get("error") in ERRORES_PERMANENTES or intentos >= settings.correos_max_intentos:
+            estado, siguiente = "muerto", ahora
+            print(f"[COLA CORREOS] Correo {fila['id']} ({fila['tipo']}) descartado tras {intentos} intentos: {error}")
+        else:
+            # Backoff exponencial con jitter para no reintentar todos a la vez
+            espera = min(settings.correos_backoff_base * (2 ** (intentos - 1)), settings.correos_backoff_max)
+            estado, siguiente = "pendiente", ahora + espera * random.uniform(0.8, 1.2)
+
+    with _db_lock:
+        _db().execute(
+            "UPDATE correos SET estado = ?, intentos = ?, siguiente_intento = ?, ultimo_error = ?, actualizado = ? WHERE id = ?",
+            (estado, intentos, siguiente, error, ahora, fila["id"])
+        )
+
+
+def _enviar(fila: sqlite3.Row) -> dict:
+    """Ejecuta la función de envío del correo (en un hilo, SMTP es bloqueante)"""
+    kwargs = json.loads(fila["datos"], object_hook=_decodificar)
+    try:
+        resultado = _tareas()[fila["tipo"]](**kwargs)
+    except Exception as e:
+        return {"success": False, "error": type(e).__name__, "message": str(e)}
+    return resultado if isinstance(resultado, dict) else {"success": bool(resultado)}
+
+
+async def _worker():
+    # La bandera además de cancel(): wait_for puede tragarse una cancelación
+    # que llega justo cuando el evento se activa
+    while _activa:
+        try:
+            # Limpiar antes de consultar: un encolado posterior vuelve a despertar al worker
+            _hay_trabajo.clear()
+            fila = await asyncio.to_thread(_tomar_siguiente)
+
+            if fila is None:
+                try:
+                    await asyncio.wait_for(_hay_trabajo.wait(), timeout=settings.correos_intervalo)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            resultado = await asyncio.to_thread(_enviar, fila)
+            await asyncio.to_thread(_registrar_resultado, fila, resultado)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[COLA CORREOS] Error en worker: {e}")
+            await asyncio.sleep(settings.correos_intervalo)
+
+
+def iniciar_cola_correos():
+    """
+    Arranca los workers. Llamar desde el lifespan. Los correos interrumpidos
+    no se tocan aquí: los retoma _tomar_siguiente cuando vence su plazo.
+    """
+    global _hay_trabajo, _loop, _activa
+
+    if _workers:
+        return
+
+    _loop = asyncio.get_running_loop()
+    _hay_trabajo = asyncio.Event()
+    _activa = True
+    for _ in range(settings.correos_workers):
+        _workers.append(asyncio.create_task(_worker()))
+    print(f"[COLA CORREOS] {settings.correos_workers} workers iniciados")
+
+
+async def detener_cola_correos():
+    """Detiene los workers; lo pendiente se envía en el siguiente arranque"""
+    global _conexion, _loop, _hay_trabajo, _activa
+
+    _activa = False
+    for tarea in _workers:
+        tarea.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _loop = None
+    _hay_trabajo = None
+
+    with _db_lock:
+        if _conexion is not None:
+            _conexion.close()
+            _conexion = None
+
+
+def estadisticas_cola() -> dict:
+    """Correos por estado y el más antiguo pendiente"""
+    with _db_lock:
+        db = _db()
+        por_estado = {f["estado"]: f["total"] for f in db.execute(
+            "SELECT estado, COUNT(*) AS total FROM correos GROUP BY estado"
+        )}
+        mas_antiguo = db.execute(
+            "SELECT MIN(creado) FROM correos WHERE estado = 'pendiente'"
+        ).fetchone()[0]
+
+    return {
+        "por_estado": por_estado,
+        "workers": len(_workers),
+        "pendiente_mas_antiguo_seg": round(time.time() - mas_antiguo, 1) if mas_antiguo else None,
+    }
+
+
+def listar_correos(estado: str = "muerto", limite: int = 100) -> List[dict]:
+    """Correos en un estado (por defecto los muertos), sin el contenido"""
+    with _db_lock:
+        filas = _db().execute(
+            "SELECT id, tipo, destinatario, estado, intentos, ultimo_error, creado, actualizado "
+            "FROM correos WHERE estado = ? ORDER BY id DESC LIMIT ?",
+            (estado, limite)
+        ).fetchall()
+    return [dict(f) for f in filas]
+
+
+def reintentar_correo(correo_id: int) -> bool:
+    """Regresa un correo muerto a la cola con los intentos en cero"""
+    with _db_lock:
+        cursor = _db().execute(
+            "UPDATE correos SET estado = 'pendiente', intentos = 0, siguiente_intento = ?, actualizado = ? "
+            "WHERE id = ? AND estado = 'muerto'",
+            (time.time(), time.time(), correo_id)
+        )
+    if cursor.rowcount:
+        _avisar_workers()
+    return cursor.rowcount > 0
+
+
+def purgar_enviados(dias: int = 7) -> int:
+    """Elimina los correos enviados hace más de `dias` días"""
+    with _db_lock:
+        cursor = _db().execute(
+            "DELETE FROM correos WHERE estado = 'enviado' AND actualizado < ?",
+            (time.time() - dias * 86400,)
+        )
+    return cursor.rowcount
@@ -0,0 +1,247 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# ===========================================
+# COORDINACIÓN DEL SCHEDULER ENTRE WORKERS
+# ===========================================
+# Cada worker de uvicorn arranca su propio APScheduler, pero sólo el líder
+# ejecuta las tareas. SCHEDULER_COORDINACION elige cómo se elige al líder:
+#
+#   "archivo"  - flock sobre SCHEDULER_LOCK_ARCHIVO: un solo servidor, varios
+#                workers. El candado se libera solo si el proceso muere.
+#   "postgres" - lease en la tabla scheduler_lider (sql/scheduler_coordinacion.sql)
+#                que el líder renueva cada SCHEDULER_LEASE_SEGUNDOS / 3; si deja
+#                de renovarlo otro worker (o servidor) toma el lugar.
+#   "ninguna"  - todos ejecutan (un solo worker / desarrollo).
+#
+# Además, cada ejecución se reclama por (tarea, minuto programado) en una
+# bitácora con llave única: aunque el liderazgo cambie justo en el disparo, una
+# tarea no corre dos veces para el mismo horario.
+
+IDENTIDAD = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+RECURSO = "scheduler"
+
+
+class _LiderArchivo:
+    """Líder = el proceso que obtiene el flock del archivo; bitácora en SQLite"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._fd: Optional[int] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def renovar(self) -> bool:
+        if self._fd is not None:
+            return True
+        import fcntl
+
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, IDENTIDAD.encode())
+        self._fd = fd
+        return True
+
+    def liberar(self):
+        if self._fd is not None:
+            os.close(self._fd)  # Cerrar el descriptor libera el flock
+            self._fd = None
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _conexion(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(f"{self.ruta}.db", timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scheduler_ejecuciones ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, tarea TEXT NOT NULL, programada TEXT NOT NULL,"
+                " duenio TEXT, iniciada TEXT, terminada TEXT, duracion_ms INTEGER, estado TEXT, error TEXT,"
+                " UNIQUE (tarea, programada))"
+            )
+        return self._db
+
+    def reclamar(self, tarea: str, programada: datetime) -> Optional[int]:
+        with self._lock:
+            try:
+                cursor = self._conexion().execute(
+                    "INSERT INTO scheduler_ejecuciones (tarea, programada, duenio, iniciada, estado) VALUES (?, ?, ?, ?, 'ejecutando')",
+                    (tarea, programada.isoformat(), IDENTIDAD, datetime.now(timezone.utc).isoformat())
+                )
+            except sqlite3.IntegrityError:
+                return None
+            return cursor.lastrowid
+
+    def terminar(self, ejecucion_id: int, duracion_ms: int, error: Optional[str]):
+        with self._lock:
+            self._conexion().execute(
+                "UPDATE scheduler_ejecuciones SET terminada = ?, duracion_ms = ?, estado = ?, error = ? WHERE id = ?",
+                (datetime.now(timezone.utc).isoformat(), duracion_ms, "error" if error else "ok", error, ejecucion_id)
+            )
+
+    def historial(self, limite: int) -> List[dict]:
+        with self._lock:
+            filas = self._conexion().execute(
+                "SELECT * FROM scheduler_ejecuciones ORDER BY id DESC LIMIT ?", (limite,)
+            ).fetchall()
+        return [dict(f) for f in filas]
+
+
+class _LiderPostgres:
+    """Lease renovable en scheduler_lider; bitácora en scheduler_ejecuciones"""
+
+    def _cliente(self):
+        from app.database import get_admin_client
+        return get_admin_client()
+
+    def renovar(self) -> bool:
+        result = self._cliente().rpc("tomar_liderazgo_scheduler", {
+            "p_recurso": RECURSO,
+            "p_duenio": IDENTIDAD,
+            "p_segundos": settings.scheduler_lease_segundos,
+        }).execute()
+        return bool(result.data)
+
+    def liberar(self):
+        try:
+            self._cliente().table("scheduler_lider").delete().eq("recurso", RECURSO).eq("duenio", IDENTIDAD).execute()
+        except Exception as e:
+            print(f"[SCHEDULER] No se pudo liberar el liderazgo: {e}")
+
+    def reclamar(self, tarea: str, programada: datetime) -> Optional[int]:
+        from postgrest.exceptions import APIError
+        try:
+            result = self._cliente().table("scheduler_ejecuciones").insert({
+                "tarea": tarea,
+                "programada": programada.isoformat(),
+                "duenio": IDENTIDAD,
+                "estado": "ejecutando",
+            }).execute()
+        except APIError as e:
+            if e.code == "23505":  # Ya la reclamó otro worker
+                return None
+            raise
+        return result.data[0]["id"]
+
+    def terminar(self, ejecucion_id: int, duracion_ms: int, error: Optional[str]):
+        self._cliente().table("scheduler_ejecuciones").update({
+            "terminada": datetime.now(timezone.utc).isoformat(),
+            "duracion_ms": duracion_ms,
+            "estado": "error" if error else "ok",
+            "error": error,
+        }).eq("id", ejecucion_id).execute()
+
+    def historial(self, limite: int) -> List[dict]:
+        return self._cliente().table("scheduler_ejecuciones").select("*").order(
+            "id", desc=True
+        ).limit(limite).execute().data
+
+
+def _crear_coordinador():
+    if settings.scheduler_coordinacion == "postgres":
+        return _LiderPostgres()
+    if settings.scheduler_coordinacion == "archivo":
+        if os.name == "nt":
+            print("[SCHEDULER] Coordinación por archivo no disponible en Windows, todos los workers ejecutan")
+            return None
+        return _LiderArchivo(settings.scheduler_lock_archivo)
+    return None
+
+
+_coordinador = _crear_coordinador()
+_es_lider = _coordinador is None
+_ultima_renovacion: Optional[float] = None
+
+
+def renovar_liderazgo() -> bool:
+    """Intenta obtener o renovar el liderazgo; se llama periódicamente en cada worker"""
+    global _es_lider, _ultima_renovacion
+
+    if _coordinador is None:
+        return True
+
+    try:
+        lider = _coordinador.renovar()
+    except Exception as e:
+        # Sin poder renovar no se puede asegurar la exclusividad: ceder
+        print(f"[SCHEDULER] Error renovando liderazgo: {e}")
+        lider = False
+
+    if lider != _es_lider:
+        print(f"[SCHEDULER] {IDENTIDAD} {'es ahora el líder' if lider else 'dejó de ser líder'}")
+    _es_lider = lider
+    if lider:
+        _ultima_renovacion = time.monotonic()
+    return lider
+
+
+def es_lider() -> bool:
+    """True si este worker debe ejecutar las tareas programadas"""
+    if _coordinador is None:
+        return True
+    # Un lease vencido localmente ya pudo tomarlo otro worker
+    if isinstance(_coordinador, _LiderPostgres) and _ultima_renovacion is not None:
+        if time.monotonic() - _ultima_renovacion > settings.scheduler_lease_segundos:
+            return False
+    return _es_lider
+
+
+def reclamar_ejecucion(tarea: str, programada: datetime) -> Optional[int]:
+    """Registra el inicio de una ejecución; None si ya la tomó otro worker"""
+    if _coordinador is None:
+        return 0
+    return _coordinador.reclamar(tarea, programada)
+
+
+def terminar_ejecucion(ejecucion_id: int, duracion_ms: int, error: Optional[str] = None):
+    if _coordinador is None:
+        return
+    try:
+        _coordinador.terminar(ejecucion_id, duracion_ms, error)
+    except Exception as e:
+        print(f"[SCHEDULER] No se pudo registrar el fin de la ejecución {ejecucion_id}: {e}")
+
+
+def liberar_liderazgo():
+    """Cede el liderazgo al detener la app para que otro worker lo tome de inmediato"""
+    global _es_lider
+    if _coordinador is not None:
+        _coordinador.liberar()
+        _es_lider = False
+
+
+def estado_coordinacion(limite: int = 10) -> dict:
+    """Modo, identidad de este worker y últimas ejecuciones"""
+    historial = []
+    if _coordinador is not None:
+        try:
+            historial = _coordinador.historial(limite)
+        except Exception as e:
+            print(f"[SCHEDULER] No se pudo leer la bitácora: {e}")
+    return {
+        "modo": settings.scheduler_coordinacion,
+        "worker": IDENTIDAD,
+        "es_lider": es_lider(),
+        "ejecuciones": historial,
+    }
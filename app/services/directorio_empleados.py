@@ -0,0 +1,208 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.database import get_admin_client, ejecutar
+from app.services.invalidaciones import suscribir
+
+settings = get_settings()
+
+
+# ===========================================
+# DIRECTORIO DE EMPLEADOS EN MEMORIA
+# ===========================================
+# Copia de v_empleados_completo indexada por id, email y numero_empleado. Se
+# carga completa una vez y luego se mantiene por empleado: cada escritura en
+# app/routers/empleados.py publica "empleados:<id>" en el bus de invalidación y
+# ese renglón se vuelve a leer de la vista en la siguiente consulta (una sola
+# petición con `in_` para todos los pendientes). Un cambio en los catálogos
+# (nombre de puesto, proyecto...) o un "empleados" sin id recargan todo.
+# DIRECTORIO_EMPLEADOS_TTL es el respaldo ante cambios hechos fuera de la app.
+
+VISTA = "v_empleados_completo"
+PAGINA = 1000  # Filas por consulta al cargar todo (límite por defecto de PostgREST)
+
+_por_id: Dict[str, dict] = {}
+_por_email: Dict[str, str] = {}
+_por_numero: Dict[str, str] = {}
+_ordenados: Optional[List[dict]] = None
+
+_cargado: Optional[float] = None
+_version_completa = 0
+_pendientes: Dict[str, int] = {}  # id -> generación de la invalidación
+_generacion = 0
+_lock = asyncio.Lock()
+
+_estadisticas = {
+    "consultas": 0,
+    "cargas_completas": 0,
+    "renglones_refrescados": 0,
+    "fallos": 0,
+}
+
+
+def _indexar(empleado: dict):
+    global _ordenados
+    empleado_id = str(empleado["id"])
+    _quitar(empleado_id)
+    _por_id[empleado_id] = empleado
+    if empleado.get("email"):
+        _por_email[empleado["email"].strip().lower()] = empleado_id
+    if empleado.get("numero_empleado"):
+        _por_numero[str(empleado["numero_empleado"]).strip()] = empleado_id
+    _ordenados = None
+
+
+def _quitar(empleado_id: str):
+    global _ordenados
+    anterior = _por_id.pop(empleado_id, None)
+    if anterior is None:
+        return
+    if anterior.get("email"):
+        _por_email.pop(anterior["email"].strip().lower(), None)
+    if anterior.get("numero_empleado"):
+        _por_numero.pop(str(anterior["numero_empleado"]).strip(), None)
+    _ordenados = None
+
+
+def _descartar(empleado_id: Optional[str]):
+    """Suscriptor del bus: marca un empleado (o todo el directorio) para releer"""
+    global _generacion, _cargado, _version_completa
+    if empleado_id:
+        _generacion += 1
+        _pendientes[empleado_id] = _generacion
+    else:
+        _cargado = None
+        _version_completa += 1
+
+
+suscribir("empleados", _descartar)
+suscribir("catalogos", lambda _clave: _descartar(None))
+
+
+async def _cargar_todo():
+    global _cargado, _ordenados
+    inicio = time.perf_counter()
+    version = _version_completa
+    atendidos = dict(_pendientes)
+
+    # Paginado por id: PostgREST corta cada respuesta en su max-rows
+    empleados = []
+    ultimo = None
+    while True:
+        query = get_admin_client().table(VISTA).select("*").order("id").limit(PAGINA)
+        if ultimo is not None:
+            query = query.gt("id", ultimo)
+        filas = (await ejecutar(query)).data
+        empleados.extend(filas)
+        if len(filas) < PAGINA:
+            break
+        ultimo = filas[-1]["id"]
+
+    _por_id.clear()
+    _por_email.clear()
+    _por_numero.clear()
+    for empleado in empleados:
+        _indexar(empleado)
+    _ordenados = None
+
+    # Las invalidaciones anteriores a la consulta ya quedaron incluidas
+    for empleado_id, generacion in atendidos.items():
+        if _pendientes.get(empleado_id) == generacion:
+            del _pendientes[empleado_id]
+    # Si se invalidó todo mientras se leía, se vuelve a cargar en la siguiente consulta
+    _cargado = time.monotonic() if _version_completa == version else None
+    _estadisticas["cargas_completas"] += 1
+    print(f"[DIRECTORIO] {len(_por_id)} empleados cargados en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+
+async def _refrescar_pendientes():
+    atendidos = dict(_pendientes)
+    result = await ejecutar(get_admin_client().table(VISTA).select("*").in_("id", list(atendidos)))
+
+    encontrados = set()
+    for empleado in result.data:
+        _indexar(empleado)
+        encontrados.add(str(empleado["id"]))
+    for empleado_id in atendidos.keys() - encontrados:
+        _quitar(empleado_id)
+
+    for empleado_id, generacion in atendidos.items():
+        if _pendientes.get(empleado_id) == generacion:
+            del _pendientes[empleado_id]
+    _estadisticas["renglones_refrescados"] += len(atendidos)
+
+
+async def _preparar():
+    """Carga el directorio si hace falta y relee los empleados modificados"""
+    _estadisticas["consultas"] += 1
+    vigente = _cargado is not None and time.monotonic() - _cargado < settings.directorio_empleados_ttl
+    if vigente and not _pendientes:
+        return
+
+    async with _lock:
+        if _cargado is None or time.monotonic() - _cargado >= settings.directorio_empleados_ttl:
+            await _cargar_todo()
+        if _pendientes:
+            await _refrescar_pendientes()
+
+
+async def obtener_empleado(empleado_id: str) -> Optional[dict]:
+    """Empleado de v_empleados_completo por id, o None si no existe"""
+    await _preparar()
+    empleado = _por_id.get(str(empleado_id))
+    if empleado is None:
+        # Pudo crearse por fuera de la app: confirmar contra la vista
+        _estadisticas["fallos"] += 1
+        result = await ejecutar(get_admin_client().table(VISTA).select("*").eq("id", empleado_id))
+        if not result.data:
+            return None
+        empleado = result.data[0]
+        _indexar(empleado)
+    return dict(empleado)
+
+
+async def buscar_por_email(email: str) -> Optional[dict]:
+    await _preparar()
+    empleado_id = _por_email.get(email.strip().lower())
+    return dict(_por_id[empleado_id]) if empleado_id else None
+
+
+async def buscar_por_numero(numero_empleado: str) -> Optional[dict]:
+    await _preparar()
+    empleado_id = _por_numero.get(str(numero_empleado).strip())
+    return dict(_por_id[empleado_id]) if empleado_id else None
+
+
+def clave_orden(empleado: dict) -> list:
+    """Orden de listar_empleados: nombre sin distinguir mayúsculas y luego id"""
+    return [(empleado.get("nombre_completo") or "").casefold(), str(empleado["id"])]
+
+
+async def listar_empleados(
+    activo: Optional[bool] = True,
+    proyecto_id: Optional[int] = None,
+    supervisor_id: Optional[int] = None
+) -> List[dict]:
+    """Empleados ordenados por nombre_completo (y id), con los mismos filtros que la vista"""
+    global _ordenados
+    await _preparar()
+    if _ordenados is None:
+        _ordenados = sorted(_por_id.values(), key=clave_orden)
+    return [
+        dict(e) for e in _ordenados
+        if (activo is None or e.get("activo") == activo)
+        and (not proyecto_id or e.get("proyecto_id") == proyecto_id)
+        and (not supervisor_id or e.get("supervisor_id") == supervisor_id)
+    ]
+
+
+def estadisticas_directorio() -> dict:
+    return {
+        **_estadisticas,
+        "empleados": len(_por_id),
+        "pendientes": len(_pendientes),
+        "edad_segundos": round(time.monotonic() - _cargado, 1) if _cargado is not None else None,
+        "ttl": settings.directorio_empleados_ttl,
+    }
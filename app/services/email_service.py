@@ -1,5 +1,11 @@
 import smtplib
 import ssl
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from email.message import Message
+from email.mime.application import MIMEApplication
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import List, Optional
@@ -14,6 +20,183 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# ===========================================
+# POOL DE CONEXIONES SMTP
+# ===========================================
+# Hasta SMTP_POOL_SIZE conexiones autenticadas que se reutilizan entre mensajes
+# (sin repetir TLS + login por destinatario). Una conexión inactiva más de
+# SMTP_KEEPALIVE segundos se verifica con NOOP antes de usarse y se recicla tras
+# SMTP_MAX_MENSAJES envíos. Si el servidor la cierra se reconecta y se reintenta
+# el mensaje una vez.
+
+class ConexionSMTP:
+    """Conexión autenticada del pool con sus estadísticas de uso"""
+
+    _siguiente_id = 0
+
+    def __init__(self):
+        ConexionSMTP._siguiente_id += 1
+        self.id = ConexionSMTP._siguiente_id
+        self.servidor = None
+        self.creada = None
+        self.ultimo_uso = 0.0
+        self.mensajes = 0  # Enviados con el socket actual
+        self.enviados = 0
+        self.bytes = 0
+        self.errores = 0
+        self.reconexiones = 0
+        self.tiempo_envio = 0.0
+
+    def conectar(self):
+        """Abre la conexión (SSL directo o STARTTLS) y se autentica"""
+        self.cerrar()
+        if settings.smtp_use_ssl:
+            context = ssl.create_default_context()
+            servidor = smtplib.SMTP_SSL(settings.smtp_host, settings.smtp_port, context=context, timeout=30)
+        else:
+            servidor = smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=30)
+            servidor.starttls()
+        servidor.login(settings.smtp_user, settings.smtp_password)
+
+        if self.creada is not None:
+            self.reconexiones += 1
+        self.servidor = servidor
+        self.creada = time.time()
+        self.ultimo_uso = time.monotonic()
+        self.mensajes = 0
+        logger.info(f"[SMTP] Conexión #{self.id} autenticada con {settings.smtp_host}")
+
+    def viva(self) -> bool:
+        """Comprueba la conexión con NOOP si lleva tiempo inactiva"""
+        if self.servidor is None:
+            return False
+        if self.mensajes >= settings.smtp_max_mensajes:
+            return False
+        if time.monotonic() - self.ultimo_uso < settings.smtp_keepalive:
+            return True
+        try:
+            return self.servidor.noop()[0] == 250
+        except Exception:
+            return False
+
+    def enviar(self, destinatario, contenido: str):
+        inicio = time.perf_counter()
+        self.servidor.sendmail(settings.email_from, destinatario, contenido)
+        self.tiempo_envio += time.perf_counter() - inicio
+        self.ultimo_uso = time.monotonic()
+        self.mensajes += 1
+        self.enviados += 1
+        self.bytes += len(contenido)
+
+    def cerrar(self):
+        if self.servidor is not None:
+            try:
+                self.servidor.quit()
+            except Exception:
+                try:
+                    self.servidor.close()
+                except Exception:
+                    pass
+        self.servidor = None
+
+    def estadisticas(self) -> dict:
+        return {
+            "id": self.id,
+            "conectada": self.servidor is not None,
+            "creada": self.creada,
+            "enviados": self.enviados,
+            "bytes": self.bytes,
+            "errores": self.errores,
+            "reconexiones": self.reconexiones,
+            "mensajes_por_segundo": round(self.enviados / self.tiempo_envio, 2) if self.tiempo_envio else None,
+            "ms_promedio": round(self.tiempo_envio / self.enviados * 1000, 2) if self.enviados else None,
+        }
+
+
+_libres: "queue.LifoQueue[ConexionSMTP]" = queue.LifoQueue()  # LIFO: reusar la más reciente
+_conexiones: List[ConexionSMTP] = []
+_pool_lock = threading.Lock()
+
+def _es_error_conexion(e: Exception) -> bool:
+    """True si el error indica que la conexión ya no sirve (se reconecta y se reintenta)"""
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code == 421:
+        return True
+    # SMTPException hereda de OSError: excluir los errores de protocolo
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+def _tomar_conexion() -> ConexionSMTP:
+    """Toma una conexión libre, o crea una nueva si el pool no está lleno"""
+    try:
+        conexion = _libres.get_nowait()
+    except queue.Empty:
+        conexion = None
+        with _pool_lock:
+            if len(_conexiones) < settings.smtp_pool_size:
+                conexion = ConexionSMTP()
+                _conexiones.append(conexion)
+        if conexion is None:
+            conexion = _libres.get(timeout=60)
+
+    if not conexion.viva():
+        try:
+            conexion.conectar()
+        except Exception:
+            conexion.errores += 1
+            _libres.put(conexion)
+            raise
+    return conexion
+
+
+def enviar_mensaje_smtp(destinatario, mensaje: Message) -> None:
+    """
+    Envía un mensaje ya armado por una conexión del pool.
+    Lanza las excepciones de smtplib si el envío falla.
+    """
+    contenido = mensaje.as_string()
+    conexion = _tomar_conexion()
+    try:
+        try:
+            conexion.enviar(destinatario, contenido)
+        except Exception as e:
+            if not _es_error_conexion(e):
+                raise
+            # El servidor cerró la conexión (inactividad, límite de mensajes...)
+            logger.warning(f"[SMTP] Conexión #{conexion.id} caída ({type(e).__name__}), reconectando")
+            conexion.errores += 1
+            conexion.conectar()
+            conexion.enviar(destinatario, contenido)
+    except Exception as e:
+        conexion.errores += 1
+        if _es_error_conexion(e):
+            conexion.cerrar()  # Se vuelve a abrir en el siguiente uso
+        raise
+    finally:
+        _libres.put(conexion)
+
+
+def cerrar_pool_smtp():
+    """Cierra todas las conexiones del pool (shutdown de la app)"""
+    with _pool_lock:
+        for conexion in _conexiones:
+            conexion.cerrar()
+
+
+def estadisticas_smtp() -> dict:
+    """Uso del pool SMTP y throughput por conexión"""
+    conexiones = [c.estadisticas() for c in list(_conexiones)]
+    return {
+        "max_conexiones": settings.smtp_pool_size,
+        "abiertas": sum(1 for c in conexiones if c["conectada"]),
+        "libres": _libres.qsize(),
+        "enviados": sum(c["enviados"] for c in conexiones),
+        "errores": sum(c["errores"] for c in conexiones),
+        "conexiones": conexiones,
+    }
+
+
 def enviar_correo(
     destinatario: str,
     asunto: str,
@@ -57,29 +240,10 @@ def enviar_correo(
         parte_html = MIMEText(contenido_html, "html", "utf-8")
         mensaje.attach(parte_html)
         
-        logger.info(f"Mensaje creado, intentando conexión SMTP...")
         
-        # Conectar y enviar
-        if settings.smtp_use_ssl:
-            # SSL directo (puerto 465)
-            logger.info(f"Conectando con SSL a {settings.smtp_host}:{settings.smtp_port}")
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(settings.smtp_host, settings.smtp_port, context=context, timeout=30) as servidor:
-                logger.info("Conexión SSL establecida, autenticando...")
-                servidor.login(settings.smtp_user, settings.smtp_password)
-                logger.info("Autenticación exitosa, enviando mensaje...")
-                servidor.sendmail(settings.email_from, destinatario, mensaje.as_string())
-                logger.info(f"[EMAIL ENVIADO EXITOSAMENTE] Para: {destinatario}")
-        else:
-            # STARTTLS (puerto 587)
-            logger.info(f"Conectando con STARTTLS a {settings.smtp_host}:{settings.smtp_port}")
-            with smtplib.SMTP(settings.smtp_host, settings.smtp_port, timeout=30) as servidor:
-                servidor.starttls()
-                logger.info("STARTTLS establecido, autenticando...")
-                servidor.login(settings.smtp_user, settings.smtp_password)
-                logger.info("Autenticación exitosa, enviando mensaje...")
-                servidor.sendmail(settings.email_from, destinatario, mensaje.as_string())
-                logger.info(f"[EMAIL ENVIADO EXITOSAMENTE] Para: {destinatario}")
+        # Enviar por una conexión del pool
+        enviar_mensaje_smtp(destinatario, mensaje)
+        logger.info(f"[EMAIL ENVIADO EXITOSAMENTE] Para: {destinatario}")
         
         return {"success": True, "simulated": False, "message": "Email enviado correctamente"}
         
@@ -114,6 +278,43 @@ def enviar_correo(
         return {"success": False, "error": "unknown", "message": error_msg}
 
 
+def enviar_correo_con_adjunto(
+    destinatario: str,
+    asunto: str,
+    contenido_html: str,
+    adjunto: bytes,
+    nombre_archivo: str
+) -> dict:
+    """Envía un correo con un PDF adjunto"""
+    
+    if not settings.smtp_user or not settings.smtp_password:
+        return {"success": True, "simulated": True, "message": "Email simulado - sin credenciales SMTP"}
+    
+    try:
+        mensaje = MIMEMultipart()
+        mensaje["Subject"] = asunto
+        mensaje["From"] = f"{settings.email_from_name} <{settings.email_from}>"
+        mensaje["To"] = destinatario
+        
+        # Contenido HTML
+        parte_html = MIMEText(contenido_html, "html", "utf-8")
+        mensaje.attach(parte_html)
+        
+        # Adjuntar PDF
+        parte_pdf = MIMEApplication(adjunto, _subtype="pdf")
+        parte_pdf.add_header("Content-Disposition", "attachment", filename=nombre_archivo)
+        mensaje.attach(parte_pdf)
+        
+        enviar_mensaje_smtp(destinatario, mensaje)
+        return {"success": True, "message": "Email enviado correctamente"}
+        
+    except smtplib.SMTPRecipientsRefused as e:
+        return {"success": False, "error": "recipient_refused", "message": f"Destinatario rechazado: {e}"}
+    except Exception as e:
+        print(f"[ERROR] Enviando email con adjunto: {str(e)}")
+        return {"success": False, "message": str(e)}
+
+
 def enviar_correo_multiple(
     destinatarios: List[str],
     asunto: str,
@@ -132,19 +333,28 @@ def enviar_correo_multiple(
 def enviar_recordatorio_actividades(
     empleados: List[dict],
     semana: str,
-    url_sistema: str = None
+    url_sistema: str = None,
+    max_simultaneos: Optional[int] = None,
+    tiempo_limite: Optional[float] = None
 ) -> dict:
     """
     Envía recordatorio de captura de actividades a una lista de empleados.
+    Los envíos corren en paralelo (max_simultaneos, por defecto
+    RECORDATORIOS_SIMULTANEOS, nunca más que SMTP_POOL_SIZE). Al vencer
+    tiempo_limite los que no habían empezado se cancelan y se reportan como
+    fallidos; los que seguían enviándose se reportan como "en_curso" (pueden
+    llegar a entregarse).
     Retorna diccionario con resultados.
     """
     
     if url_sistema is None:
-        url_sistema = settings.APP_URL
+        url_sistema = settings.app_url
     
     enviados = 0
     fallidos = 0
+    en_curso = 0
     detalles = []
+    pendientes = []  # (nombre, email, correo) a enviar por el pool SMTP
     
     for empleado in empleados:
         email = empleado.get('email', '')
@@ -225,14 +435,44 @@ Saludos,
 {settings.company_name}
         """
         
-        resultado = enviar_correo(
-            destinatario=email,
-            asunto=asunto,
-            contenido_html=contenido_html,
-            contenido_texto=contenido_texto
-        )
-        
-        if resultado["success"]:
+        pendientes.append((nombre, email, {
+            "destinatario": email,
+            "asunto": asunto,
+            "contenido_html": contenido_html,
+            "contenido_texto": contenido_texto
+        }))
+    
+    # Enviar en paralelo. Nunca más hilos que conexiones del pool: los de más
+    # esperarían turno en _tomar_conexion y fallarían con queue.Empty
+    if max_simultaneos is None:
+        max_simultaneos = settings.recordatorios_simultaneos or settings.smtp_pool_size
+    max_simultaneos = min(max_simultaneos, settings.smtp_pool_size)
+    executor = ThreadPoolExecutor(max_workers=max(1, max_simultaneos))
+    futuros = [executor.submit(enviar_correo, **p[2]) for p in pendientes]
+    wait(futuros, timeout=tiempo_limite)
+    
+    resultados = []
+    for futuro in futuros:
+        if futuro.done():
+            resultados.append(futuro.result())
+        elif futuro.cancel():
+            # No había empezado: no se envió
+            resultados.append({"success": False, "message": f"No se envió dentro del límite de {tiempo_limite}s"})
+        else:
+            # Ya estaba enviándose: termina por su cuenta y puede entregarse
+            resultados.append(None)
+    executor.shutdown(wait=False)
+    
+    for (nombre, email, _), resultado in zip(pendientes, resultados):
+        if resultado is None:
+            en_curso += 1
+            detalles.append({
+                "nombre": nombre,
+                "email": email,
+                "status": "en_curso",
+                "error": f"Seguía enviándose al cumplirse el límite de {tiempo_limite}s; puede haberse entregado"
+            })
+        elif resultado["success"]:
             enviados += 1
             detalles.append({
                 "nombre": nombre, 
@@ -253,6 +493,7 @@ Saludos,
         "total": len(empleados),
         "enviados": enviados,
         "fallidos": fallidos,
+        "en_curso": en_curso,
         "detalles": detalles
     }
 
@@ -338,7 +579,7 @@ def enviar_notificacion_password(
     """Envía email para restablecer contraseña"""
     
     if url_base is None:
-        url_base = settings.APP_URL
+        url_base = settings.app_url
     
     link = f"{url_base}/restablecer-password?token={token}"
     
@@ -474,7 +715,7 @@ def enviar_notificacion_recibo_nomina(
     """
     
     if url_sistema is None:
-        url_sistema = settings.APP_URL
+        url_sistema = settings.app_url
     
     nombre = f"{empleado.get('nombre', '')} {empleado.get('apellidos', '')}".strip()
     email = empleado.get('email', '')
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional
+
+import requests
+from reportlab.lib.utils import ImageReader
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# ===========================================
+# CACHÉ DE FIRMAS DIGITALES
+# ===========================================
+# Las firmas se guardan por `firma_url` en un LRU en memoria con presupuesto de
+# bytes (imagen original + imagen decodificada). Opcionalmente se respaldan en
+# disco en un almacén direccionado por contenido (sha256), así que varios
+# workers o un reinicio no vuelven a descargar la misma imagen. Pasado el TTL se
+# revalida con ETag / If-None-Match: si Storage responde 304 no se descarga nada.
+#
+# La caché vive en cada proceso (los renders corren en el pool de
+# app/services/pdf_executor.py y en varios workers), así que una firma nueva no
+# se avisa: /api/empleados/subir-firma guarda la URL con ?v=<sha del contenido>
+# y la firma nueva es otra clave. invalidar_firma sólo afecta al proceso actual.
+
+_memoria: "OrderedDict[str, dict]" = OrderedDict()
+_bytes_en_memoria = 0
+_lock = threading.Lock()
+_sesion = requests.Session()
+
+_estadisticas = {
+    "aciertos": 0,
+    "revalidaciones": 0,
+    "no_modificadas": 0,
+    "descargas": 0,
+    "lecturas_disco": 0,
+    "errores": 0,
+    "desalojos": 0,
+}
+
+
+def _sha256(datos: bytes) -> str:
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _decodificar(datos: bytes) -> ImageReader:
+    """Decodifica la imagen una sola vez; los renders sólo leen el resultado"""
+    reader = ImageReader(BytesIO(datos))
+    reader.getRGBData()
+    return reader
+
+
+# -------------------------------------------
+# Almacén en disco
+# -------------------------------------------
+
+def _ruta_meta(url: str) -> Optional[str]:
+    if not settings.firmas_cache_dir:
+        return None
+    return os.path.join(settings.firmas_cache_dir, "urls", f"{_sha256(url.encode())}.json")
+
+
+def _ruta_objeto(sha: str) -> str:
+    return os.path.join(settings.firmas_cache_dir, "objetos", sha[:2], sha)
+
+
+def _escribir_atomico(ruta: str, datos: bytes):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(datos)
+    os.replace(temporal, ruta)
+
+
+def _leer_disco(url: str) -> Optional[dict]:
+    """Lee metadatos y contenido de una firma del almacén en disco"""
+    ruta = _ruta_meta(url)
+    if not ruta or not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(_ruta_objeto(meta["sha256"]), "rb") as f:
+            datos = f.read()
+        if _sha256(datos) != meta["sha256"]:
+            return None
+        return {"datos": datos, "etag": meta.get("etag"), "sha256": meta["sha256"]}
+    except Exception as e:
+        print(f"[FIRMAS] Error leyendo caché en disco: {e}")
+        return None
+
+
+def _guardar_disco(url: str, datos: bytes, etag: Optional[str], sha: str):
+    ruta = _ruta_meta(url)
+    if not ruta:
+        return
+    try:
+        objeto = _ruta_objeto(sha)
+        if not os.path.exists(objeto):
+            _escribir_atomico(objeto, datos)
+        _escribir_atomico(ruta, json.dumps({"url": url, "sha256": sha, "etag": etag}).encode())
+    except Exception as e:
+        print(f"[FIRMAS] Error guardando caché en disco: {e}")
+
+
+# -------------------------------------------
+# LRU en memoria
+# -------------------------------------------
+
+def _guardar_memoria(url: str, datos: bytes, etag: Optional[str], sha: str, reader: ImageReader) -> dict:
+    """Inserta una entrada y desaloja las menos usadas hasta respetar el presupuesto"""
+    global _bytes_en_memoria
+
+    entrada = {
+        "reader": reader,
+        "etag": etag,
+        "sha256": sha,
+        "tamano": len(datos) + len(reader.getRGBData()),
+        "verificada": time.monotonic(),
+    }
+    presupuesto = settings.firmas_cache_mb * 1024 * 1024
+
+    with _lock:
+        anterior = _memoria.pop(url, None)
+        if anterior:
+            _bytes_en_memoria -= anterior["tamano"]
+
+        if entrada["tamano"] <= presupuesto:
+            _memoria[url] = entrada
+            _bytes_en_memoria += entrada["tamano"]
+
+        while _bytes_en_memoria > presupuesto and _memoria:
+            _, desalojada = _memoria.popitem(last=False)
+            _bytes_en_memoria -= desalojada["tamano"]
+            _estadisticas["desalojos"] += 1
+
+    return entrada
+
+
+def obtener_firma(url: Optional[str]) -> Optional[ImageReader]:
+    """
+    Regresa la firma decodificada lista para ReportLab, o None si no hay firma
+    o no se pudo obtener. Si Storage no responde se usa la última copia conocida.
+    """
+    if not url:
+        return None
+
+    with _lock:
+        entrada = _memoria.get(url)
+        if entrada:
+            _memoria.move_to_end(url)
+
+    if entrada and time.monotonic() - entrada["verificada"] < settings.firmas_cache_ttl:
+        _estadisticas["aciertos"] += 1
+        return entrada["reader"]
+
+    # Sin copia en memoria: intentar con el almacén en disco
+    en_disco = None
+    if entrada is None:
+        en_disco = _leer_disco(url)
+        if en_disco:
+            _estadisticas["lecturas_disco"] += 1
+
+    etag = entrada["etag"] if entrada else (en_disco or {}).get("etag")
+    encabezados = {"If-None-Match": etag} if etag else {}
+    if etag:
+        _estadisticas["revalidaciones"] += 1
+
+    try:
+        response = _sesion.get(url, headers=encabezados, timeout=10)
+    except Exception as e:
+        print(f"[FIRMAS] Error descargando firma: {e}")
+        response = None
+
+    if response is not None and response.status_code == 304 and (entrada or en_disco):
+        _estadisticas["no_modificadas"] += 1
+        if entrada:
+            entrada["verificada"] = time.monotonic()
+            return entrada["reader"]
+        try:
+            reader = _decodificar(en_disco["datos"])
+        except Exception as e:
+            print(f"[FIRMAS] Firma en disco inválida: {e}")
+            return None
+        return _guardar_memoria(url, en_disco["datos"], en_disco["etag"], en_disco["sha256"], reader)["reader"]
+
+    if response is not None and response.status_code == 200:
+        datos = response.content
+        try:
+            reader = _decodificar(datos)
+        except Exception as e:
+            _estadisticas["errores"] += 1
+            print(f"[FIRMAS] Imagen de firma inválida ({url}): {e}")
+            return None
+        _estadisticas["descargas"] += 1
+        sha = _sha256(datos)
+        nuevo_etag = response.headers.get("ETag")
+        _guardar_disco(url, datos, nuevo_etag, sha)
+        return _guardar_memoria(url, datos, nuevo_etag, sha, reader)["reader"]
+
+    # Storage caído o respuesta inesperada: servir la copia que haya
+    _estadisticas["errores"] += 1
+    if response is not None:
+        print(f"[FIRMAS] Respuesta {response.status_code} al descargar firma")
+    if entrada:
+        return entrada["reader"]
+    if en_disco:
+        try:
+            return _decodificar(en_disco["datos"])
+        except Exception:
+            return None
+    return None
+
+
+def invalidar_firma(url: Optional[str] = None):
+    """Olvida una firma (o todas) en este proceso y en el almacén en disco"""
+    global _bytes_en_memoria
+
+    with _lock:
+        if url is None:
+            _memoria.clear()
+            _bytes_en_memoria = 0
+        else:
+            entrada = _memoria.pop(url, None)
+            if entrada:
+                _bytes_en_memoria -= entrada["tamano"]
+
+    if url is not None:
+        ruta = _ruta_meta(url)
+        if ruta and os.path.exists(ruta):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def estadisticas_firmas() -> dict:
+    """Uso de la caché de firmas"""
+    return {
+        **_estadisticas,
+        "entradas": len(_memoria),
+        "bytes": _bytes_en_memoria,
+        "presupuesto_bytes": settings.firmas_cache_mb * 1024 * 1024,
+    }
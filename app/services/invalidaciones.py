@@ -0,0 +1,284 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# ===========================================
+# BUS DE INVALIDACIÓN DE CACHÉS ENTRE WORKERS
+# ===========================================
+# Cada worker de uvicorn tiene sus propias cachés en memoria (catálogos,
+# anuncios, empleados). Cuando un endpoint escribe, publica las claves
+# afectadas ("catalogos:puestos", "empleados:<id>", "anuncios"): se descartan
+# de inmediato en el worker que escribió y se avisa a los demás.
+# CACHE_INVALIDACION elige el transporte:
+#
+#   "archivo"  - bitácora SQLite (CACHE_INVALIDACION_DB) que cada worker revisa
+#                cada CACHE_INVALIDACION_INTERVALO segundos. Un solo servidor.
+#   "postgres" - LISTEN/NOTIFY sobre CACHE_INVALIDACION_DSN (conexión directa o
+#                pooler en modo sesión; requiere `pip install psycopg`). Varios
+#                servidores.
+#   "local"    - sólo el propio worker (un solo worker / desarrollo).
+#
+# Si un worker pierde mensajes (reconexión a Postgres) descarta todas sus
+# cachés. El TTL de cada caché sigue siendo el límite en el peor caso.
+#
+# Los suscriptores reciben la parte después de ":" o None para "todo el tema".
+
+IDENTIDAD = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+CANAL = "cache_invalidacion"
+RETENCION_SEGUNDOS = 3600  # Mensajes que se conservan en la bitácora de archivo
+
+_suscriptores: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+_estadisticas = {
+    "publicadas": 0,
+    "recibidas": 0,
+    "errores": 0,
+    "resincronizaciones": 0,
+}
+
+
+def suscribir(tema: str, manejador: Callable[[Optional[str]], None]):
+    """Registra la función que descarta entradas de un tema ("catalogos", "anuncios", ...)"""
+    _suscriptores.setdefault(tema, []).append(manejador)
+
+
+def _aplicar(claves: List[str]):
+    for clave in claves:
+        tema, _, subclave = clave.partition(":")
+        for manejador in _suscriptores.get(tema, []):
+            try:
+                manejador(subclave or None)
+            except Exception as e:
+                print(f"[CACHE] Error invalidando '{clave}': {e}")
+
+
+def _aplicar_todo():
+    """Descarta todas las cachés locales (posibles mensajes perdidos)"""
+    _estadisticas["resincronizaciones"] += 1
+    _aplicar(list(_suscriptores))
+
+
+class _BusArchivo:
+    """Bitácora SQLite compartida por los workers del mismo servidor"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.ultimo = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._ultima_purga = 0.0
+
+    def _conexion(self) -> sqlite3.Connection:
+        if self._db is None:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._db = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS invalidaciones ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, origen TEXT NOT NULL, claves TEXT NOT NULL, creada REAL NOT NULL)"
+            )
+        return self._db
+
+    def iniciar(self):
+        # Lo anterior al arranque no importa: las cachés de este worker están vacías
+        with self._lock:
+            fila = self._conexion().execute("SELECT COALESCE(MAX(id), 0) FROM invalidaciones").fetchone()
+            self.ultimo = fila[0]
+
+    def publicar(self, claves: List[str]):
+        ahora = time.time()
+        with self._lock:
+            db = self._conexion()
+            db.execute(
+                "INSERT INTO invalidaciones (origen, claves, creada) VALUES (?, ?, ?)",
+                (IDENTIDAD, json.dumps(claves), ahora)
+            )
+            if ahora - self._ultima_purga > 60:
+                db.execute("DELETE FROM invalidaciones WHERE creada < ?", (ahora - RETENCION_SEGUNDOS,))
+                self._ultima_purga = ahora
+
+    def leer(self) -> List[List[str]]:
+        with self._lock:
+            filas = self._conexion().execute(
+                "SELECT id, origen, claves FROM invalidaciones WHERE id > ? ORDER BY id", (self.ultimo,)
+            ).fetchall()
+        if filas:
+            self.ultimo = filas[-1][0]
+        return [json.loads(claves) for _, origen, claves in filas if origen != IDENTIDAD]
+
+    def cerrar(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class _BusPostgres:
+    """LISTEN/NOTIFY con psycopg: una conexión escucha y otra publica"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._escucha = None
+        self._publica = None
+        self._lock_publica = asyncio.Lock()
+
+    async def _conectar(self):
+        try:
+            import psycopg
+        except ImportError:
+            raise RuntimeError("CACHE_INVALIDACION=postgres requiere el paquete psycopg (pip install psycopg)")
+        return await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+
+    async def iniciar(self):
+        self._escucha = await self._conectar()
+        await self._escucha.execute(f"LISTEN {CANAL}")
+
+    async def publicar(self, claves: List[str]):
+        mensaje = json.dumps({"origen": IDENTIDAD, "claves": claves})
+        async with self._lock_publica:
+            if self._publica is None or self._publica.closed:
+                self._publica = await self._conectar()
+            await self._publica.execute("SELECT pg_notify(%s, %s)", (CANAL, mensaje))
+
+    async def escuchar(self):
+        """Entrega los mensajes de otros workers; termina tras un segundo sin mensajes"""
+        if self._escucha is None or self._escucha.closed:
+            await self.iniciar()
+            _aplicar_todo()  # Lo publicado mientras estuvo desconectado se perdió
+        async for aviso in self._escucha.notifies(timeout=1.0):
+            mensaje = json.loads(aviso.payload)
+            if mensaje.get("origen") != IDENTIDAD:
+                yield mensaje.get("claves", [])
+
+    async def cerrar(self):
+        for conexion in (self._escucha, self._publica):
+            if conexion is not None and not conexion.closed:
+                await conexion.close()
+        self._escucha = None
+        self._publica = None
+
+
+def _crear_bus():
+    if settings.cache_invalidacion == "archivo":
+        return _BusArchivo(settings.cache_invalidacion_db)
+    if settings.cache_invalidacion == "postgres":
+        if not settings.cache_invalidacion_dsn:
+            raise RuntimeError("CACHE_INVALIDACION=postgres requiere CACHE_INVALIDACION_DSN")
+        return _BusPostgres(settings.cache_invalidacion_dsn)
+    return None
+
+
+_bus = _crear_bus()
+_tarea: Optional[asyncio.Task] = None
+_activa = False
+
+
+async def publicar_invalidacion(*claves: str):
+    """
+    Descarta las claves en este worker y las difunde a los demás. Llamar
+    después de que la escritura se confirmó en la base.
+    """
+    _aplicar(list(claves))
+    _estadisticas["publicadas"] += 1
+
+    if _bus is None:
+        return
+    try:
+        if isinstance(_bus, _BusArchivo):
+            await run_in_threadpool(_bus.publicar, list(claves))
+        else:
+            await _bus.publicar(list(claves))
+    except Exception as e:
+        # La escritura ya ocurrió; los demás workers se ajustan al vencer su TTL
+        _estadisticas["errores"] += 1
+        print(f"[CACHE] No se pudo difundir la invalidación {claves}: {e}")
+
+
+async def _escuchar_archivo():
+    while _activa:
+        await asyncio.sleep(settings.cache_invalidacion_intervalo)
+        try:
+            mensajes = await run_in_threadpool(_bus.leer)
+        except Exception as e:
+            _estadisticas["errores"] += 1
+            print(f"[CACHE] Error leyendo invalidaciones: {e}")
+            continue
+        for claves in mensajes:
+            _estadisticas["recibidas"] += 1
+            _aplicar(claves)
+
+
+async def _escuchar_postgres():
+    espera = 1.0
+    while _activa:
+        try:
+            async for claves in _bus.escuchar():
+                _estadisticas["recibidas"] += 1
+                _aplicar(claves)
+            espera = 1.0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _estadisticas["errores"] += 1
+            print(f"[CACHE] Conexión LISTEN perdida, reintentando en {espera:.0f}s: {e}")
+            await _bus.cerrar()
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 30.0)
+
+
+async def iniciar_invalidaciones():
+    """Conecta el bus y arranca la escucha. Llamar desde el lifespan."""
+    global _tarea, _activa
+
+    if _bus is None or _tarea is not None:
+        return
+
+    if isinstance(_bus, _BusArchivo):
+        await run_in_threadpool(_bus.iniciar)
+        escucha = _escuchar_archivo
+    else:
+        await _bus.iniciar()
+        escucha = _escuchar_postgres
+
+    _activa = True
+    _tarea = asyncio.create_task(escucha())
+    print(f"[CACHE] Bus de invalidación '{settings.cache_invalidacion}' iniciado ({IDENTIDAD})")
+
+
+async def detener_invalidaciones():
+    global _tarea, _activa
+
+    _activa = False
+    if _tarea is not None:
+        _tarea.cancel()
+        await asyncio.gather(_tarea, return_exceptions=True)
+        _tarea = None
+
+    if isinstance(_bus, _BusArchivo):
+        _bus.cerrar()
+    elif _bus is not None:
+        await _bus.cerrar()
+
+
+def estado_invalidaciones() -> dict:
+    return {
+        "modo": settings.cache_invalidacion,
+        "worker": IDENTIDAD,
+        "escuchando": _tarea is not None and not _tarea.done(),
+        "temas": sorted(_suscriptores),
+        **_estadisticas,
+    }
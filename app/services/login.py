@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.services.invalidaciones import suscribir
+
+settings = get_settings()
+
+
+# ===========================================
+# PROTECCIÓN DEL LOGIN
+# ===========================================
+# - Límite por IP con cubeta de tokens: LOGIN_RAFAGA intentos seguidos y luego
+#   LOGIN_POR_MINUTO sostenidos. Detrás de un proxy, arrancar uvicorn con
+#   --proxy-headers para que la IP sea la del cliente y no la del proxy. Toda la
+#   oficina puede salir por una misma IP: los valores por defecto dejan pasar
+#   la ola de las 9:00 y frenan a quien prueba contraseñas.
+# - Caché negativa de correos sin empleado activo durante LOGIN_CACHE_NEGATIVA
+#   segundos: se responde 401 sin tocar la red. Sólo se recuerda un correo si
+#   además falló el inicio de sesión en Supabase. Cualquier escritura en
+#   empleados (bus de invalidación) la vacía, así un empleado recién dado de
+#   alta puede entrar de inmediato.
+
+MAX_IPS = 10000  # Cubetas en memoria antes de descartar las que ya están llenas
+MAX_CORREOS = 10000  # Correos desconocidos recordados
+
+_cubetas: Dict[str, List[float]] = {}  # ip -> [tokens, último relleno]
+_desconocidos: Dict[str, float] = {}  # email -> vence
+_lock = threading.Lock()
+
+_estadisticas = {
+    "rechazados_por_limite": 0,
+    "aciertos_negativos": 0,
+}
+
+
+def _purgar_cubetas(ahora: float, tasa: float):
+    for ip, (tokens, ultimo) in list(_cubetas.items()):
+        if tokens + (ahora - ultimo) * tasa >= settings.login_rafaga:
+            del _cubetas[ip]
+
+
+def consumir_intento(ip: str) -> Optional[float]:
+    """
+    Toma un token de la cubeta de la IP. Regresa None si el intento puede
+    seguir, o los segundos que debe esperar si ya no le quedan.
+    """
+    if settings.login_por_minuto <= 0:
+        return None
+
+    tasa = settings.login_por_minuto / 60.0
+    ahora = time.monotonic()
+    with _lock:
+        cubeta = _cubetas.get(ip)
+        if cubeta is None:
+            if len(_cubetas) >= MAX_IPS:
+                _purgar_cubetas(ahora, tasa)
+            cubeta = _cubetas[ip] = [float(settings.login_rafaga), ahora]
+
+        cubeta[0] = min(float(settings.login_rafaga), cubeta[0] + (ahora - cubeta[1]) * tasa)
+        cubeta[1] = ahora
+        if cubeta[0] >= 1:
+            cubeta[0] -= 1
+            return None
+
+        _estadisticas["rechazados_por_limite"] += 1
+        return (1 - cubeta[0]) / tasa
+
+
+def _clave_email(email: str) -> str:
+    # Exactamente el valor que se busca en empleados (la consulta distingue
+    # mayúsculas): si no, un intento con otra capitalización dejaría fuera al
+    # dueño real del correo
+    return email
+
+
+def es_desconocido(email: str) -> bool:
+    """True si el correo no tenía empleado activo hace menos de LOGIN_CACHE_NEGATIVA segundos"""
+    clave = _clave_email(email)
+    with _lock:
+        vence = _desconocidos.get(clave)
+        if vence is None:
+            return False
+        if vence <= time.monotonic():
+            del _desconocidos[clave]
+            return False
+        _estadisticas["aciertos_negativos"] += 1
+        return True
+
+
+def recordar_desconocido(email: str):
+    if settings.login_cache_negativa <= 0:
+        return
+    ahora = time.monotonic()
+    with _lock:
+        if len(_desconocidos) >= MAX_CORREOS:
+            for clave, vence in list(_desconocidos.items()):
+                if vence <= ahora:
+                    del _desconocidos[clave]
+            if len(_desconocidos) >= MAX_CORREOS:
+                _desconocidos.clear()
+        _desconocidos[_clave_email(email)] = ahora + settings.login_cache_negativa
+
+
+def _olvidar_desconocidos(_clave: Optional[str] = None):
+    with _lock:
+        _desconocidos.clear()
+
+
+suscribir("empleados", _olvidar_desconocidos)
+
+
+def estadisticas_login() -> dict:
+    with _lock:
+        return {
+            **_estadisticas,
+            "ips": len(_cubetas),
+            "correos_desconocidos": len(_desconocidos),
+        }
@@ -0,0 +1,219 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Set
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# ===========================================
+# EJECUTOR DE RENDERS PDF
+# ===========================================
+# ReportLab es CPU puro: renderizar dentro de un handler async congela el event
+# loop. Los routers envían aquí un trabajo serializable (nombre del generador +
+# argumentos) y esperan los bytes del PDF, que se generan en un pool de procesos
+# creado una sola vez en el lifespan de la app (ver app/main.py).
+#
+# La cola está acotada: como máximo PDF_WORKERS trabajos en ejecución más
+# PDF_COLA en espera. Si está llena se rechaza el trabajo (503) en lugar de
+# acumular peticiones, y cada trabajo tiene un tiempo máximo (PDF_TIMEOUT, 504).
+#
+# Un pool roto (un hijo murió) o un render colgado se resuelven cambiando de
+# pool: el primero que lo detecta crea uno nuevo (una sola vez aunque fallen
+# varios renders a la vez). Tras un tiempo agotado el pool viejo deja terminar
+# sus otros renders (hasta PDF_TIMEOUT) y luego se terminan sus procesos, así
+# que el render colgado no retiene un proceso ni un lugar de la cola.
+
+# Generadores que se pueden ejecutar en el pool (nombre -> función en pdf_generator)
+GENERADORES = {
+    "mensual": "generar_reporte_mensual",
+    "semanal": "generar_reporte_semanal",
+    "vacaciones": "generar_formato_vacaciones",
+    "responsiva": "generar_responsiva_equipo",
+}
+
+
+class PdfSaturado(Exception):
+    """La cola de renders está llena"""
+
+
+class PdfTiempoAgotado(Exception):
+    """Un render tardó más que PDF_TIMEOUT"""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_en_curso: Dict[ProcessPoolExecutor, Set[Future]] = {}  # Renders enviados a cada pool
+_cupos: Optional[asyncio.Semaphore] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_estadisticas = {"completados": 0, "rechazados": 0, "tiempo_agotado": 0, "errores": 0, "pools_reemplazados": 0}
+
+
+def num_workers() -> int:
+    """Procesos del pool (PDF_WORKERS o el número de CPUs)"""
+    return settings.pdf_workers or os.cpu_count() or 1
+
+
+def _inicializar_worker():
+    """Precarga el generador y los logos en cada proceso del pool"""
+    from app.services import pdf_generator
+    pdf_generator._cargar_logo(pdf_generator.LOGO_DEFAULT)
+    pdf_generator._cargar_logo(pdf_generator.LOGO_RESPONSIVA)
+
+
+def _ejecutar(tipo: str, kwargs: dict) -> bytes:
+    """Se ejecuta en el proceso hijo: genera el PDF y regresa sus bytes"""
+    from app.services import pdf_generator
+    generador = getattr(pdf_generator, GENERADORES[tipo])
+    return generador(**kwargs).getvalue()
+
+
+def _nuevo_pool() -> ProcessPoolExecutor:
+    # "spawn" evita heredar los hilos del proceso principal (pools HTTP, scheduler)
+    return ProcessPoolExecutor(
+        max_workers=num_workers(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_inicializar_worker
+    )
+
+
+def iniciar_pdf_executor():
+    """Crea el pool de procesos y la cola acotada. Llamar desde el lifespan."""
+    global _pool, _cupos, _loop
+
+    if _pool is not None:
+        return
+
+    _loop = asyncio.get_running_loop()
+    _pool = _nuevo_pool()
+    _cupos = asyncio.Semaphore(num_workers() + settings.pdf_cola)
+    print(f"[PDF] Pool de renders iniciado ({num_workers()} procesos, cola de {settings.pdf_cola})")
+
+
+def detener_pdf_executor():
+    """Cancela los trabajos en espera y cierra el pool"""
+    global _pool, _cupos, _loop
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+    _pool = None
+    _cupos = None
+    _loop = None
+
+
+def _liberar_cupo(_future):
+    # El cupo se libera cuando el proceso termina de verdad (o se termina el
+    # pool), no cuando el handler deja de esperar, para que la cola refleje el
+    # trabajo real
+    if _loop is not None and _cupos is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_cupos.release)
+
+
+def _reemplazar_pool(anterior: ProcessPoolExecutor, motivo: str) -> bool:
+    """
+    Crea un pool nuevo si `anterior` sigue siendo el actual. Regresa False si
+    otro render ya lo reemplazó.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not anterior:
+            return False
+        _pool = _nuevo_pool()
+    _estadisticas["pools_reemplazados"] += 1
+    print(f"[PDF] {motivo}: pool de renders reemplazado")
+    return True
+
+
+def _terminar_procesos(pool: ProcessPoolExecutor):
+    """Cierra un pool matando sus procesos (también los que no responden)"""
+    terminar = getattr(pool, "terminate_workers", None)  # Python 3.14+
+    if terminar is not None:
+        terminar()
+        return
+    # shutdown() suelta la referencia a los procesos: tomarlos antes
+    procesos = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for proceso in procesos:
+        if proceso.is_alive():
+            proceso.terminate()
+
+
+async def _retirar_pool(pool: ProcessPoolExecutor):
+    """Espera los demás renders del pool (hasta PDF_TIMEOUT) y termina sus procesos"""
+    pendientes = [f for f in list(_en_curso.get(pool, ())) if not f.done()]
+    if pendientes:
+        await asyncio.to_thread(futures_wait, pendientes, timeout=settings.pdf_timeout)
+    _terminar_procesos(pool)
+    _en_curso.pop(pool, None)
+
+
+async def renderizar_pdf(tipo: str, esperar: bool = False, **kwargs) -> bytes:
+    """
+    Genera un PDF en el pool de procesos y regresa sus bytes.
+
+    `tipo` es una llave de GENERADORES y `kwargs` los argumentos del generador
+    (deben ser serializables). Con esperar=True (reportes en lote) se espera a
+    que haya lugar en la cola en vez de rechazar el trabajo.
+    """
+    if _pool is None or _cupos is None:
+        raise RuntimeError("El ejecutor de PDFs no está iniciado (ver lifespan en app/main.py)")
+    if tipo not in GENERADORES:
+        raise ValueError(f"Generador de PDF desconocido: {tipo}")
+
+    if _cupos.locked() and not esperar:
+        _estadisticas["rechazados"] += 1
+        raise PdfSaturado("Hay demasiados PDFs en proceso, intenta de nuevo en unos segundos")
+    await _cupos.acquire()
+
+    pool = _pool
+    try:
+        future = pool.submit(_ejecutar, tipo, kwargs)
+    except BrokenProcessPool:
+        # Un proceso hijo murió (p. ej. por memoria): recrear el pool
+        _cupos.release()
+        _estadisticas["errores"] += 1
+        if _reemplazar_pool(pool, "Pool roto"):
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    en_curso = _en_curso.setdefault(pool, set())
+    en_curso.add(future)
+    future.add_done_callback(en_curso.discard)
+    future.add_done_callback(_liberar_cupo)
+
+    try:
+        pdf = await asyncio.wait_for(asyncio.wrap_future(future), timeout=settings.pdf_timeout)
+    except asyncio.TimeoutError:
+        _estadisticas["tiempo_agotado"] += 1
+        print(f"[PDF] Render '{tipo}' excedió {settings.pdf_timeout}s")
+        if _reemplazar_pool(pool, f"Render '{tipo}' colgado"):
+            asyncio.ensure_future(_retirar_pool(pool))
+        raise PdfTiempoAgotado(f"La generación del PDF excedió {settings.pdf_timeout} segundos")
+    except BrokenProcessPool:
+        _estadisticas["errores"] += 1
+        if _reemplazar_pool(pool, "Pool roto"):
+            pool.shutdown(wait=False, cancel_futures=True)
+            _en_curso.pop(pool, None)
+        raise
+    except Exception:
+        _estadisticas["errores"] += 1
+        raise
+
+    _estadisticas["completados"] += 1
+    return pdf
+
+
+def estadisticas_pdf() -> dict:
+    """Estado del pool de renders"""
+    return {
+        **_estadisticas,
+        "iniciado": _pool is not None,
+        "workers": num_workers(),
+        "cola": settings.pdf_cola,
+    }
@@ -7,12 +7,14 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
 from datetime import date, datetime, timedelta
 from typing import List, Optional
+from functools import lru_cache
+from reportlab.lib.utils import ImageReader
 import calendar
 import os
-import requests
-import tempfile
+import threading
 
 from app.config import get_settings
+from app.services.firmas_cache import obtener_firma
 
 settings = get_settings()
 
@@ -32,27 +34,6 @@ DIAS_SEMANA_NOMBRE = {
 }
 
 
-def descargar_imagen_firma(url: str) -> Optional[str]:
-    """
-    Descarga una imagen de firma desde URL y retorna el path temporal
-    """
-    if not url:
-        return None
-    
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            # Crear archivo temporal
-            suffix = ".png" if "png" in url.lower() else ".jpg"
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-            temp_file.write(response.content)
-            temp_file.close()
-            return temp_file.name
-    except Exception as e:
-        print(f"[ERROR] Descargando firma: {str(e)}")
-    
-    return None
-
 # Colores corporativos
 COLOR_HEADER = colors.Color(0.12, 0.23, 0.37)  # Azul oscuro IDS
 COLOR_HEADER_TEXT = colors.white
@@ -60,6 +41,75 @@ COLOR_BORDER = colors.black
 COLOR_LIGHT_GRAY = colors.Color(0.95, 0.95, 0.95)
 COLOR_BOX_BORDER = colors.Color(0.7, 0.7, 0.7)
 
+LOGO_DEFAULT = "app/static/img/logo.png"
+LOGO_RESPONSIVA = os.path.join(os.path.dirname(__file__), '..', 'static', 'img', 'logo_ids.png')
+
+
+# ===========================================
+# CACHÉ DE RECURSOS ESTÁTICOS
+# ===========================================
+# Los logos se decodifican una sola vez por proceso y se vuelven a leer sólo si
+# cambia el mtime del archivo. Los estilos se construyen una vez y se comparten
+# entre renders (Paragraph no modifica su estilo).
+
+_logos: dict = {}  # path -> (mtime_ns, ImageReader)
+_logos_lock = threading.Lock()
+
+
+class _ImagenCacheada(Image):
+    """Image que usa un ImageReader ya decodificado en lugar de releer el archivo"""
+
+    def __init__(self, reader: ImageReader, width: float, height: float):
+        self._img = reader
+        Image.__init__(self, BytesIO(), width=width, height=height)
+
+
+def _cargar_logo(path: str) -> Optional[ImageReader]:
+    """Regresa el logo decodificado, recargándolo sólo si el archivo cambió"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    en_cache = _logos.get(path)
+    if en_cache and en_cache[0] == mtime:
+        return en_cache[1]
+
+    with _logos_lock:
+        en_cache = _logos.get(path)
+        if en_cache and en_cache[0] == mtime:
+            return en_cache[1]
+        try:
+            with open(path, "rb") as f:
+                reader = ImageReader(BytesIO(f.read()))
+            reader.getRGBData()  # Decodificar ahora para que los renders sólo lean
+        except Exception as e:
+            print(f"[PDF] No se pudo cargar el logo {path}: {e}")
+            return None
+        _logos[path] = (mtime, reader)
+        return reader
+
+
+def obtener_logo(path: str, width: float, height: float) -> Optional[Image]:
+    """Flowable del logo desde la caché, o None si el archivo no existe o no es válido"""
+    reader = _cargar_logo(path)
+    if reader is None:
+        return None
+    return _ImagenCacheada(reader, width, height)
+
+
+@lru_cache(maxsize=1)
+def _hoja_estilos():
+    """Hoja de estilos base de ReportLab, construida una sola vez"""
+    return getSampleStyleSheet()
+
+
+@lru_cache(maxsize=None)
+def _estilo(nombre: str, padre: Optional[str] = None, **kwargs) -> ParagraphStyle:
+    """ParagraphStyle compartido: mismos argumentos, mismo objeto"""
+    parent = _hoja_estilos()[padre] if padre else None
+    return ParagraphStyle(nombre, parent=parent, **kwargs)
+
 
 class RoundedBox(Flowable):
     """Crea un recuadro con esquinas redondeadas que contiene contenido"""
@@ -110,14 +160,14 @@ class RoundedBox(Flowable):
 class SignatureBox(Flowable):
     """Crea un recuadro de firma con esquinas redondeadas"""
     
-    def __init__(self, title, name, width=2.5*inch, height=1.2*inch, radius=8, firma_path=None):
+    def __init__(self, title, name, width=2.5*inch, height=1.2*inch, radius=8, firma=None):
         Flowable.__init__(self)
         self.title = title
         self.name = name
         self.box_width = width
         self.box_height = height
         self.radius = radius
-        self.firma_path = firma_path
+        self.firma = firma  # ImageReader en memoria (ver firmas_cache)
         
     def wrap(self, availWidth, availHeight):
         return self.box_width, self.box_height
@@ -136,14 +186,14 @@ class SignatureBox(Flowable):
         canvas.drawString((self.box_width - title_width) / 2, self.box_height - 18, self.title)
         
         # Si hay firma digital, mostrarla DENTRO del recuadro
-        if self.firma_path and os.path.exists(self.firma_path):
+        if self.firma is not None:
             try:
                 # Calcular posición centrada para la firma (encima de la línea, dentro del recuadro)
                 firma_width = 1.0 * inch
                 firma_height = 0.4 * inch
                 x = (self.box_width - firma_width) / 2
                 y = 40  # Posición encima de la línea pero dentro del recuadro
-                canvas.drawImage(self.firma_path, x, y, width=firma_width, height=firma_height, preserveAspectRatio=True, mask='auto')
+                canvas.drawImage(self.firma, x, y, width=firma_width, height=firma_height, preserveAspectRatio=True, mask='auto')
             except Exception as e:
                 print(f"[ERROR] Dibujando firma: {str(e)}")
         
@@ -184,12 +234,10 @@ def generar_reporte_mensual(
     )
     
     elements = []
-    styles = getSampleStyleSheet()
-    
     # Estilos personalizados
-    style_normal = ParagraphStyle('CustomNormal', parent=styles['Normal'], fontSize=8, leading=10)
-    style_small = ParagraphStyle('Small', parent=styles['Normal'], fontSize=7, leading=9)
-    style_title = ParagraphStyle('ReportTitle', parent=styles['Normal'], fontSize=10, fontName='Helvetica-Bold', alignment=TA_CENTER)
+    style_normal = _estilo('CustomNormal', padre='Normal', fontSize=8, leading=10)
+    style_small = _estilo('Small', padre='Normal', fontSize=7, leading=9)
+    style_title = _estilo('ReportTitle', padre='Normal', fontSize=10, fontName='Helvetica-Bold', alignment=TA_CENTER)
     
     # Obtener nombre del mes y período
     mes_nombre = MESES_ES.get(mes, f"Mes {mes}")
@@ -200,16 +248,8 @@ def generar_reporte_mensual(
     # ========================================
     
     # Logo (lado izquierdo)
-    logo_cell = ""
-    default_logo_path = "app/static/img/logo.png"
-    actual_logo_path = logo_path or default_logo_path
-    
-    if os.path.exists(actual_logo_path):
-        try:
-            logo_cell = Image(actual_logo_path, width=1.8*inch, height=0.7*inch)
-        except:
-            logo_cell = Paragraph("<b><font size='14'>ids.it</font></b><br/><font size='6'>INFORMÁTICA Y DESARROLLO EN SISTEMAS</font>", style_normal)
-    else:
+    logo_cell = obtener_logo(logo_path or LOGO_DEFAULT, width=1.8*inch, height=0.7*inch)
+    if logo_cell is None:
         logo_cell = Paragraph("<b><font size='14'>ids.it</font></b><br/><font size='6'>INFORMÁTICA Y DESARROLLO EN SISTEMAS</font>", style_normal)
     
     # Información del header (lado derecho en recuadro)
@@ -398,13 +438,10 @@ Período: {periodo_texto}
     elements.append(Spacer(1, 0.35*inch))
     
     # Obtener firma digital si existe
-    firma_url = empleado.get('firma_url')
-    firma_temp_path = None
-    if firma_url:
-        firma_temp_path = descargar_imagen_firma(firma_url)
+    firma = obtener_firma(empleado.get('firma_url'))
     
     # Crear recuadros de firma con esquinas redondeadas
-    firma_consultor = SignatureBox("Consultor", nombre_empleado, width=2.8*inch, height=1.1*inch, radius=10, firma_path=firma_temp_path)
+    firma_consultor = SignatureBox("Consultor", nombre_empleado, width=2.8*inch, height=1.1*inch, radius=10, firma=firma)
     firma_empresa = SignatureBox("Informática y Desarrollo en Sistemas", "IDS", width=2.8*inch, height=1.1*inch, radius=10)
     
     firma_data = [[firma_consultor, '', firma_empresa]]
@@ -417,17 +454,10 @@ Período: {periodo_texto}
     
     # Número de página
     elements.append(Spacer(1, 0.15*inch))
-    elements.append(Paragraph("<font size='7'>1</font>", ParagraphStyle('PageNum', alignment=TA_RIGHT)))
+    elements.append(Paragraph("<font size='7'>1</font>", _estilo('PageNum', alignment=TA_RIGHT)))
     
     doc.build(elements)
     
-    # Limpiar archivo temporal de firma
-    if firma_temp_path and os.path.exists(firma_temp_path):
-        try:
-            os.unlink(firma_temp_path)
-        except:
-            pass
-    
     buffer.seek(0)
     return buffer
 
@@ -457,10 +487,8 @@ def generar_reporte_semanal(
     )
     
     elements = []
-    styles = getSampleStyleSheet()
-    
-    style_normal = ParagraphStyle('CustomNormal', parent=styles['Normal'], fontSize=8, leading=10)
-    style_small = ParagraphStyle('Small', parent=styles['Normal'], fontSize=7, leading=9)
+    style_normal = _estilo('CustomNormal', padre='Normal', fontSize=8, leading=10)
+    style_small = _estilo('Small', padre='Normal', fontSize=7, leading=9)
     
     # Calcular período (mes del inicio de semana)
     mes_nombre = MESES_ES.get(semana_inicio.month, f"Mes {semana_inicio.month}")
@@ -471,16 +499,8 @@ def generar_reporte_semanal(
     # ========================================
     
     # Logo
-    logo_cell = ""
-    default_logo_path = "app/static/img/logo.png"
-    actual_logo_path = logo_path or default_logo_path
-    
-    if os.path.exists(actual_logo_path):
-        try:
-            logo_cell = Image(actual_logo_path, width=1.8*inch, height=0.7*inch)
-        except:
-            logo_cell = Paragraph("<b><font size='14'>ids.it</font></b><br/><font size='6'>INFORMÁTICA Y DESARROLLO EN SISTEMAS</font>", style_normal)
-    else:
+    logo_cell = obtener_logo(logo_path or LOGO_DEFAULT, width=1.8*inch, height=0.7*inch)
+    if logo_cell is None:
         logo_cell = Paragraph("<b><font size='14'>ids.it</font></b><br/><font size='6'>INFORMÁTICA Y DESARROLLO EN SISTEMAS</font>", style_normal)
     
     # Información del header
@@ -636,12 +656,9 @@ Período: {periodo_texto}
     # FIRMAS CON RECUADROS REDONDEADOS
     # ========================================
     # Obtener firma digital si existe
-    firma_url = empleado.get('firma_url')
-    firma_temp_path = None
-    if firma_url:
-        firma_temp_path = descargar_imagen_firma(firma_url)
+    firma = obtener_firma(empleado.get('firma_url'))
     
-    firma_empleado = SignatureBox("Consultor", nombre_empleado, width=2.8*inch, height=1.1*inch, radius=10, firma_path=firma_temp_path)
+    firma_empleado = SignatureBox("Consultor", nombre_empleado, width=2.8*inch, height=1.1*inch, radius=10, firma=firma)
     firma_supervisor = SignatureBox("Supervisor", "Autorización", width=2.8*inch, height=1.1*inch, radius=10)
     
     firma_data = [[firma_empleado, '', firma_supervisor]]
@@ -654,13 +671,6 @@ Período: {periodo_texto}
     
     doc.build(elements)
     
-    # Limpiar archivo temporal de firma
-    if firma_temp_path and os.path.exists(firma_temp_path):
-        try:
-            os.unlink(firma_temp_path)
-        except:
-            pass
-    
     buffer.seek(0)
     return buffer
 
@@ -686,14 +696,12 @@ def generar_formato_vacaciones(
     )
     
     elements = []
-    styles = getSampleStyleSheet()
-    
     # Estilos personalizados
-    style_title = ParagraphStyle('VacTitle', parent=styles['Normal'], fontSize=14, fontName='Helvetica-Bold', alignment=TA_CENTER)
-    style_normal = ParagraphStyle('VacNormal', parent=styles['Normal'], fontSize=9, leading=11)
-    style_bold = ParagraphStyle('VacBold', parent=styles['Normal'], fontSize=9, fontName='Helvetica-Bold', leading=11)
-    style_small = ParagraphStyle('VacSmall', parent=styles['Normal'], fontSize=8, leading=10)
-    style_center = ParagraphStyle('VacCenter', parent=styles['Normal'], fontSize=9, alignment=TA_CENTER)
+    style_title = _estilo('VacTitle', padre='Normal', fontSize=14, fontName='Helvetica-Bold', alignment=TA_CENTER)
+    style_normal = _estilo('VacNormal', padre='Normal', fontSize=9, leading=11)
+    style_bold = _estilo('VacBold', padre='Normal', fontSize=9, fontName='Helvetica-Bold', leading=11)
+    style_small = _estilo('VacSmall', padre='Normal', fontSize=8, leading=10)
+    style_center = _estilo('VacCenter', padre='Normal', fontSize=9, alignment=TA_CENTER)
     
     # Colores
     color_header = colors.Color(0.12, 0.23, 0.37)  # Azul oscuro IDS
@@ -703,16 +711,8 @@ def generar_formato_vacaciones(
     # ========================================
     # ENCABEZADO CON LOGO
     # ========================================
-    logo_cell = ""
-    default_logo_path = "app/static/img/logo.png"
-    actual_logo_path = logo_path or default_logo_path
-    
-    if os.path.exists(actual_logo_path):
-        try:
-            logo_cell = Image(actual_logo_path, width=1.5*inch, height=0.6*inch)
-        except:
-            logo_cell = Paragraph("<b><font size='12' color='#1e3a5f'>ids.it</font></b>", style_normal)
-    else:
+    logo_cell = obtener_logo(logo_path or LOGO_DEFAULT, width=1.5*inch, height=0.6*inch)
+    if logo_cell is None:
         logo_cell = Paragraph("<b><font size='12' color='#1e3a5f'>ids.it</font></b>", style_normal)
     
     # Título
@@ -894,21 +894,14 @@ def generar_formato_vacaciones(
     # ========================================
     # FIRMAS (con firma digital si existe)
     # ========================================
-    firma_url = empleado.get('firma_url')
     firma_empleado_cell = '_' * 30  # Default sin firma
     
-    if firma_url:
+    firma = obtener_firma(empleado.get('firma_url'))
+    if firma is not None:
         try:
-            # Descargar imagen directamente a memoria
-            response = requests.get(firma_url, timeout=10)
-            if response.status_code == 200:
-                from io import BytesIO as FirmaBuffer
-                firma_bytes = FirmaBuffer(response.content)
-                firma_imagen = Image(firma_bytes, width=1.2*inch, height=0.5*inch)
-                firma_empleado_cell = firma_imagen
+            firma_empleado_cell = _ImagenCacheada(firma, width=1.2*inch, height=0.5*inch)
         except Exception as e:
             print(f"[ERROR] Cargando firma en vacaciones: {e}")
-            firma_empleado_cell = '_' * 30
     
     firma_data = [
         [firma_empleado_cell, '', '_' * 30],
@@ -933,9 +926,9 @@ def generar_formato_vacaciones(
     # ========================================
     # ENCABEZADO OBSERVACIONES
     # ========================================
-    elements.append(Paragraph("_" * 60, ParagraphStyle('Line', alignment=TA_CENTER)))
+    elements.append(Paragraph("_" * 60, _estilo('Line', alignment=TA_CENTER)))
     elements.append(Paragraph("<b>INFORMÁTICA Y DESARROLLO EN<br/>SISTEMAS S. A. DE C.V.</b>", 
-                              ParagraphStyle('CompanyName', fontSize=10, alignment=TA_CENTER, leading=12)))
+                              _estilo('CompanyName', fontSize=10, alignment=TA_CENTER, leading=12)))
     elements.append(Spacer(1, 0.1*inch))
     
     # ========================================
@@ -947,7 +940,7 @@ Los días de vacaciones no son acumulables.<br/><br/>
 Las vacaciones tienen una vigencia de 12 meses posteriores a la fecha en que cumples años con la empresa. Es decir, si yo cumplo años con la empresa el 10 de enero del presente, tengo hasta el 10 de enero del siguiente año; para tomar mis vacaciones; de otra manera se pierden los días. Es importante planear sus días de descanso, desde el principio de tu nuevo periodo.<br/><br/>
 Solicita tus vacaciones y prográmalas con un mes de anticipación."""
     
-    obs_paragraph = Paragraph(observaciones_text, ParagraphStyle('Obs', fontSize=8, leading=11, alignment=TA_LEFT))
+    obs_paragraph = Paragraph(observaciones_text, _estilo('Obs', fontSize=8, leading=11, alignment=TA_LEFT))
     
     obs_data = [[obs_paragraph]]
     obs_table = Table(obs_data, colWidths=[7*inch])
@@ -964,10 +957,10 @@ Solicita tus vacaciones y prográmalas con un mes de anticipación."""
     # ========================================
     # PIE DE PÁGINA CON DIRECCIÓN
     # ========================================
-    elements.append(Paragraph("_" * 85, ParagraphStyle('FooterLine', alignment=TA_CENTER, fontSize=8)))
+    elements.append(Paragraph("_" * 85, _estilo('FooterLine', alignment=TA_CENTER, fontSize=8)))
     elements.append(Paragraph(
         "<font size='7'>Daniel Huacuja #32, Magisterial Vista Bella, Tlanepantla, Estado de México. C. P. 54050 Tels.: 555359-4488 y 551663-0359</font>",
-        ParagraphStyle('FooterAddress', alignment=TA_CENTER)
+        _estilo('FooterAddress', alignment=TA_CENTER)
     ))
     
     doc.build(elements)
@@ -1005,12 +998,10 @@ def generar_responsiva_equipo(
     )
     
     elements = []
-    styles = getSampleStyleSheet()
-    
     # Estilos personalizados
-    style_title = ParagraphStyle(
+    style_title = _estilo(
         'TitleResponsiva',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=14,
         fontName='Helvetica-Bold',
         alignment=TA_LEFT,
@@ -1018,48 +1009,48 @@ def generar_responsiva_equipo(
         letterSpacing=4
     )
     
-    style_company = ParagraphStyle(
+    style_company = _estilo(
         'Company',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=10,
         fontName='Helvetica-Bold',
         alignment=TA_RIGHT
     )
     
-    style_normal = ParagraphStyle(
+    style_normal = _estilo(
         'NormalText',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=10,
         fontName='Helvetica',
         leading=14
     )
     
-    style_small = ParagraphStyle(
+    style_small = _estilo(
         'SmallText',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=8,
         fontName='Helvetica',
         textColor=colors.gray
     )
     
-    style_bold = ParagraphStyle(
+    style_bold = _estilo(
         'BoldText',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=10,
         fontName='Helvetica-Bold'
     )
     
-    style_center = ParagraphStyle(
+    style_center = _estilo(
         'CenterText',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=10,
         fontName='Helvetica',
         alignment=TA_CENTER
     )
     
-    style_underline = ParagraphStyle(
+    style_underline = _estilo(
         'UnderlineText',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=10,
         fontName='Helvetica-Bold',
         underline=True
@@ -1097,8 +1088,6 @@ def generar_responsiva_equipo(
     # ENCABEZADO
     # ========================================
     # Logo y título en una tabla
-    logo_path = os.path.join(os.path.dirname(__file__), '..', 'static', 'img', 'logo_ids.png')
-    
     header_data = [
         [
             Paragraph("R E S G U A R D O", style_title),
@@ -1111,13 +1100,9 @@ def generar_responsiva_equipo(
     ]
     
     # Intentar agregar logo
-    try:
-        if os.path.exists(logo_path):
-            logo = Image(logo_path, width=1.5*inch, height=0.5*inch)
-            header_data[0][1] = logo
-            header_data[1][1] = Paragraph("<b>INFORMÁTICA Y DESARROLLO EN SISTEMAS, S.A. DE C.V</b>", style_company)
-    except:
-        pass
+    logo = obtener_logo(LOGO_RESPONSIVA, width=1.5*inch, height=0.5*inch)
+    if logo is not None:
+        header_data[0][1] = logo
     
     header_table = Table(header_data, colWidths=[3.5*inch, 3.5*inch])
     header_table.setStyle(TableStyle([
@@ -1143,7 +1128,7 @@ def generar_responsiva_equipo(
         style_normal
     ))
     elements.append(Paragraph("<font size='7' color='gray'>(Nombre)</font>", 
-                             ParagraphStyle('SmallCenter', alignment=TA_CENTER, fontSize=7, textColor=colors.gray)))
+                             _estilo('SmallCenter', alignment=TA_CENTER, fontSize=7, textColor=colors.gray)))
     elements.append(Spacer(1, 0.1*inch))
     
     # RFC y No. Empleado en una línea
@@ -1273,9 +1258,9 @@ def generar_responsiva_equipo(
 estara bajo su custodia y resguardo. Siendo responsabilidad del que suscribe cualquier daño físico, robo o perdida. 
 El costo que se genere, por compostura o por recuperacion del mismo, debera ser pagado al valor actual del equipo."""
     
-    style_legal = ParagraphStyle(
+    style_legal = _estilo(
         'Legal',
-        parent=styles['Normal'],
+        padre='Normal',
         fontSize=9,
         fontName='Helvetica',
         alignment=TA_CENTER,
@@ -1317,10 +1302,10 @@ El costo que se genere, por compostura o por recuperacion del mismo, debera ser
     # ========================================
     # PIE DE PÁGINA
     # ========================================
-    elements.append(Paragraph("_" * 95, ParagraphStyle('FooterLine', alignment=TA_CENTER, fontSize=6)))
+    elements.append(Paragraph("_" * 95, _estilo('FooterLine', alignment=TA_CENTER, fontSize=6)))
     elements.append(Paragraph(
         "<font size='7'>Daniel Huacuja No 32 Col. Magisterial Vista Bella Tlalnepantla de Baz, Estado de Mexico C.P 54050. Tels.: 5359-4488 y 1663-0359</font>",
-        ParagraphStyle('FooterAddress', alignment=TA_CENTER, fontSize=7)
+        _estilo('FooterAddress', alignment=TA_CENTER, fontSize=7)
     ))
     
     doc.build(elements)
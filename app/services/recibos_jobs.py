@@ -0,0 +1,542 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+# ===========================================
+# CARGA MASIVA DE RECIBOS POR JOBS
+# ===========================================
+# Una carga de cientos de recibos ya no es una sola petición de 20 minutos:
+#   1. POST /api/recibos/jobs registra los nombres de archivo; se validan y se
+#      descartan de inmediato los inválidos y los recibos que ya existen.
+#   2. El cliente sube cada archivo con PUT /jobs/{id}/archivos/{nombre}, en
+#      paralelo y reintentando sólo los que fallen (peticiones cortas).
+#   3. Workers en segundo plano suben cada archivo a Storage, insertan el
+#      registro y encolan la notificación.
+#   4. GET /jobs/{id} reporta el progreso por archivo.
+#
+# El estado vive en SQLite (RECIBOS_JOBS_DB) y los archivos recibidos en
+# RECIBOS_JOBS_DIR, así que varios workers de uvicorn comparten los jobs. Un
+# archivo que lleva más de RECIBOS_JOBS_LEASE segundos en "procesando" se da
+# por abandonado (proceso caído) y otro worker lo retoma; uno que arranca no
+# le quita el archivo a un proceso vivo. GET /jobs lista las cargas abiertas
+# del usuario para que la página las retome tras recargarse.
+#
+# Estados por archivo: esperando -> recibido -> procesando -> completado | error
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    creado_por TEXT,
+    creado REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archivos (
+    job_id TEXT NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    nombre TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    datos TEXT,
+    error TEXT,
+    actualizado REAL NOT NULL,
+    PRIMARY KEY (job_id, nombre)
+);
+CREATE INDEX IF NOT EXISTS idx_archivos_estado ON archivos (estado, actualizado);
+"""
+
+ESTADOS_ACTIVOS = ("esperando", "recibido", "procesando")
+INTERVALO = 2.0  # Segundos entre revisiones sin trabajo
+DIAS_RETENCION = 7  # Jobs más antiguos se eliminan al arrancar
+CAMPOS_EMPLEADO = ("id", "nombre", "apellidos", "email", "numero_empleado")  # Lo que se guarda de cada empleado en el job
+EMPLEADOS_POR_CONSULTA = 100  # ids por filtro in_ al buscar recibos existentes (largo de la URL)
+PAGINA_EXISTENTES = 500  # Bajo max-rows de PostgREST (1000)
+
+
+def empleados_por_numero(empleados: List[dict]) -> Dict[str, dict]:
+    """Diccionario numero_empleado -> empleado para identificar los archivos"""
+    return {
+        emp['numero_empleado'].strip(): {campo: emp.get(campo) for campo in CAMPOS_EMPLEADO}
+        for emp in empleados
+        if emp.get('numero_empleado')
+    }
+
+
+def interpretar_nombre_recibo(nombre_archivo: str, empleados: Dict[str, dict]) -> dict:
+    """
+    Identifica empleado y período a partir del nombre del archivo
+    (RE_3107_Quincenal_2026_1_356_753.pdf). Lanza ValueError con el mensaje
+    para el usuario si el nombre no es válido.
+    """
+    # Validar que sea PDF
+    if not nombre_archivo.lower().endswith('.pdf'):
+        raise ValueError("No es un archivo PDF")
+
+    nombre_sin_extension = nombre_archivo.rsplit('.', 1)[0]
+    partes = nombre_sin_extension.split('_')
+
+    if len(partes) < 6:
+        raise ValueError("Formato de nombre inválido. Se esperan al menos 6 partes separadas por '_'")
+
+    # Extraer datos del nombre
+    try:
+        anio = int(partes[3])  # Posición 4: año
+        numero_quincena = int(partes[4])  # Posición 5: número de quincena (1-24)
+    except ValueError as ve:
+        raise ValueError(f"Error al parsear nombre: {str(ve)}")
+    numero_empleado = partes[5]  # Posición 6: número de empleado
+
+    # Calcular mes y período a partir del número de quincena
+    # Quincena 1 = 1ra de Enero, Quincena 2 = 2da de Enero
+    # Quincena 3 = 1ra de Febrero, etc.
+    mes = ((numero_quincena - 1) // 2) + 1
+    es_primera_quincena = (numero_quincena % 2) == 1
+    periodo = "1ra Quincena" if es_primera_quincena else "2da Quincena"
+
+    # Validar mes
+    if mes < 1 or mes > 12:
+        raise ValueError(f"Número de quincena inválido: {numero_quincena}. Debe estar entre 1 y 24")
+
+    # Buscar empleado por número
+    empleado = empleados.get(numero_empleado)
+    if not empleado:
+        raise ValueError(f"No se encontró empleado con número: {numero_empleado}")
+
+    periodo_limpio = periodo.replace(' ', '_').replace('ª', 'a')
+    return {
+        "empleado": empleado,
+        "numero_empleado": numero_empleado,
+        "periodo": periodo,
+        "mes": mes,
+        "anio": anio,
+        "llave": (empleado['id'], periodo, mes, anio),
+        "storage_path": f"{empleado['id']}/{anio}/{mes:02d}_{periodo_limpio}.pdf",
+    }
+
+
+def recibos_existentes(admin_client, pendientes: List[dict]) -> set:
+    """
+    Llaves (empleado, periodo, mes, año) ya registradas. Se consulta por cada
+    (año, mes) de la carga sólo a sus empleados, en grupos de
+    EMPLEADOS_POR_CONSULTA y paginando por id hasta una página incompleta:
+    PostgREST recorta en max-rows y un recibo existente que faltara aquí se
+    sobrescribiría en Storage.
+    """
+    por_periodo: Dict[Tuple[int, int], set] = {}
+    for p in pendientes:
+        por_periodo.setdefault((p["anio"], p["mes"]), set()).add(p["empleado"]["id"])
+
+    existentes = set()
+    for (anio, mes), ids in sorted(por_periodo.items()):
+        ids = sorted(ids)
+        for inicio in range(0, len(ids), EMPLEADOS_POR_CONSULTA):
+            ultimo = None
+            while True:
+                query = admin_client.table("recibos_nomina").select(
+                    "id, empleado_id, periodo, mes, anio"
+                ).eq("anio", anio).eq("mes", mes).in_("empleado_id", ids[inicio:inicio + EMPLEADOS_POR_CONSULTA])
+                if ultimo is not None:
+                    query = query.gt("id", ultimo)
+                filas = query.order("id").limit(PAGINA_EXISTENTES).execute().data
+                existentes.update((r["empleado_id"], r["periodo"], r["mes"], r["anio"]) for r in filas)
+                if len(filas) < PAGINA_EXISTENTES:
+                    break
+                ultimo = filas[-1]["id"]
+    return existentes
+
+
+def recibo_registrado(admin_client, pendiente: dict) -> bool:
+    """Si ya hay un recibo para el empleado y período del archivo"""
+    result = admin_client.table("recibos_nomina").select("id").eq(
+        "empleado_id", pendiente["empleado"]["id"]
+    ).eq("periodo", pendiente["periodo"]).eq("mes", pendiente["mes"]).eq("anio", pendiente["anio"]).limit(1).execute()
+    return bool(result.data)
+
+
+def subir_pdf_recibo(admin_client, pendiente: dict, archivo: BinaryIO) -> str:
+    """
+    Sube el PDF de un recibo sin sobrescribir. Si ya hay un objeto en la ruta
+    se revisa la base: con recibo registrado es un duplicado (ValueError) y el
+    PDF existente no se toca; sin registro es un archivo huérfano de una carga
+    que falló al insertar y se reemplaza. Bloqueante: llamar en un hilo.
+    """
+    from app.services.almacenamiento import subir_archivo, ArchivoExistente
+
+    try:
+        return subir_archivo("recibos", pendiente["storage_path"], archivo, "application/pdf")
+    except ArchivoExistente:
+        if recibo_registrado(admin_client, pendiente):
+            raise ValueError(mensaje_existente(pendiente))
+        print(f"[RECIBOS] Reemplazando archivo huérfano {pendiente['storage_path']}")
+        return subir_archivo("recibos", pendiente["storage_path"], archivo, "application/pdf", True)
+
+
+def mensaje_existente(pendiente: dict) -> str:
+    empleado = pendiente["empleado"]
+    return f"Ya existe recibo para {empleado['nombre']} {empleado['apellidos']} - {pendiente['periodo']} {pendiente['mes']}/{pendiente['anio']}"
+
+
+# -------------------------------------------
+# Almacén de jobs (SQLite)
+# -------------------------------------------
+
+_conexion: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+_workers: List[asyncio.Task] = []
+_hay_trabajo: Optional[asyncio.Event] = None
+_activa = False
+
+
+def _db() -> sqlite3.Connection:
+    global _conexion
+    if _conexion is None:
+        directorio = os.path.dirname(settings.recibos_jobs_db)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        _conexion = sqlite3.connect(settings.recibos_jobs_db, timeout=30, check_same_thread=False, isolation_level=None)
+        _conexion.row_factory = sqlite3.Row
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        _conexion.execute("PRAGMA foreign_keys=ON")
+        _conexion.executescript(ESQUEMA)
+    return _conexion
+
+
+def _ruta_archivo(job_id: str, nombre: str) -> str:
+    return os.path.join(settings.recibos_jobs_dir, job_id, os.path.basename(nombre))
+
+
+def _serializar(pendiente: dict) -> str:
+    datos = {k: v for k, v in pendiente.items() if k != "llave"}
+    return json.dumps(datos, ensure_ascii=False)
+
+
+def crear_job(nombres: List[str], empleados: Dict[str, dict], admin_client, creado_por: str) -> str:
+    """Registra un job; los archivos inválidos o ya existentes quedan en error desde el inicio"""
+    job_id = uuid.uuid4().hex
+    ahora = time.time()
+    filas = []
+    validos = []
+    vistos = set()
+
+    for nombre in nombres:
+        if nombre in vistos:
+            continue
+        vistos.add(nombre)
+        try:
+            pendiente = interpretar_nombre_recibo(nombre, empleados)
+        except ValueError as ve:
+            filas.append((job_id, nombre, "error", None, str(ve), ahora))
+            continue
+        validos.append((nombre, pendiente))
+
+    existentes = recibos_existentes(admin_client, [p for _, p in validos])
+    llaves = set()
+    for nombre, pendiente in validos:
+        if pendiente["llave"] in existentes:
+            filas.append((job_id, nombre, "error", None, mensaje_existente(pendiente), ahora))
+        elif pendiente["llave"] in llaves:
+            empleado = pendiente["empleado"]
+            filas.append((job_id, nombre, "error", None,
+                          f"Archivo repetido en la carga para {empleado['nombre']} {empleado['apellidos']} - {pendiente['periodo']} {pendiente['mes']}/{pendiente['anio']}",
+                          ahora))
+        else:
+            llaves.add(pendiente["llave"])
+            filas.append((job_id, nombre, "esperando", _serializar(pendiente), None, ahora))
+
+    with _db_lock:
+        db = _db()
+        db.execute("BEGIN")
+        db.execute("INSERT INTO jobs (id, creado_por, creado) VALUES (?, ?, ?)", (job_id, creado_por, ahora))
+        db.executemany(
+            "INSERT INTO archivos (job_id, nombre, estado, datos, error, actualizado) VALUES (?, ?, ?, ?, ?, ?)",
+            filas
+        )
+        db.execute("COMMIT")
+
+    os.makedirs(os.path.join(settings.recibos_jobs_dir, job_id), exist_ok=True)
+    return job_id
+
+
+def recibir_archivo(job_id: str, nombre: str, archivo: BinaryIO) -> Optional[dict]:
+    """
+    Guarda en disco un archivo del job (por bloques) y lo deja listo para
+    procesarse. Regresa el estado resultante del archivo ({"estado", "error"}),
+    o None si el archivo no es del job. Un archivo que falló al procesarse se
+    puede volver a subir; uno inválido, completado o en proceso no.
+    """
+    with _db_lock:
+        fila = _db().execute(
+            "SELECT estado, datos, error FROM archivos WHERE job_id = ? AND nombre = ?", (job_id, nombre)
+        ).fetchone()
+    if fila is None:
+        return None
+    if fila["datos"] is None or fila["estado"] not in ("esperando", "recibido", "error"):
+        return {"estado": fila["estado"], "error": fila["error"]}
+
+    destino = _ruta_archivo(job_id, nombre)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    archivo.seek(0)
+    with open(temporal, "wb") as f:
+        shutil.copyfileobj(archivo, f, settings.almacenamiento_bloque_kb * 1024)
+    os.replace(temporal, destino)
+
+    with _db_lock:
+        actualizado = _db().execute(
+            "UPDATE archivos SET estado = 'recibido', error = NULL, actualizado = ? "
+            "WHERE job_id = ? AND nombre = ? AND estado IN ('esperando', 'recibido', 'error')",
+            (time.time(), job_id, nombre)
+        ).rowcount
+    if not actualizado:
+        # Otro proceso lo tomó mientras se copiaba
+        return {"estado": "procesando", "error": None}
+    return {"estado": "recibido", "error": None}
+
+
+def progreso_job(job_id: str) -> Optional[dict]:
+    """Estado del job y de cada archivo, o None si no existe"""
+    with _db_lock:
+        db = _db()
+        job = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        filas = db.execute(
+            "SELECT nombre, estado, datos, error, actualizado FROM archivos WHERE job_id = ? ORDER BY nombre",
+            (job_id,)
+        ).fetchall()
+
+    por_estado: Dict[str, int] = {}
+    archivos, exitosos, errores = [], [], []
+    for fila in filas:
+        por_estado[fila["estado"]] = por_estado.get(fila["estado"], 0) + 1
+        archivos.append({
+            "archivo": fila["nombre"],
+            "estado": fila["estado"],
+            "error": fila["error"],
+            # Se puede (volver a) subir con PUT /jobs/{id}/archivos/{nombre}
+            "reintentable": fila["datos"] is not None and fila["estado"] in ("esperando", "error"),
+        })
+        if fila["estado"] == "completado":
+            datos = json.loads(fila["datos"])
+            exitosos.append({
+                "archivo": fila["nombre"],
+                "empleado": f"{datos['empleado']['nombre']} {datos['empleado']['apellidos']}",
+                "numero_empleado": datos["numero_empleado"],
+                "periodo": f"{datos['periodo']} - {datos['mes']}/{datos['anio']}"
+            })
+        elif fila["estado"] == "error":
+            errores.append({"archivo": fila["nombre"], "error": fila["error"]})
+
+    activos = sum(por_estado.get(e, 0) for e in ESTADOS_ACTIVOS)
+    return {
+        "id": job_id,
+        "creado": datetime.fromtimestamp(job["creado"]).isoformat(),
+        "estado": "en_proceso" if activos else "terminado",
+        "total": len(filas),
+        "por_estado": por_estado,
+        "archivos": archivos,
+        # Mismo formato que /subir-masivo
+        "exitosos": exitosos,
+        "errores": errores,
+    }
+
+
+def jobs_abiertos(creado_por: str) -> List[dict]:
+    """Jobs del usuario con archivos sin terminar, del más reciente al más antiguo"""
+    with _db_lock:
+        filas = _db().execute(
+            "SELECT j.id, j.creado, COUNT(*) AS total, "
+            "SUM(a.estado IN ('esperando', 'recibido', 'procesando')) AS abiertos "
+            "FROM jobs j JOIN archivos a ON a.job_id = j.id WHERE j.creado_por = ? "
+            "GROUP BY j.id HAVING abiertos > 0 ORDER BY j.creado DESC",
+            (creado_por,)
+        ).fetchall()
+    return [
+        {
+            "id": f["id"],
+            "creado": datetime.fromtimestamp(f["creado"]).isoformat(),
+            "total": f["total"],
+            "abiertos": f["abiertos"],
+        }
+        for f in filas
+    ]
+
+
+# -------------------------------------------
+# Workers
+# -------------------------------------------
+
+def _tomar_siguiente() -> Optional[sqlite3.Row]:
+    """
+    Reclama el siguiente archivo recibido, o uno "procesando" cuyo plazo
+    venció (seguro entre procesos con BEGIN IMMEDIATE)
+    """
+    ahora = time.time()
+    with _db_lock:
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            fila = db.execute(
+                "SELECT j.creado_por, a.* FROM archivos a JOIN jobs j ON j.id = a.job_id "
+                "WHERE a.estado = 'recibido' OR (a.estado = 'procesando' AND a.actualizado < ?) "
+                "ORDER BY a.actualizado LIMIT 1",
+                (ahora - settings.recibos_jobs_lease,)
+            ).fetchone()
+            if fila is not None:
+                if fila["estado"] == "procesando":
+                    print(f"[RECIBOS JOBS] {fila['nombre']} quedó a medias, se vuelve a procesar")
+                db.execute(
+                    "UPDATE archivos SET estado = 'procesando', actualizado = ? WHERE job_id = ? AND nombre = ?",
+                    (ahora, fila["job_id"], fila["nombre"])
+                )
+            db.execute("COMMIT")
+            return fila
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+
+def _procesar(fila: sqlite3.Row):
+    """Sube el archivo a Storage, guarda el registro y encola la notificación"""
+    from app.database import get_admin_client
+    from app.services.cola_correos import encolar_correo
+
+    admin_client = get_admin_client()
+    datos = json.loads(fila["datos"])
+    empleado = datos["empleado"]
+
+    # Puede haberse registrado por otra vía después de crear el job
+    existente = admin_client.table("recibos_nomina").select("archivo_nombre").eq(
+        "empleado_id", empleado["id"]
+    ).eq("periodo", datos["periodo"]).eq("mes", datos["mes"]).eq("anio", datos["anio"]).limit(1).execute()
+    if existente.data:
+        if fila["estado"] == "procesando" and existente.data[0]["archivo_nombre"] == fila["nombre"]:
+            # Un intento anterior de este mismo archivo se interrumpió después
+            # de guardarlo: ya quedó registrado (su notificación no se repite)
+            return
+        raise ValueError(mensaje_existente(datos))
+
+    ruta = _ruta_archivo(fila["job_id"], fila["nombre"])
+    with open(ruta, "rb") as f:
+        archivo_url = subir_pdf_recibo(admin_client, datos, f)
+
+    result = admin_client.table("recibos_nomina").insert({
+        "empleado_id": empleado["id"],
+        "periodo": datos["periodo"],
+        "mes": datos["mes"],
+        "anio": datos["anio"],
+        "archivo_url": archivo_url,
+        "archivo_nombre": fila["nombre"],
+        "subido_por": fila["creado_por"],
+        "notas": f"Carga masiva - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+    }).execute()
+    if not result.data:
+        raise ValueError("Error al guardar en base de datos")
+
+    try:
+        encolar_correo(
+            "recibo_nomina",
+            empleado=empleado,
+            periodo=datos["periodo"],
+            mes=datos["mes"],
+            anio=datos["anio"]
+        )
+    except Exception as email_error:
+        print(f"[WARNING] No se pudo encolar notificación a {empleado.get('email')}: {str(email_error)}")
+
+
+def _terminar(fila: sqlite3.Row, error: Optional[str]):
+    with _db_lock:
+        _db().execute(
+            "UPDATE archivos SET estado = ?, error = ?, actualizado = ? WHERE job_id = ? AND nombre = ?",
+            ("error" if error else "completado", error, time.time(), fila["job_id"], fila["nombre"])
+        )
+    try:
+        os.remove(_ruta_archivo(fila["job_id"], fila["nombre"]))
+    except OSError:
+        pass
+
+
+async def _worker():
+    while _activa:
+        try:
+            _hay_trabajo.clear()
+            fila = await asyncio.to_thread(_tomar_siguiente)
+
+            if fila is None:
+                try:
+                    await asyncio.wait_for(_hay_trabajo.wait(), timeout=INTERVALO)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await asyncio.to_thread(_procesar, fila)
+                error = None
+            except Exception as e:
+                print(f"[RECIBOS JOBS] Error procesando {fila['nombre']}: {e}")
+                error = str(e)
+            await asyncio.to_thread(_terminar, fila, error)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[RECIBOS JOBS] Error en worker: {e}")
+            await asyncio.sleep(INTERVALO)
+
+
+def avisar_workers():
+    """Despierta a los workers (llamar desde el event loop tras recibir un archivo)"""
+    if _hay_trabajo is not None:
+        _hay_trabajo.set()
+
+
+def _purgar_antiguos():
+    limite = time.time() - DIAS_RETENCION * 86400
+    with _db_lock:
+        db = _db()
+        antiguos = [f["id"] for f in db.execute("SELECT id FROM jobs WHERE creado < ?", (limite,))]
+        db.execute("DELETE FROM jobs WHERE creado < ?", (limite,))
+    for job_id in antiguos:
+        shutil.rmtree(os.path.join(settings.recibos_jobs_dir, job_id), ignore_errors=True)
+
+
+def iniciar_recibos_jobs():
+    """
+    Arranca los workers. Llamar desde el lifespan. Los archivos interrumpidos
+    no se tocan aquí: los retoma _tomar_siguiente cuando vence su plazo.
+    """
+    global _hay_trabajo, _activa
+
+    if _workers:
+        return
+
+    _purgar_antiguos()
+    _hay_trabajo = asyncio.Event()
+    _activa = True
+    for _ in range(settings.recibos_jobs_workers):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def detener_recibos_jobs():
+    """Detiene los workers; lo recibido se procesa en el siguiente arranque"""
+    global _conexion, _hay_trabajo, _activa
+
+    _activa = False
+    for tarea in _workers:
+        tarea.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _hay_trabajo = None
+
+    with _db_lock:
+        if _conexion is not None:
+            _conexion.close()
+            _conexion = None
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Iterable, List, Optional
+
+from app.config import get_settings
+from app.services.invalidaciones import suscribir
+
+settings = get_settings()
+
+
+# ===========================================
+# CACHÉ DE PDFs GENERADOS
+# ===========================================
+# La clave incluye un hash del contenido (actividades + datos del empleado), así
+# que un PDF en caché nunca queda desactualizado: si cambian los datos cambia la
+# clave. La firma entra por firma_url, que lleva ?v=<sha de la imagen> desde
+# /api/empleados/subir-firma: la ruta en Storage no cambia pero la clave sí.
+# Invalidar al guardar actividades o al publicarse "empleados:<id>" (en todos
+# los workers) sólo libera espacio de inmediato. En disco eso recorre y borra
+# carpetas: los routers lo llaman con run_in_threadpool y el bus (que aplica
+# en el event loop) lo deja en un hilo aparte.
+#
+# Backend configurable con REPORTES_CACHE_BACKEND:
+#   "memoria" - LRU en el proceso (por defecto)
+#   "disco"   - archivos en REPORTES_CACHE_DIR, compartidos entre workers
+#   "ninguno" - sin caché
+
+RECORRIDO_DISCO = 300  # Segundos entre recorridos del directorio (tamaño real con varios workers)
+
+# Campos del empleado que aparecen en los reportes
+CAMPOS_EMPLEADO = (
+    "id", "nombre", "apellidos", "nombre_completo", "proyecto", "cliente",
+    "numero_empleado", "puesto", "supervisor", "firma_url",
+)
+
+
+def hash_contenido(empleado: dict, actividades: List[dict]) -> str:
+    """Hash estable de los datos que determinan el contenido del PDF"""
+    datos = {
+        "empleado": {campo: empleado.get(campo) for campo in CAMPOS_EMPLEADO},
+        "actividades": actividades,
+    }
+    serializado = json.dumps(datos, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+def periodo_mensual(anio: int, mes: int) -> str:
+    return f"{anio}-{mes:02d}"
+
+
+def periodo_semanal(lunes: date) -> str:
+    return lunes.isoformat()
+
+
+class _CacheMemoria:
+    """LRU en memoria con presupuesto de bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._datos: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: tuple) -> Optional[bytes]:
+        with self._lock:
+            pdf = self._datos.get(clave)
+            if pdf is not None:
+                self._datos.move_to_end(clave)
+            return pdf
+
+    def guardar(self, clave: tuple, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior)
+            self._datos[clave] = pdf
+            self.bytes += len(pdf)
+            while self.bytes > self.max_bytes:
+                _, desalojado = self._datos.popitem(last=False)
+                self.bytes -= len(desalojado)
+
+    def invalidar(self, tipo: Optional[str], empleado_id: str, periodo: Optional[str]) -> int:
+        with self._lock:
+            claves = [
+                c for c in self._datos
+                if c[1] == empleado_id and tipo in (None, c[0]) and periodo in (None, c[2])
+            ]
+            for clave in claves:
+                self.bytes -= len(self._datos.pop(clave))
+            return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.bytes = 0
+
+    def estadisticas(self) -> dict:
+        return {"entradas": len(self._datos), "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+
+class _CacheDisco:
+    """
+    Archivos en {dir}/{tipo}/{empleado}/{periodo}/{hash}.pdf, desalojo por
+    antigüedad de uso. El tamaño total se lleva en memoria y el directorio
+    sólo se recorre al arrancar, cuando la cuenta pasa del límite y cada
+    RECORRIDO_DISCO segundos: la cuenta no ve lo que escriben otros workers y
+    el recorrido periódico acota cuánto puede pasarse el total.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self.bytes = sum(tamano for _, tamano, _ in self._archivos())
+        self._recorrido = time.monotonic()
+
+    def _ruta(self, clave: tuple) -> str:
+        tipo, empleado_id, periodo, hash_ = clave
+        return os.path.join(self.directorio, tipo, str(empleado_id), periodo, f"{hash_}.pdf")
+
+    def _archivos(self) -> List[tuple]:
+        archivos = []
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if not nombre.endswith(".pdf"):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    info = os.stat(ruta)
+                except OSError:
+                    continue
+                archivos.append((info.st_mtime, info.st_size, ruta))
+        return archivos
+
+    def obtener(self, clave: tuple) -> Optional[bytes]:
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "rb") as f:
+                pdf = f.read()
+            os.utime(ruta)  # Marcar como usado recientemente
+            return pdf
+        except OSError:
+            return None
+
+    def guardar(self, clave: tuple, pdf: bytes):
+        if len(pdf) > self.max_bytes:
+            return
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        try:
+            anterior = os.path.getsize(ruta)
+        except OSError:
+            anterior = 0
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(pdf)
+        os.replace(temporal, ruta)
+        with self._lock:
+            self.bytes += len(pdf) - anterior
+            if self.bytes > self.max_bytes or time.monotonic() - self._recorrido >= RECORRIDO_DISCO:
+                self._desalojar()
+
+    def _desalojar(self):
+        """Recorre el directorio y borra los menos usados hasta quedar bajo el límite (con el lock tomado)"""
+        self._recorrido = time.monotonic()
+        archivos = self._archivos()
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+            except OSError:
+                pass
+        self.bytes = total
+
+    def invalidar(self, tipo: Optional[str], empleado_id: str, periodo: Optional[str]) -> int:
+        if tipo is None:
+            tipos = [t for t in os.listdir(self.directorio) if os.path.isdir(os.path.join(self.directorio, t))]
+        else:
+            tipos = [tipo]
+
+        eliminados = 0
+        for t in tipos:
+            carpeta = os.path.join(self.directorio, t, str(empleado_id))
+            if periodo is not None:
+                carpeta = os.path.join(carpeta, periodo)
+            if not os.path.isdir(carpeta):
+                continue
+            liberados = 0
+            for raiz, _, nombres in os.walk(carpeta):
+                for nombre in nombres:
+                    if nombre.endswith(".pdf"):
+                        eliminados += 1
+                        try:
+                            liberados += os.path.getsize(os.path.join(raiz, nombre))
+                        except OSError:
+                            pass
+            shutil.rmtree(carpeta, ignore_errors=True)
+            with self._lock:
+                self.bytes = max(0, self.bytes - liberados)
+        return eliminados
+
+    def limpiar(self):
+        with self._lock:
+            shutil.rmtree(self.directorio, ignore_errors=True)
+            os.makedirs(self.directorio, exist_ok=True)
+            self.bytes = 0
+
+    def estadisticas(self) -> dict:
+        archivos = self._archivos()
+        return {
+            "entradas": len(archivos),
+            "bytes": sum(tamano for _, tamano, _ in archivos),
+            "max_bytes": self.max_bytes,
+        }
+
+
+def _crear_backend():
+    max_bytes = settings.reportes_cache_mb * 1024 * 1024
+    if settings.reportes_cache_backend == "disco":
+        return _CacheDisco(settings.reportes_cache_dir, max_bytes)
+    if settings.reportes_cache_backend == "memoria":
+        return _CacheMemoria(max_bytes)
+    return None
+
+
+_backend = _crear_backend()
+_estadisticas = {"aciertos": 0, "fallos": 0, "invalidados": 0}
+
+# Un solo hilo para las invalidaciones que llegan por el bus: no bloquean el
+# event loop y no compiten entre sí por las mismas carpetas
+_hilo_invalidaciones: Optional[ThreadPoolExecutor] = None
+
+
+def clave_reporte(tipo: str, empleado: dict, periodo: str, actividades: List[dict]) -> tuple:
+    """Clave (tipo, empleado, periodo, hash del contenido)"""
+    return (tipo, str(empleado.get("id")), periodo, hash_contenido(empleado, actividades))
+
+
+def obtener_reporte(clave: tuple) -> Optional[bytes]:
+    """PDF en caché para la clave, o None"""
+    if _backend is None:
+        return None
+    pdf = _backend.obtener(clave)
+    _estadisticas["aciertos" if pdf is not None else "fallos"] += 1
+    return pdf
+
+
+def guardar_reporte(clave: tuple, pdf: bytes):
+    """Guarda el PDF (en disco puede desalojar: llamar con run_in_threadpool)"""
+    if _backend is None:
+        return
+    try:
+        _backend.guardar(clave, pdf)
+    except Exception as e:
+        print(f"[REPORTES CACHE] Error guardando PDF: {e}")
+
+
+def invalidar_reportes(empleado_id: str, fechas: Iterable[date]):
+    """
+    Descarta los reportes mensuales y semanales que incluyen esas fechas.
+    Es bloqueante con el backend en disco: llamar con run_in_threadpool.
+    """
+    if _backend is None:
+        return
+
+    periodos = set()
+    for fecha in fechas:
+        periodos.add(("mensual", periodo_mensual(fecha.year, fecha.month)))
+        periodos.add(("semanal", periodo_semanal(fecha - timedelta(days=fecha.weekday()))))
+
+    for tipo, periodo in periodos:
+        _estadisticas["invalidados"] += _backend.invalidar(tipo, str(empleado_id), periodo)
+
+
+def invalidar_reportes_empleado(empleado_id: Optional[str]):
+    """
+    Descarta todos los reportes de un empleado (p. ej. al cambiar su firma).
+    Sin empleado (resincronización del bus) no se borra nada: la clave por
+    contenido ya evita servir reportes desactualizados.
+    """
+    if _backend is not None and empleado_id:
+        _estadisticas["invalidados"] += _backend.invalidar(None, str(empleado_id), None)
+
+
+def _invalidar_por_bus(empleado_id: Optional[str]):
+    """Manejador del bus: corre en el event loop, así que el disco va a otro hilo"""
+    global _hilo_invalidaciones
+
+    if not isinstance(_backend, _CacheDisco):
+        invalidar_reportes_empleado(empleado_id)
+        return
+    if not empleado_id:
+        return
+    if _hilo_invalidaciones is None:
+        _hilo_invalidaciones = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reportes-cache")
+    _hilo_invalidaciones.submit(_invalidar_registrando, empleado_id)
+
+
+def _invalidar_registrando(empleado_id: str):
+    try:
+        invalidar_reportes_empleado(empleado_id)
+    except Exception as e:
+        print(f"[REPORTES CACHE] Error invalidando reportes de {empleado_id}: {e}")
+
+
+suscribir("empleados", _invalidar_por_bus)
+
+
+def limpiar_reportes():
+    if _backend is not None:
+        _backend.limpiar()
+
+
+def estadisticas_reportes() -> dict:
+    """Uso de la caché de reportes"""
+    return {
+        "backend": settings.reportes_cache_backend,
+        **_estadisticas,
+        **(_backend.estadisticas() if _backend is not None else {}),
+    }
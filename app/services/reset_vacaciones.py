@@ -0,0 +1,99 @@
+import time
+from collections import defaultdict
+from typing import List
+
+from postgrest.exceptions import APIError
+
+from app.database import get_admin_client
+
+# ===========================================
+# RESET ANUAL DE VACACIONES
+# ===========================================
+# La ruta normal es la función reset_vacaciones_anuales (sql/reset_vacaciones_anuales.sql):
+# un solo UPDATE en el servidor, en una transacción, con bitácora e idempotente.
+# Si la migración aún no se aplicó se usa un respaldo desde Python que agrupa a
+# los empleados por días resultantes y actualiza por bloques con `in_`, así que
+# son unas cuantas peticiones en lugar de una por empleado (pero no una sola
+# transacción).
+
+DIAS_DEFAULT = 12
+TAMANO_BLOQUE = 500  # ids por UPDATE ... WHERE id IN (...) en el respaldo
+LIMITE_VISTA_PREVIA = 100
+
+
+def reset_vacaciones_anuales(anio: int, dry_run: bool = False, forzar: bool = False, ejecutado_por: str = "scheduler") -> dict:
+    """
+    Reinicia dias_vacaciones de los empleados activos según su puesto.
+    Con dry_run=True sólo regresa cuántos y cuáles cambiarían.
+    """
+    admin_client = get_admin_client()
+
+    try:
+        result = admin_client.rpc("reset_vacaciones_anuales", {
+            "p_anio": anio,
+            "p_dry_run": dry_run,
+            "p_forzar": forzar,
+            "p_ejecutado_por": ejecutado_por,
+        }).execute()
+        return result.data
+    except APIError as e:
+        # PGRST202: la función no existe (migración pendiente)
+        if e.code != "PGRST202":
+            raise
+        print("[VACACIONES] Función reset_vacaciones_anuales no encontrada, usando respaldo por bloques")
+
+    return _reset_por_bloques(admin_client, anio, dry_run)
+
+
+def _reset_por_bloques(admin_client, anio: int, dry_run: bool) -> dict:
+    inicio = time.perf_counter()
+
+    result = admin_client.table("empleados").select(
+        "id, nombre, apellidos, dias_vacaciones, puestos(dias_vacaciones_anuales)"
+    ).eq("activo", True).execute()
+
+    # Agrupar por días resultantes, omitiendo a quien ya tiene el saldo correcto
+    por_dias = defaultdict(list)
+    cambios = []
+    for empleado in result.data:
+        dias_nuevos = (empleado.get("puestos") or {}).get("dias_vacaciones_anuales")
+        if dias_nuevos is None:
+            dias_nuevos = DIAS_DEFAULT
+        if empleado.get("dias_vacaciones") is not None and float(empleado["dias_vacaciones"]) == float(dias_nuevos):
+            continue
+        por_dias[dias_nuevos].append(empleado["id"])
+        cambios.append({
+            "empleado_id": empleado["id"],
+            "nombre": f"{empleado['nombre']} {empleado['apellidos']}",
+            "dias_actuales": empleado.get("dias_vacaciones"),
+            "dias_nuevos": dias_nuevos,
+        })
+
+    if not dry_run:
+        for dias, ids in por_dias.items():
+            for bloque in _bloques(ids, TAMANO_BLOQUE):
+                admin_client.table("empleados").update({"dias_vacaciones": dias}).in_("id", bloque).execute()
+
+    return {
+        "anio": anio,
+        "dry_run": dry_run,
+        "ya_aplicado": False,
+        "empleados_activos": len(result.data),
+        "empleados_actualizados": len(cambios),
+        "duracion_ms": round((time.perf_counter() - inicio) * 1000),
+        "cambios": cambios[:LIMITE_VISTA_PREVIA] if dry_run else [],
+        "respaldo": True,
+    }
+
+
+def _bloques(ids: List[str], tamano: int):
+    for i in range(0, len(ids), tamano):
+        yield ids[i:i + tamano]
+
+
+def historial_resets(limite: int = 20) -> List[dict]:
+    """Últimas ejecuciones registradas en la bitácora"""
+    result = get_admin_client().table("reset_vacaciones_log").select("*").order(
+        "iniciado", desc=True
+    ).limit(limite).execute()
+    return result.data
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import List, Optional
+
+from postgrest.exceptions import APIError
+
+from app.database import get_async_client
+from app.services.invalidaciones import suscribir
+
+# ===========================================
+# MATRIZ SEMANAL DE HORAS
+# ===========================================
+# El pivote empleado x día se calcula en la función matriz_horas_semana
+# (sql/matriz_horas_semanal.sql) y llega en columnas:
+#
+#   {"lunes": "2026-01-05", "dias": ["lunes", ..., "viernes"],
+#    "empleado_ids": [...], "nombres": [...], "apellidos": [...],
+#    "emails": [...], "puestos": [...], "horas": [[8, 8, 0, 0, 0], ...]}
+#
+# Las semanas cerradas (ya pasó el domingo) casi no cambian y se guardan en
+# memoria; una captura o edición tardía publica "matriz_semanal:<lunes>" y esa
+# semana se vuelve a calcular. La semana en curso siempre se consulta. Si la
+# migración no se ha aplicado se arma la misma matriz desde las tablas.
+
+DIAS = ["lunes", "martes", "miercoles", "jueves", "viernes"]
+SEMANAS_EN_CACHE = 26
+
+_semanas: "OrderedDict[str, dict]" = OrderedDict()
+_versiones = {"global": 0}
+
+
+def _descartar(lunes: Optional[str]):
+    _versiones["global"] += 1
+    if lunes:
+        _semanas.pop(lunes, None)
+    else:
+        _semanas.clear()
+
+
+suscribir("matriz_semanal", _descartar)
+# Altas, bajas y cambios de nombre o puesto cambian las filas de la matriz
+suscribir("empleados", lambda _clave: _descartar(None))
+suscribir("catalogos", lambda _clave: _descartar(None))
+
+
+def semana_cerrada(lunes: date) -> bool:
+    return lunes + timedelta(days=7) <= date.today()
+
+
+async def matriz_horas_semana(lunes: date) -> dict:
+    """Matriz columnar de horas de la semana que inicia en `lunes`"""
+    clave = lunes.isoformat()
+    matriz = _semanas.get(clave)
+    if matriz is not None:
+        _semanas.move_to_end(clave)
+        return matriz
+
+    version = _versiones["global"]
+    db = get_async_client()
+    try:
+        result = await db.rpc("matriz_horas_semana", {"p_lunes": clave}).execute()
+        matriz = result.data
+    except APIError as e:
+        # PGRST202: la función no existe (migración pendiente)
+        if e.code != "PGRST202":
+            raise
+        matriz = await _matriz_desde_tablas(db, lunes)
+
+    if semana_cerrada(lunes) and _versiones["global"] == version:
+        _semanas[clave] = matriz
+        while len(_semanas) > SEMANAS_EN_CACHE:
+            _semanas.popitem(last=False)
+    return matriz
+
+
+async def _matriz_desde_tablas(db, lunes: date) -> dict:
+    """Respaldo: misma matriz con dos consultas y el pivote en Python"""
+    empleados_result = await db.table("empleados").select(
+        "id, nombre, apellidos, email, puesto:puestos(nombre)"
+    ).eq("activo", True).order("apellidos").order("nombre").execute()
+
+    actividades_result = await db.table("actividades").select(
+        "empleado_id, fecha, horas_trabajadas"
+    ).gte("fecha", lunes.isoformat()).lte("fecha", (lunes + timedelta(days=4)).isoformat()).execute()
+
+    # Las fechas ISO de la semana se comparan como texto, sin convertir cada fila
+    indice_dia = {(lunes + timedelta(days=i)).isoformat(): i for i in range(5)}
+    horas_por_empleado = {}
+    for act in actividades_result.data:
+        dia = indice_dia.get(str(act["fecha"])[:10])
+        if dia is None:
+            continue
+        horas = horas_por_empleado.setdefault(act["empleado_id"], [0.0] * 5)
+        horas[dia] += float(act.get("horas_trabajadas") or 0)
+
+    empleados = empleados_result.data
+    return {
+        "lunes": lunes.isoformat(),
+        "dias": DIAS,
+        "empleado_ids": [e["id"] for e in empleados],
+        "nombres": [e["nombre"] for e in empleados],
+        "apellidos": [e["apellidos"] for e in empleados],
+        "emails": [e.get("email") for e in empleados],
+        "puestos": [(e.get("puesto") or {}).get("nombre", "") for e in empleados],
+        "horas": [horas_por_empleado.get(e["id"], [0.0] * 5) for e in empleados],
+    }
+
+
+def matriz_a_filas(matriz: dict) -> List[dict]:
+    """Formato anterior del seguimiento: una fila por empleado con "dias" como diccionario"""
+    return [
+        {
+            "empleado_id": empleado_id,
+            "nombre": matriz["nombres"][i],
+            "apellidos": matriz["apellidos"][i],
+            "puesto": matriz["puestos"][i],
+            "dias": dict(zip(DIAS, matriz["horas"][i])),
+        }
+        for i, empleado_id in enumerate(matriz["empleado_ids"])
+    ]
+
+
+def empleados_incompletos(matriz: dict) -> List[dict]:
+    """Empleados con menos de 5 días con horas capturadas (para recordatorios)"""
+    return [
+        {
+            "id": empleado_id,
+            "nombre": matriz["nombres"][i],
+            "apellidos": matriz["apellidos"][i],
+            "email": matriz["emails"][i],
+        }
+        for i, empleado_id in enumerate(matriz["empleado_ids"])
+        if sum(1 for horas in matriz["horas"][i] if horas > 0) < 5
+    ]
@@ -0,0 +1,70 @@
+"""
+Costo de autenticar una petición: verificación completa del JWT contra la
+caché de tokens ya verificados (app/auth.py).
+
+    python benchmarks/auth_tokens.py [iteraciones]
+
+Sólo usa la configuración (.env o variables de entorno); no se conecta a
+Supabase.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from app import auth  # noqa: E402
+from app.config import get_settings  # noqa: E402
+
+settings = get_settings()
+
+
+def medir(nombre: str, funcion, iteraciones: int) -> float:
+    funcion()  # Calentar
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        funcion()
+    por_llamada = (time.perf_counter() - inicio) / iteraciones * 1_000_000
+    print(f"  {nombre:<42} {por_llamada:8.2f} µs/petición")
+    return por_llamada
+
+
+def main():
+    iteraciones = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    token = auth.create_access_token({
+        "sub": "00000000-0000-0000-0000-000000000001",
+        "email": "empleado@empresa.mx",
+        "es_admin": False,
+        "rol": "usuario",
+        "tiene_puesto": True,
+    })
+
+    print(f"Autenticación de una petición ({iteraciones} iteraciones)")
+
+    tamano = settings.auth_cache_tokens
+    settings.auth_cache_tokens = 0
+    antes = medir("sin caché (jwt.decode + TokenData)", lambda: auth.decode_token(token), iteraciones)
+
+    settings.auth_cache_tokens = tamano or 4096
+    despues = medir("con caché (sha256 + LRU)", lambda: auth.decode_token(token), iteraciones)
+
+    # Peor caso: más usuarios que entradas recorridos en ciclo (siempre falla, no crece)
+    tokens = [
+        auth.create_access_token({"sub": f"usuario-{i}", "email": f"u{i}@empresa.mx"})
+        for i in range(settings.auth_cache_tokens * 2)
+    ]
+    posicion = iter(range(10 ** 9))
+    medir(
+        f"peor caso: {len(tokens)} tokens en ciclo (LRU {settings.auth_cache_tokens})",
+        lambda: auth.decode_token(tokens[next(posicion) % len(tokens)]),
+        iteraciones
+    )
+
+    print(f"\nMejora: {antes / despues:.0f}x  ({antes - despues:.1f} µs menos por petición)")
+    print(f"Caché: {auth.estadisticas_tokens()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Costo de serializar las respuestas JSON más grandes: JSONResponse de
+FastAPI (jsonable_encoder + json.dumps) contra RespuestaJSON (orjson,
+app/respuestas.py).
+
+    python benchmarks/serializacion.py [repeticiones]
+
+Los datos son sintéticos con la forma real de cada endpoint; no se conecta a
+Supabase.
+"""
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.models import Actividad  # noqa: E402
+from app.respuestas import RespuestaJSON  # noqa: E402
+
+EMPLEADOS = 200
+json_fastapi = JSONResponse(None).render
+json_orjson = RespuestaJSON(None).render
+
+
+def medir(nombre: str, funcion, repeticiones: int) -> float:
+    """Mejor tiempo de `repeticiones` corridas, en ms"""
+    funcion()  # Calentar
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    print(f"    {nombre:<44} {mejor * 1000:9.2f} ms")
+    return mejor
+
+
+def comparar(titulo: str, casos: list, repeticiones: int):
+    print(f"\n  {titulo}")
+    resultados = [(nombre, funcion(), medir(nombre, funcion, repeticiones)) for nombre, funcion in casos]
+    base_salida, base_tiempo = resultados[0][1], resultados[0][2]
+    print(f"    {'tamaño':<44} {len(base_salida) / 1024:9.0f} KB")
+    for nombre, salida, tiempo in resultados[1:]:
+        igual = "misma salida" if salida == base_salida else "SALIDA DISTINTA"
+        print(f"    → {nombre}: {base_tiempo / tiempo:.1f}x ({igual})")
+
+
+# ===========================================
+# DATOS
+# ===========================================
+
+def empleado_ids() -> List[str]:
+    return [str(uuid.UUID(int=i + 1)) for i in range(EMPLEADOS)]
+
+
+def actividades_mes() -> list:
+    """GET /api/actividades/mes: un mes de actividades de todos los empleados"""
+    creado = datetime(2024, 3, 1, 18, 0, tzinfo=timezone.utc)
+    filas = []
+    for empleado_id in empleado_ids():
+        for dia in range(22):
+            filas.append({
+                "id": str(uuid.uuid4()),
+                "empleado_id": empleado_id,
+                "fecha": (date(2024, 3, 1) + timedelta(days=dia)).isoformat(),
+                "dia_semana": "LMXJVSD"[dia % 7],
+                "hora_entrada": "09:00:00",
+                "hora_salida": "18:30:00",
+                "descripcion": "Levantamiento de inventario en sitio y captura de reportes",
+                "ubicacion_id": dia % 12,
+                "horas_trabajadas": Decimal("8.50"),
+                "created_at": creado,
+            })
+    return filas
+
+
+def resumen_semanal() -> list:
+    """GET /api/actividades/admin/resumen-semanal (Decimal en total_horas)"""
+    return [
+        {
+            "empleado_id": empleado_id,
+            "nombre_completo": f"Empleado {i} Apellido Apellido",
+            "proyecto": "Proyecto Norte",
+            "semana_inicio": date(2024, 3, 4),
+            "semana_fin": date(2024, 3, 10),
+            "total_horas": Decimal("42.75"),
+            "dias_trabajados": 5,
+        }
+        for i, empleado_id in enumerate(empleado_ids())
+    ] * 25
+
+
+def analitica_tres_anios() -> dict:
+    """GET /api/analitica/horas: 3 años por semana y empleado, en columnas"""
+    semanas = [(date(2022, 1, 3) + timedelta(weeks=s)).isoformat() for s in range(156)]
+    ids = empleado_ids()
+    n = len(semanas) * len(ids)
+    return {
+        "periodo": "semana",
+        "dimension": "empleado",
+        "desde": semanas[0],
+        "hasta": semanas[-1],
+        "periodos": [s for s in semanas for _ in ids],
+        "claves": ids * len(semanas),
+        "nombres": [f"Empleado {i} Apellido" for i in range(EMPLEADOS)] * len(semanas),
+        "horas": [round(37.5 + (i % 17) * 0.25, 2) for i in range(n)],
+        "dias": [5] * n,
+        "empleados": [1] * n,
+    }
+
+
+def seguimiento_filas() -> list:
+    """GET /api/actividades/admin/seguimiento-semanal (formato filas)"""
+    return [
+        {
+            "empleado_id": empleado_id,
+            "nombre": f"Empleado {i}",
+            "apellidos": "Apellido Apellido",
+            "puesto": "Técnico de campo",
+            "dias": {"L": 8.5, "M": 8.0, "X": 9.0, "J": 8.5, "V": 7.0},
+        }
+        for i, empleado_id in enumerate(empleado_ids())
+    ] * 5
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print(f"Serialización de respuestas grandes (mejor de {repeticiones})")
+
+    # Con response_model FastAPI ya valida y convierte con pydantic; lo que
+    # cambia es quién escribe el JSON
+    actividades = TypeAdapter(List[Actividad])
+    validadas = actividades.validate_python(actividades_mes())
+    comparar(f"actividades del mes, response_model ({len(validadas)} renglones)", [
+        ("pydantic + json.dumps (JSONResponse)", lambda: json_fastapi(actividades.dump_python(validadas, mode="json"))),
+        ("pydantic + orjson (RespuestaJSON)", lambda: json_orjson(actividades.dump_python(validadas, mode="json"))),
+        # FastAPI reciente escribe directo con pydantic; RutaJSON conserva esa vía
+        ("pydantic dump_json (FastAPI reciente)", lambda: actividades.dump_json(validadas)),
+    ], repeticiones)
+
+    # Dicts sin response_model: jsonable_encoder recorre todo antes de escribir
+    resumen = resumen_semanal()
+    comparar(f"resumen semanal con Decimal, dicts ({len(resumen)} renglones)", [
+        ("jsonable_encoder + json.dumps", lambda: json_fastapi(jsonable_encoder(resumen))),
+        ("jsonable_encoder + orjson", lambda: json_orjson(jsonable_encoder(resumen))),
+        ("RespuestaJSON directo", lambda: json_orjson(resumen)),
+    ], repeticiones)
+
+    analitica = analitica_tres_anios()
+    comparar(f"analítica 3 años por semana, columnas ({len(analitica['horas'])} posiciones)", [
+        ("jsonable_encoder + json.dumps", lambda: json_fastapi(jsonable_encoder(analitica))),
+        ("RespuestaJSON directo", lambda: json_orjson(analitica)),
+    ], repeticiones)
+
+    filas = seguimiento_filas()
+    comparar(f"seguimiento semanal, filas ({len(filas)} empleados)", [
+        ("jsonable_encoder + json.dumps", lambda: json_fastapi(jsonable_encoder(filas))),
+        ("RespuestaJSON directo", lambda: json_orjson(filas)),
+    ], repeticiones)
+
+
+if __name__ == "__main__":
+    main()
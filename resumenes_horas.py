@@ -0,0 +1,63 @@
+"""
+Mantenimiento de los resúmenes de horas (sql/resumenes_horas.sql)
+Ejecutar:
+    python resumenes_horas.py verificar [--desde AAAA-MM-DD]
+    python resumenes_horas.py reconstruir [--desde AAAA-MM-DD]
+"""
+import argparse
+import json
+import os
+from dotenv import load_dotenv
+from supabase import create_client
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # Las funciones sólo las ejecuta service_role
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    print("❌ Necesitas SUPABASE_URL y SUPABASE_SERVICE_KEY en tu .env")
+    exit(1)
+
+supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+
+def verificar(desde: str = None) -> bool:
+    """Compara los resúmenes contra un cálculo desde actividades"""
+    resultado = supabase.rpc("verificar_resumenes_horas", {"p_desde": desde}).execute().data
+
+    print(f"Semanas revisadas: {resultado['semanas']}")
+    print(f"Meses revisados:   {resultado['meses']}")
+    if resultado["consistente"]:
+        print("✅ Los resúmenes coinciden con actividades")
+        return True
+
+    print(f"❌ {resultado['diferencias']} diferencia(s):")
+    for d in resultado["detalle"]:
+        print(
+            f"   {d['tipo']:8} {d['periodo']}  {d['empleado_id']}  "
+            f"horas {d['horas_guardadas']} (esperadas {d['horas_esperadas']})  "
+            f"días {d['dias_guardados']} (esperados {d['dias_esperados']})"
+        )
+    if resultado["diferencias"] > len(resultado["detalle"]):
+        print(f"   ... y {resultado['diferencias'] - len(resultado['detalle'])} más")
+    print("\nPara corregirlas: python resumenes_horas.py reconstruir")
+    return False
+
+
+def reconstruir(desde: str = None):
+    """Recalcula los resúmenes desde actividades (todo o desde una fecha)"""
+    resultado = supabase.rpc("reconstruir_resumenes_horas", {"p_desde": desde}).execute().data
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    print("✅ Resúmenes reconstruidos")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resúmenes de horas semanales y mensuales")
+    parser.add_argument("accion", choices=["verificar", "reconstruir"])
+    parser.add_argument("--desde", help="Sólo periodos a partir de esta fecha (AAAA-MM-DD)")
+    args = parser.parse_args()
+
+    if args.accion == "verificar":
+        exit(0 if verificar(args.desde) else 1)
+    reconstruir(args.desde)
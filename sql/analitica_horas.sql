@@ -0,0 +1,122 @@
+-- =============================================
+-- ANALÍTICA DE HORAS (VARIOS AÑOS)
+-- =============================================
+-- Usada por /api/analitica (ver app/services/analitica.py). Requiere
+-- sql/resumenes_horas.sql.
+--
+-- analitica_horas agrega las horas por periodo (semana o mes) y por empleado,
+-- proyecto o ubicación en el servidor y regresa el resultado en columnas (un
+-- arreglo por campo, una posición por par periodo-clave). Empleado y proyecto
+-- salen de las tablas de resumen, así que varios años cuestan lo mismo que
+-- leer esos renglones; ubicación se agrega sobre actividades por rango de
+-- fecha. Los periodos son completos: p_desde se lleva al inicio de su semana
+-- o mes y p_hasta al final del suyo.
+--
+-- El proyecto es el actual del empleado (empleados.proyecto_id); actividades
+-- no guarda el proyecto vigente al momento de la captura.
+
+-- Paginación por llave (fecha, id) de /api/analitica/actividades
+CREATE INDEX IF NOT EXISTS idx_actividades_fecha_id
+    ON actividades(fecha, id);
+
+CREATE OR REPLACE FUNCTION analitica_horas(
+    p_desde DATE,
+    p_hasta DATE,
+    p_periodo TEXT DEFAULT 'semana',
+    p_dimension TEXT DEFAULT 'empleado'
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    v_desde DATE;
+    v_hasta DATE;
+    v_resultado JSONB;
+BEGIN
+    IF p_periodo NOT IN ('semana', 'mes') THEN
+        RAISE EXCEPTION 'p_periodo debe ser semana o mes' USING ERRCODE = '22023';
+    END IF;
+    IF p_dimension NOT IN ('empleado', 'proyecto', 'ubicacion') THEN
+        RAISE EXCEPTION 'p_dimension debe ser empleado, proyecto o ubicacion' USING ERRCODE = '22023';
+    END IF;
+
+    IF p_periodo = 'semana' THEN
+        v_desde := date_trunc('week', p_desde)::date;
+        v_hasta := date_trunc('week', p_hasta)::date + 6;
+    ELSE
+        v_desde := date_trunc('month', p_desde)::date;
+        v_hasta := (date_trunc('month', p_hasta) + INTERVAL '1 month - 1 day')::date;
+    END IF;
+
+    WITH por_empleado AS (
+        -- Resumen por empleado del periodo pedido (lectura por llave primaria)
+        SELECT r.semana_inicio AS periodo, r.empleado_id, r.total_horas, r.dias_trabajados
+        FROM resumen_horas_semanal r
+        WHERE p_periodo = 'semana'
+          AND p_dimension <> 'ubicacion'
+          AND r.semana_inicio BETWEEN v_desde AND v_hasta
+        UNION ALL
+        SELECT make_date(r.anio, r.mes, 1), r.empleado_id, r.total_horas, r.dias_trabajados
+        FROM resumen_horas_mensual r
+        WHERE p_periodo = 'mes'
+          AND p_dimension <> 'ubicacion'
+          AND (r.anio, r.mes) BETWEEN (EXTRACT(YEAR FROM v_desde)::integer, EXTRACT(MONTH FROM v_desde)::integer)
+                                  AND (EXTRACT(YEAR FROM v_hasta)::integer, EXTRACT(MONTH FROM v_hasta)::integer)
+    ),
+    agregado AS (
+        SELECT
+            pe.periodo,
+            CASE WHEN p_dimension = 'proyecto' THEN e.proyecto_id::text ELSE pe.empleado_id::text END AS clave,
+            SUM(pe.total_horas) AS horas,
+            SUM(pe.dias_trabajados)::integer AS dias,
+            COUNT(DISTINCT pe.empleado_id)::integer AS empleados
+        FROM por_empleado pe
+        JOIN empleados e ON e.id = pe.empleado_id
+        GROUP BY 1, 2
+        UNION ALL
+        SELECT
+            date_trunc(CASE WHEN p_periodo = 'mes' THEN 'month' ELSE 'week' END, a.fecha)::date,
+            a.ubicacion_id::text,
+            SUM(COALESCE(a.horas_trabajadas, 0)),
+            COUNT(*) FILTER (WHERE COALESCE(a.horas_trabajadas, 0) > 0)::integer,
+            COUNT(DISTINCT a.empleado_id)::integer
+        FROM actividades a
+        WHERE p_dimension = 'ubicacion'
+          AND a.fecha BETWEEN v_desde AND v_hasta
+        GROUP BY 1, 2
+    ),
+    con_nombre AS (
+        SELECT
+            g.*,
+            CASE p_dimension
+                WHEN 'empleado' THEN (SELECT em.nombre || ' ' || em.apellidos FROM empleados em WHERE em.id::text = g.clave)
+                WHEN 'proyecto' THEN (SELECT p.nombre FROM proyectos p WHERE p.id::text = g.clave)
+                ELSE (SELECT u.codigo || ' - ' || u.nombre FROM ubicaciones u WHERE u.id::text = g.clave)
+            END AS nombre
+        FROM agregado g
+    )
+    SELECT jsonb_build_object(
+        'periodo', p_periodo,
+        'dimension', p_dimension,
+        'desde', v_desde,
+        'hasta', v_hasta,
+        'periodos', COALESCE(jsonb_agg(c.periodo ORDER BY c.periodo, c.nombre, c.clave), '[]'::jsonb),
+        'claves', COALESCE(jsonb_agg(c.clave ORDER BY c.periodo, c.nombre, c.clave), '[]'::jsonb),
+        'nombres', COALESCE(jsonb_agg(c.nombre ORDER BY c.periodo, c.nombre, c.clave), '[]'::jsonb),
+        'horas', COALESCE(jsonb_agg(c.horas::float8 ORDER BY c.periodo, c.nombre, c.clave), '[]'::jsonb),
+        'dias', COALESCE(jsonb_agg(c.dias ORDER BY c.periodo, c.nombre, c.clave), '[]'::jsonb),
+        'empleados', COALESCE(jsonb_agg(c.empleados ORDER BY c.periodo, c.nombre, c.clave), '[]'::jsonb)
+    )
+    INTO v_resultado
+    FROM con_nombre c;
+
+    RETURN v_resultado;
+END;
+$$;
+
+COMMENT ON FUNCTION analitica_horas IS 'Horas por periodo (semana/mes) y empleado, proyecto o ubicación, en formato columnar';
+
+-- Lee las tablas de resumen (RLS sin políticas): sólo el backend con service role
+REVOKE EXECUTE ON FUNCTION analitica_horas(DATE, DATE, TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION analitica_horas(DATE, DATE, TEXT, TEXT) TO service_role;
@@ -0,0 +1,62 @@
+-- =============================================
+-- MATRIZ SEMANAL DE HORAS (SEGUIMIENTO)
+-- =============================================
+-- Usada por /api/actividades/admin/seguimiento-semanal y por el envío manual de
+-- recordatorios (ver app/services/seguimiento_semanal.py). El pivote por
+-- empleado y día se hace en el servidor y se regresa en columnas: un arreglo
+-- por campo, en el mismo orden de empleados, y las horas como arreglo de 5
+-- valores (lunes a viernes). Así la respuesta no crece con las actividades de
+-- la semana sino sólo con el número de empleados.
+
+-- Rango por fecha de la semana, con las horas incluidas en el índice
+CREATE INDEX IF NOT EXISTS idx_actividades_fecha_empleado
+    ON actividades(fecha, empleado_id) INCLUDE (horas_trabajadas);
+
+CREATE OR REPLACE FUNCTION matriz_horas_semana(p_lunes DATE)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    WITH horas AS (
+        SELECT
+            a.empleado_id,
+            a.fecha - p_lunes AS dia,
+            SUM(COALESCE(a.horas_trabajadas, 0)) AS horas
+        FROM actividades a
+        WHERE a.fecha BETWEEN p_lunes AND p_lunes + 4
+        GROUP BY a.empleado_id, a.fecha
+    ),
+    filas AS (
+        SELECT
+            e.id,
+            e.nombre,
+            e.apellidos,
+            e.email,
+            COALESCE(p.nombre, '') AS puesto,
+            ARRAY[
+                COALESCE(MAX(h.horas) FILTER (WHERE h.dia = 0), 0),
+                COALESCE(MAX(h.horas) FILTER (WHERE h.dia = 1), 0),
+                COALESCE(MAX(h.horas) FILTER (WHERE h.dia = 2), 0),
+                COALESCE(MAX(h.horas) FILTER (WHERE h.dia = 3), 0),
+                COALESCE(MAX(h.horas) FILTER (WHERE h.dia = 4), 0)
+            ]::FLOAT8[] AS horas
+        FROM empleados e
+        LEFT JOIN puestos p ON p.id = e.puesto_id
+        LEFT JOIN horas h ON h.empleado_id = e.id
+        WHERE e.activo = true
+        GROUP BY e.id, e.nombre, e.apellidos, e.email, p.nombre
+    )
+    SELECT jsonb_build_object(
+        'lunes', p_lunes,
+        'dias', jsonb_build_array('lunes', 'martes', 'miercoles', 'jueves', 'viernes'),
+        'empleado_ids', COALESCE(jsonb_agg(f.id ORDER BY f.apellidos, f.nombre, f.id), '[]'::jsonb),
+        'nombres', COALESCE(jsonb_agg(f.nombre ORDER BY f.apellidos, f.nombre, f.id), '[]'::jsonb),
+        'apellidos', COALESCE(jsonb_agg(f.apellidos ORDER BY f.apellidos, f.nombre, f.id), '[]'::jsonb),
+        'emails', COALESCE(jsonb_agg(f.email ORDER BY f.apellidos, f.nombre, f.id), '[]'::jsonb),
+        'puestos', COALESCE(jsonb_agg(f.puesto ORDER BY f.apellidos, f.nombre, f.id), '[]'::jsonb),
+        'horas', COALESCE(jsonb_agg(to_jsonb(f.horas) ORDER BY f.apellidos, f.nombre, f.id), '[]'::jsonb)
+    )
+    FROM filas f;
+$$;
+
+COMMENT ON FUNCTION matriz_horas_semana IS 'Horas por empleado activo y día (lunes a viernes) de una semana, en formato columnar';
@@ -0,0 +1,125 @@
+-- =============================================
+-- RESET ANUAL DE VACACIONES (EN UNA SOLA OPERACIÓN)
+-- =============================================
+-- Reemplaza el ciclo de un UPDATE por empleado del scheduler. La función
+-- calcula los días desde puestos.dias_vacaciones_anuales en el servidor y
+-- actualiza a todos los empleados activos en un solo UPDATE, dentro de la
+-- transacción de la llamada RPC.
+--
+-- Idempotente: cada año se aplica una sola vez (bitácora) y sólo se tocan
+-- los empleados cuyo saldo cambia. Con p_dry_run = true no modifica nada y
+-- regresa una vista previa de los cambios.
+
+-- 1. Bitácora de ejecuciones
+CREATE TABLE IF NOT EXISTS reset_vacaciones_log (
+    id BIGSERIAL PRIMARY KEY,
+    anio INTEGER NOT NULL,
+    dry_run BOOLEAN NOT NULL DEFAULT false,
+    empleados_activos INTEGER NOT NULL DEFAULT 0,
+    empleados_actualizados INTEGER NOT NULL DEFAULT 0,
+    ejecutado_por VARCHAR(100),
+    iniciado TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    terminado TIMESTAMP WITH TIME ZONE
+);
+
+-- Un solo reset aplicado por año
+CREATE UNIQUE INDEX IF NOT EXISTS idx_reset_vacaciones_log_anio
+    ON reset_vacaciones_log(anio) WHERE NOT dry_run;
+
+ALTER TABLE reset_vacaciones_log ENABLE ROW LEVEL SECURITY;
+
+-- 2. Función de reset
+CREATE OR REPLACE FUNCTION reset_vacaciones_anuales(
+    p_anio INTEGER,
+    p_dry_run BOOLEAN DEFAULT false,
+    p_forzar BOOLEAN DEFAULT false,
+    p_ejecutado_por VARCHAR DEFAULT 'scheduler'
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_inicio TIMESTAMP WITH TIME ZONE := clock_timestamp();
+    v_activos INTEGER;
+    v_actualizados INTEGER;
+    v_previa JSONB;
+    v_anterior reset_vacaciones_log%ROWTYPE;
+BEGIN
+    -- Evitar dos resets simultáneos (scheduler en varios workers)
+    PERFORM pg_advisory_xact_lock(hashtext('reset_vacaciones_anuales'));
+
+    SELECT * INTO v_anterior FROM reset_vacaciones_log
+    WHERE anio = p_anio AND NOT dry_run;
+
+    IF FOUND AND NOT p_dry_run AND NOT p_forzar THEN
+        RETURN jsonb_build_object(
+            'anio', p_anio,
+            'dry_run', false,
+            'ya_aplicado', true,
+            'aplicado_en', v_anterior.terminado,
+            'empleados_actualizados', v_anterior.empleados_actualizados
+        );
+    END IF;
+
+    SELECT COUNT(*) INTO v_activos FROM empleados WHERE activo = true;
+
+    IF p_dry_run THEN
+        SELECT COUNT(*), COALESCE(jsonb_agg(c) FILTER (WHERE c.n <= 100), '[]'::jsonb)
+        INTO v_actualizados, v_previa
+        FROM (
+            SELECT
+                e.id AS empleado_id,
+                e.nombre || ' ' || e.apellidos AS nombre,
+                e.dias_vacaciones AS dias_actuales,
+                COALESCE(p.dias_vacaciones_anuales, 12) AS dias_nuevos,
+                ROW_NUMBER() OVER (ORDER BY e.apellidos, e.nombre) AS n
+            FROM empleados e
+            LEFT JOIN puestos p ON p.id = e.puesto_id
+            WHERE e.activo = true
+              AND e.dias_vacaciones IS DISTINCT FROM COALESCE(p.dias_vacaciones_anuales, 12)
+        ) c;
+    ELSE
+        UPDATE empleados e
+        SET dias_vacaciones = COALESCE(
+            (SELECT p.dias_vacaciones_anuales FROM puestos p WHERE p.id = e.puesto_id),
+            12
+        )
+        WHERE e.activo = true
+          AND e.dias_vacaciones IS DISTINCT FROM COALESCE(
+              (SELECT p.dias_vacaciones_anuales FROM puestos p WHERE p.id = e.puesto_id),
+              12
+          );
+        GET DIAGNOSTICS v_actualizados = ROW_COUNT;
+    END IF;
+
+    IF p_dry_run THEN
+        INSERT INTO reset_vacaciones_log (anio, dry_run, empleados_activos, empleados_actualizados, ejecutado_por, iniciado, terminado)
+        VALUES (p_anio, true, v_activos, v_actualizados, p_ejecutado_por, v_inicio, clock_timestamp());
+    ELSE
+        INSERT INTO reset_vacaciones_log (anio, dry_run, empleados_activos, empleados_actualizados, ejecutado_por, iniciado, terminado)
+        VALUES (p_anio, false, v_activos, v_actualizados, p_ejecutado_por, v_inicio, clock_timestamp())
+        ON CONFLICT (anio) WHERE NOT dry_run DO UPDATE SET
+            empleados_activos = EXCLUDED.empleados_activos,
+            empleados_actualizados = EXCLUDED.empleados_actualizados,
+            ejecutado_por = EXCLUDED.ejecutado_por,
+            iniciado = EXCLUDED.iniciado,
+            terminado = EXCLUDED.terminado;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'anio', p_anio,
+        'dry_run', p_dry_run,
+        'ya_aplicado', false,
+        'empleados_activos', v_activos,
+        'empleados_actualizados', v_actualizados,
+        'duracion_ms', ROUND(EXTRACT(EPOCH FROM clock_timestamp() - v_inicio) * 1000),
+        'cambios', COALESCE(v_previa, '[]'::jsonb)
+    );
+END;
+$$;
+
+-- Sólo el backend (service role) puede ejecutarla
+REVOKE EXECUTE ON FUNCTION reset_vacaciones_anuales(INTEGER, BOOLEAN, BOOLEAN, VARCHAR) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION reset_vacaciones_anuales(INTEGER, BOOLEAN, BOOLEAN, VARCHAR) TO service_role;
+
+COMMENT ON FUNCTION reset_vacaciones_anuales IS 'Reinicia dias_vacaciones de los empleados activos según su puesto, una vez por año (p_dry_run para vista previa)';
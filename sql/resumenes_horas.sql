@@ -0,0 +1,328 @@
+-- =============================================
+-- RESÚMENES DE HORAS INCREMENTALES (SEMANAL Y MENSUAL)
+-- =============================================
+-- v_resumen_semanal y v_resumen_mensual vuelven a agregar toda la tabla
+-- actividades en cada consulta. Aquí los totales se guardan por empleado y
+-- periodo y un trigger sobre actividades los ajusta con la diferencia de cada
+-- alta, edición o baja (guardar_semana, actualizar_actividad, capturas por
+-- fuera de la app...). Consultar un mes o una semana es leer su rango de la
+-- llave primaria, sin importar cuántos años de actividades haya.
+--
+-- dias_trabajados cuenta los días con horas > 0 (una actividad por empleado
+-- y fecha). Los renglones sin actividades se eliminan.
+--
+-- Mantenimiento (ver resumenes_horas.py):
+--   SELECT verificar_resumenes_horas();              -- compara contra actividades
+--   SELECT reconstruir_resumenes_horas();            -- recalcula todo
+--   SELECT reconstruir_resumenes_horas('2026-01-01'); -- sólo desde una fecha
+
+-- 1. Tablas de resumen
+CREATE TABLE IF NOT EXISTS resumen_horas_semanal (
+    semana_inicio DATE NOT NULL,
+    empleado_id UUID NOT NULL REFERENCES empleados(id) ON DELETE CASCADE,
+    total_horas NUMERIC NOT NULL DEFAULT 0,
+    dias_trabajados INTEGER NOT NULL DEFAULT 0,
+    actividades INTEGER NOT NULL DEFAULT 0,
+    actualizado TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (semana_inicio, empleado_id)
+);
+
+CREATE TABLE IF NOT EXISTS resumen_horas_mensual (
+    anio INTEGER NOT NULL,
+    mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+    empleado_id UUID NOT NULL REFERENCES empleados(id) ON DELETE CASCADE,
+    total_horas NUMERIC NOT NULL DEFAULT 0,
+    dias_trabajados INTEGER NOT NULL DEFAULT 0,
+    actividades INTEGER NOT NULL DEFAULT 0,
+    actualizado TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (anio, mes, empleado_id)
+);
+
+-- Sólo se leen a través de las vistas; nadie escribe directo
+ALTER TABLE resumen_horas_semanal ENABLE ROW LEVEL SECURITY;
+ALTER TABLE resumen_horas_mensual ENABLE ROW LEVEL SECURITY;
+
+-- 2. Aplicar la diferencia de una actividad (p_signo = 1 alta, -1 baja)
+CREATE OR REPLACE FUNCTION _aplicar_resumen_horas(
+    p_empleado_id UUID,
+    p_fecha DATE,
+    p_horas NUMERIC,
+    p_signo INTEGER
+)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_lunes DATE := date_trunc('week', p_fecha)::date;
+    v_anio INTEGER := EXTRACT(YEAR FROM p_fecha)::integer;
+    v_mes INTEGER := EXTRACT(MONTH FROM p_fecha)::integer;
+    v_horas NUMERIC := p_signo * COALESCE(p_horas, 0);
+    v_dias INTEGER := CASE WHEN COALESCE(p_horas, 0) > 0 THEN p_signo ELSE 0 END;
+BEGIN
+    -- El UPDATE de ON CONFLICT bloquea el renglón: dos capturas simultáneas
+    -- del mismo empleado se suman en orden, sin perder ninguna
+    INSERT INTO resumen_horas_semanal AS r (semana_inicio, empleado_id, total_horas, dias_trabajados, actividades)
+    VALUES (v_lunes, p_empleado_id, v_horas, v_dias, p_signo)
+    ON CONFLICT (semana_inicio, empleado_id) DO UPDATE SET
+        total_horas = r.total_horas + EXCLUDED.total_horas,
+        dias_trabajados = r.dias_trabajados + EXCLUDED.dias_trabajados,
+        actividades = r.actividades + EXCLUDED.actividades,
+        actualizado = NOW();
+
+    INSERT INTO resumen_horas_mensual AS r (anio, mes, empleado_id, total_horas, dias_trabajados, actividades)
+    VALUES (v_anio, v_mes, p_empleado_id, v_horas, v_dias, p_signo)
+    ON CONFLICT (anio, mes, empleado_id) DO UPDATE SET
+        total_horas = r.total_horas + EXCLUDED.total_horas,
+        dias_trabajados = r.dias_trabajados + EXCLUDED.dias_trabajados,
+        actividades = r.actividades + EXCLUDED.actividades,
+        actualizado = NOW();
+
+    IF p_signo < 0 THEN
+        DELETE FROM resumen_horas_semanal
+        WHERE semana_inicio = v_lunes AND empleado_id = p_empleado_id AND actividades <= 0;
+        DELETE FROM resumen_horas_mensual
+        WHERE anio = v_anio AND mes = v_mes AND empleado_id = p_empleado_id AND actividades <= 0;
+    END IF;
+END;
+$$;
+
+-- 3. Trigger sobre actividades
+CREATE OR REPLACE FUNCTION trg_actividades_resumen_horas()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.empleado_id IS NOT DISTINCT FROM NEW.empleado_id
+       AND OLD.fecha IS NOT DISTINCT FROM NEW.fecha
+       AND OLD.horas_trabajadas IS NOT DISTINCT FROM NEW.horas_trabajadas THEN
+        -- Cambió sólo la descripción u otro campo: los totales no se mueven
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM _aplicar_resumen_horas(OLD.empleado_id, OLD.fecha, OLD.horas_trabajadas, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM _aplicar_resumen_horas(NEW.empleado_id, NEW.fecha, NEW.horas_trabajadas, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS actividades_resumen_horas ON actividades;
+CREATE TRIGGER actividades_resumen_horas
+    AFTER INSERT OR UPDATE OR DELETE ON actividades
+    FOR EACH ROW EXECUTE FUNCTION trg_actividades_resumen_horas();
+
+-- Un TRUNCATE de actividades deja los resúmenes vacíos también
+CREATE OR REPLACE FUNCTION trg_actividades_truncate_resumen_horas()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    TRUNCATE resumen_horas_semanal, resumen_horas_mensual;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS actividades_truncate_resumen_horas ON actividades;
+CREATE TRIGGER actividades_truncate_resumen_horas
+    AFTER TRUNCATE ON actividades
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_actividades_truncate_resumen_horas();
+
+-- 4. Reconstrucción (carga inicial o reparación)
+CREATE OR REPLACE FUNCTION reconstruir_resumenes_horas(p_desde DATE DEFAULT NULL)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_inicio TIMESTAMP WITH TIME ZONE := clock_timestamp();
+    -- Se reconstruyen periodos completos: la semana y el mes que contienen p_desde
+    v_lunes DATE := date_trunc('week', COALESCE(p_desde, '-infinity'::date))::date;
+    v_mes DATE := date_trunc('month', COALESCE(p_desde, '-infinity'::date))::date;
+    v_semanas INTEGER;
+    v_meses INTEGER;
+BEGIN
+    -- Las capturas esperan a que termine; las lecturas siguen
+    LOCK TABLE actividades IN SHARE MODE;
+
+    DELETE FROM resumen_horas_semanal WHERE semana_inicio >= v_lunes;
+    DELETE FROM resumen_horas_mensual WHERE make_date(anio, mes, 1) >= v_mes;
+
+    INSERT INTO resumen_horas_semanal (semana_inicio, empleado_id, total_horas, dias_trabajados, actividades)
+    SELECT
+        date_trunc('week', a.fecha)::date,
+        a.empleado_id,
+        SUM(COALESCE(a.horas_trabajadas, 0)),
+        COUNT(*) FILTER (WHERE COALESCE(a.horas_trabajadas, 0) > 0),
+        COUNT(*)
+    FROM actividades a
+    WHERE a.fecha >= v_lunes
+    GROUP BY 1, 2;
+    GET DIAGNOSTICS v_semanas = ROW_COUNT;
+
+    INSERT INTO resumen_horas_mensual (anio, mes, empleado_id, total_horas, dias_trabajados, actividades)
+    SELECT
+        EXTRACT(YEAR FROM a.fecha)::integer,
+        EXTRACT(MONTH FROM a.fecha)::integer,
+        a.empleado_id,
+        SUM(COALESCE(a.horas_trabajadas, 0)),
+        COUNT(*) FILTER (WHERE COALESCE(a.horas_trabajadas, 0) > 0),
+        COUNT(*)
+    FROM actividades a
+    WHERE a.fecha >= v_mes
+    GROUP BY 1, 2, 3;
+    GET DIAGNOSTICS v_meses = ROW_COUNT;
+
+    RETURN jsonb_build_object(
+        'desde', p_desde,
+        'semanas', v_semanas,
+        'meses', v_meses,
+        'duracion_ms', ROUND(EXTRACT(EPOCH FROM clock_timestamp() - v_inicio) * 1000)
+    );
+END;
+$$;
+
+-- 5. Verificación: diferencias entre los resúmenes y un cálculo desde cero
+CREATE OR REPLACE FUNCTION verificar_resumenes_horas(p_desde DATE DEFAULT NULL)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    WITH limites AS (
+        SELECT
+            date_trunc('week', COALESCE(p_desde, '-infinity'::date))::date AS lunes,
+            date_trunc('month', COALESCE(p_desde, '-infinity'::date))::date AS mes
+    ),
+    semanas_esperadas AS (
+        SELECT
+            date_trunc('week', a.fecha)::date AS semana_inicio,
+            a.empleado_id,
+            SUM(COALESCE(a.horas_trabajadas, 0)) AS total_horas,
+            COUNT(*) FILTER (WHERE COALESCE(a.horas_trabajadas, 0) > 0)::integer AS dias_trabajados,
+            COUNT(*)::integer AS actividades
+        FROM actividades a, limites l
+        WHERE a.fecha >= l.lunes
+        GROUP BY 1, 2
+    ),
+    semanas_guardadas AS (
+        SELECT r.semana_inicio, r.empleado_id, r.total_horas, r.dias_trabajados, r.actividades
+        FROM resumen_horas_semanal r, limites l
+        WHERE r.semana_inicio >= l.lunes
+    ),
+    meses_esperados AS (
+        SELECT
+            EXTRACT(YEAR FROM a.fecha)::integer AS anio,
+            EXTRACT(MONTH FROM a.fecha)::integer AS mes,
+            a.empleado_id,
+            SUM(COALESCE(a.horas_trabajadas, 0)) AS total_horas,
+            COUNT(*) FILTER (WHERE COALESCE(a.horas_trabajadas, 0) > 0)::integer AS dias_trabajados,
+            COUNT(*)::integer AS actividades
+        FROM actividades a, limites l
+        WHERE a.fecha >= l.mes
+        GROUP BY 1, 2, 3
+    ),
+    meses_guardados AS (
+        SELECT r.anio, r.mes, r.empleado_id, r.total_horas, r.dias_trabajados, r.actividades
+        FROM resumen_horas_mensual r, limites l
+        WHERE make_date(r.anio, r.mes, 1) >= l.mes
+    ),
+    diferencias AS (
+        SELECT
+            'semanal' AS tipo,
+            COALESCE(e.semana_inicio, g.semana_inicio)::text AS periodo,
+            COALESCE(e.empleado_id, g.empleado_id) AS empleado_id,
+            e.total_horas AS horas_esperadas,
+            g.total_horas AS horas_guardadas,
+            e.dias_trabajados AS dias_esperados,
+            g.dias_trabajados AS dias_guardados
+        FROM semanas_esperadas e
+        FULL JOIN semanas_guardadas g
+            ON g.semana_inicio = e.semana_inicio AND g.empleado_id = e.empleado_id
+        WHERE (e.total_horas, e.dias_trabajados, e.actividades)
+              IS DISTINCT FROM (g.total_horas, g.dias_trabajados, g.actividades)
+        UNION ALL
+        SELECT
+            'mensual',
+            to_char(make_date(COALESCE(e.anio, g.anio), COALESCE(e.mes, g.mes), 1), 'YYYY-MM'),
+            COALESCE(e.empleado_id, g.empleado_id),
+            e.total_horas,
+            g.total_horas,
+            e.dias_trabajados,
+            g.dias_trabajados
+        FROM meses_esperados e
+        FULL JOIN meses_guardados g
+            ON g.anio = e.anio AND g.mes = e.mes AND g.empleado_id = e.empleado_id
+        WHERE (e.total_horas, e.dias_trabajados, e.actividades)
+              IS DISTINCT FROM (g.total_horas, g.dias_trabajados, g.actividades)
+    )
+    SELECT jsonb_build_object(
+        'desde', p_desde,
+        'semanas', (SELECT COUNT(*) FROM semanas_esperadas),
+        'meses', (SELECT COUNT(*) FROM meses_esperados),
+        'diferencias', (SELECT COUNT(*) FROM diferencias),
+        'consistente', NOT EXISTS (SELECT 1 FROM diferencias),
+        -- Primeras 100 para revisar; reconstruir_resumenes_horas las corrige todas
+        'detalle', COALESCE(
+            (SELECT jsonb_agg(d ORDER BY d.tipo, d.periodo) FROM (SELECT * FROM diferencias LIMIT 100) d),
+            '[]'::jsonb
+        )
+    );
+$$;
+
+-- Sólo el backend (service role) puede reconstruir o verificar
+REVOKE EXECUTE ON FUNCTION _aplicar_resumen_horas(UUID, DATE, NUMERIC, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION reconstruir_resumenes_horas(DATE) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION verificar_resumenes_horas(DATE) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION reconstruir_resumenes_horas(DATE) TO service_role;
+GRANT EXECUTE ON FUNCTION verificar_resumenes_horas(DATE) TO service_role;
+
+-- 6. Vistas con la misma forma que v_resumen_semanal / v_resumen_mensual
+CREATE OR REPLACE VIEW v_resumen_semanal_horas AS
+SELECT
+    r.empleado_id,
+    e.nombre || ' ' || e.apellidos AS nombre_completo,
+    p.nombre AS proyecto,
+    r.semana_inicio,
+    r.semana_inicio + 6 AS semana_fin,
+    r.total_horas,
+    r.dias_trabajados
+FROM resumen_horas_semanal r
+JOIN empleados e ON e.id = r.empleado_id
+LEFT JOIN proyectos p ON p.id = e.proyecto_id;
+
+CREATE OR REPLACE VIEW v_resumen_mensual_horas AS
+SELECT
+    r.empleado_id,
+    e.nombre || ' ' || e.apellidos AS nombre_completo,
+    p.nombre AS proyecto,
+    s.nombre AS supervisor,
+    r.anio,
+    r.mes,
+    (ARRAY['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+           'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'])[r.mes] AS mes_nombre,
+    r.total_horas,
+    r.dias_trabajados
+FROM resumen_horas_mensual r
+JOIN empleados e ON e.id = r.empleado_id
+LEFT JOIN proyectos p ON p.id = e.proyecto_id
+LEFT JOIN supervisores s ON s.id = e.supervisor_id;
+
+COMMENT ON TABLE resumen_horas_semanal IS 'Horas por empleado y semana, mantenidas por trigger desde actividades';
+COMMENT ON TABLE resumen_horas_mensual IS 'Horas por empleado y mes, mantenidas por trigger desde actividades';
+COMMENT ON FUNCTION reconstruir_resumenes_horas IS 'Recalcula los resúmenes de horas desde actividades (todo, o desde p_desde)';
+COMMENT ON FUNCTION verificar_resumenes_horas IS 'Compara los resúmenes de horas contra un cálculo desde actividades';
+
+-- 7. Carga inicial
+SELECT reconstruir_resumenes_horas();
@@ -0,0 +1,67 @@
+-- =============================================
+-- COORDINACIÓN DEL SCHEDULER ENTRE WORKERS
+-- =============================================
+-- Usado con SCHEDULER_COORDINACION=postgres (ver app/services/coordinacion.py).
+-- Sólo el worker que tiene el lease vigente ejecuta las tareas programadas, y
+-- cada ejecución se reclama por (tarea, horario) para que no corra dos veces.
+
+-- 1. Lease del líder
+CREATE TABLE IF NOT EXISTS scheduler_lider (
+    recurso VARCHAR(50) PRIMARY KEY,
+    duenio VARCHAR(200) NOT NULL,
+    expira TIMESTAMP WITH TIME ZONE NOT NULL,
+    actualizado TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE scheduler_lider ENABLE ROW LEVEL SECURITY;
+
+-- Toma el lease si está libre o vencido, o lo renueva si ya es del solicitante.
+-- Regresa true si p_duenio es el líder al terminar.
+CREATE OR REPLACE FUNCTION tomar_liderazgo_scheduler(
+    p_recurso VARCHAR,
+    p_duenio VARCHAR,
+    p_segundos INTEGER DEFAULT 60
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_duenio VARCHAR;
+BEGIN
+    INSERT INTO scheduler_lider (recurso, duenio, expira, actualizado)
+    VALUES (p_recurso, p_duenio, NOW() + make_interval(secs => p_segundos), NOW())
+    ON CONFLICT (recurso) DO UPDATE SET
+        duenio = EXCLUDED.duenio,
+        expira = EXCLUDED.expira,
+        actualizado = EXCLUDED.actualizado
+    WHERE scheduler_lider.duenio = EXCLUDED.duenio
+       OR scheduler_lider.expira < NOW()
+    RETURNING duenio INTO v_duenio;
+
+    RETURN v_duenio IS NOT NULL;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION tomar_liderazgo_scheduler(VARCHAR, VARCHAR, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION tomar_liderazgo_scheduler(VARCHAR, VARCHAR, INTEGER) TO service_role;
+
+-- 2. Bitácora de ejecuciones
+CREATE TABLE IF NOT EXISTS scheduler_ejecuciones (
+    id BIGSERIAL PRIMARY KEY,
+    tarea VARCHAR(100) NOT NULL,
+    programada TIMESTAMP WITH TIME ZONE NOT NULL,
+    duenio VARCHAR(200),
+    iniciada TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    terminada TIMESTAMP WITH TIME ZONE,
+    duracion_ms INTEGER,
+    estado VARCHAR(20) NOT NULL DEFAULT 'ejecutando', -- 'ejecutando', 'ok', 'error'
+    error TEXT,
+    UNIQUE(tarea, programada) -- Una sola ejecución por tarea y horario
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduler_ejecuciones_tarea ON scheduler_ejecuciones(tarea, iniciada DESC);
+
+ALTER TABLE scheduler_ejecuciones ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE scheduler_lider IS 'Lease del worker que ejecuta las tareas programadas';
+COMMENT ON TABLE scheduler_ejecuciones IS 'Bitácora de ejecuciones de tareas programadas (una por tarea y horario)';